@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+
+# Benchmarks for the protocol and transport hot paths
+#
+# All corpora are generated synthetically from the register sets of the
+# protocol library using a fixed seed so runs are reproducible. Every
+# benchmark is executed with a small and a large corpus (the large one can
+# be skipped using --quick) and the best of --repeat runs is reported. The
+# startup group measures import and process start times in fresh interpreters.
+#
+# Results can be stored as baseline (--save) and compared against a baseline
+# (--compare). In case any benchmark is slower (or allocates more) than the
+# baseline by more than --threshold the script exits with status 1.
+
+import argparse
+import json
+import os
+import pty
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import tty
+
+try:
+    import pfeifferpumps
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from pfeifferpumps.pfeifferproto import PfeifferProtocol, SerialProtocolViolation, SerialSimulationDone, SerialProtocolUnknownRegister
+from pfeifferpumps.pfeiffercapture import jsonToCapture
+
+CORPUS_SMALL = 1000
+CORPUS_LARGE = 100000
+REGISTERSETS = { 1 : "TC110", 2 : "MVP015" }
+
+# Corpus generation
+
+def randomPayload(rnd, datatype):
+    digits = "0123456789"
+    printable = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 -."
+    if datatype == 0:
+        return rnd.choice([ "000000", "111111" ])
+    if datatype in ( 1, 2 ):
+        return "".join(rnd.choice(digits) for i in range(6))
+    if datatype == 3:
+        return "{}.{}E-{}".format(rnd.randint(1, 9), rnd.randint(0, 9), rnd.randint(1, 9))
+    if datatype == 4:
+        return "".join(rnd.choice(printable) for i in range(6))
+    if datatype == 6:
+        return rnd.choice([ "0", "1" ])
+    if datatype == 7:
+        return "{:03d}".format(rnd.randint(0, 999))
+    if datatype == 9:
+        return rnd.choice([ "000", "111" ]) + "{:03d}".format(rnd.randint(0, 999))
+    if datatype == 10:
+        return "{:04d}{:02d}".format(rnd.randint(0, 9999), rnd.randint(0, 99))
+    if datatype == 11:
+        return "".join(rnd.choice(printable) for i in range(16))
+    if datatype == 12:
+        return "".join(rnd.choice(printable) for i in range(8))
+    return None
+
+def registerList(proto):
+    regs = [ ]
+    for address, regsetName in REGISTERSETS.items():
+        for param, register in proto.registerSet(regsetName).registers.items():
+            if randomPayload(random.Random(0), register.datatype) is not None:
+                regs.append(( address, param, register.datatype ))
+    return regs
+
+def generateFrames(proto, count, seed = 1, datatype = None, queries = True):
+    # Returns a list of frames. Every second frame is a query in case queries
+    # are enabled so the corpus looks like a polled bus
+    rnd = random.Random(seed)
+    regs = [ reg for reg in registerList(proto) if (datatype is None) or (reg[2] == datatype) ]
+    frames = [ ]
+    while len(frames) < count:
+        address, param, dt = rnd.choice(regs)
+        if queries:
+            frames.append(proto.encodeQuery(address, param))
+            if len(frames) >= count:
+                break
+        frames.append(proto.encodeFrame(address, 1, param, randomPayload(rnd, dt)))
+    return frames
+
+def writeJsonCorpus(proto, frames, filename):
+    regsets = proto.compileAddressMap(REGISTERSETS)
+    timestamp = 1634274000.0
+    with open(filename, "w") as f:
+        for frame in frames:
+            packet = proto.decodeFrame(frame, timestamp)
+            regsets[packet.address].decode(packet)
+            f.write(json.dumps(packet.as_dict()))
+            f.write("\n")
+            timestamp = timestamp + 0.02
+
+# Measurement helpers
+
+def bestOf(repeat, fun):
+    best = None
+    for i in range(repeat):
+        t = time.perf_counter()
+        fun()
+        elapsed = time.perf_counter() - t
+        if (best is None) or (elapsed < best):
+            best = elapsed
+    return best
+
+def retainedPerItem(fun, items):
+    # Number of memory blocks and bytes retained per processed item while all
+    # results are kept alive (measures the footprint of decoded packets)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    results = fun(items)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+    del results
+    return blocks / len(items), size / len(items)
+
+class BenchmarkResults:
+    def __init__(self):
+        self.results = { }
+
+    def add(self, name, value, unit, higherIsBetter = True):
+        self.results[name] = { "value" : value, "unit" : unit, "higherIsBetter" : higherIsBetter }
+        print("{:50s} {:14.1f} {}".format(name, value, unit))
+
+# Benchmarks
+
+def benchProtocol(res, proto, sizes, repeat):
+    regsets = proto.compileAddressMap(REGISTERSETS)
+    for size in sizes:
+        frames = generateFrames(proto, size)
+
+        def decodeRaw(items = frames):
+            return [ proto.decodePacketRaw(frame) for frame in items ]
+        elapsed = bestOf(repeat, decodeRaw)
+        res.add("decodePacketRaw[{}]".format(size), size / elapsed, "frames/s")
+        blocks, size_ = retainedPerItem(decodeRaw, frames)
+        res.add("decodePacketRaw[{}] retained blocks".format(size), blocks, "blocks/frame", False)
+        res.add("decodePacketRaw[{}] retained bytes".format(size), size_, "bytes/frame", False)
+
+        def decodeFrame(items = frames):
+            res_ = [ ]
+            for frame in items:
+                packet = proto.decodeFrame(frame)
+                regsets[packet.address].decode(packet)
+                res_.append(packet)
+            return res_
+        elapsed = bestOf(repeat, decodeFrame)
+        res.add("decodeFrame+decode[{}]".format(size), size / elapsed, "frames/s")
+        blocks, size_ = retainedPerItem(decodeFrame, frames)
+        res.add("decodeFrame+decode[{}] retained blocks".format(size), blocks, "blocks/frame", False)
+
+        # decodePacket per datatype on already framed packets
+        datatypes = sorted(set(reg[2] for reg in registerList(proto)))
+        for datatype in datatypes:
+            dtFrames = generateFrames(proto, size, datatype = datatype, queries = False)
+            packets = [ proto.decodePacketRaw(frame) for frame in dtFrames ]
+            dictionaries = [ proto.registers[REGISTERSETS[packet["address"]]] for packet in packets ]
+
+            def decodePacket():
+                for packet, dictionary in zip(packets, dictionaries):
+                    proto.decodePacket(packet, dictionary)
+            elapsed = bestOf(repeat, decodePacket)
+            res.add("decodePacket[datatype {}][{}]".format(datatype, size), size / elapsed, "frames/s")
+
+        # encodePacket for all datatypes that can be encoded
+        rnd = random.Random(2)
+        requests = [ ]
+        for address, param, datatype in registerList(proto):
+            dictionary = proto.registers[REGISTERSETS[address]]
+            packet = proto.decodePacket(proto.decodePacketRaw(proto.encodeFrame(address, 1, param, randomPayload(rnd, datatype))), dictionary)
+            try:
+                proto.encodePacket(address, 1, param, packet["payload"], dictionary, checkWritable = False)
+            except SerialProtocolViolation:
+                continue
+            requests.append(( address, param, packet["payload"], dictionary ))
+        if len(requests) > 0:
+            requests = [ requests[i % len(requests)] for i in range(size) ]
+
+            def encode():
+                for address, param, value, dictionary in requests:
+                    proto.encodePacket(address, 1, param, value, dictionary, checkWritable = False)
+            elapsed = bestOf(repeat, encode)
+            res.add("encodePacket[{}]".format(size), size / elapsed, "frames/s")
+
+            regsets = proto.compileAddressMap(REGISTERSETS)
+            writes = [ ( address, regsets[address][param], value ) for address, param, value, dictionary in requests ]
+
+            def encodeWrite():
+                for address, register, value in writes:
+                    proto.encodeWriteBytes(address, register, value, checkWritable = False)
+            elapsed = bestOf(repeat, encodeWrite)
+            res.add("encodeWriteBytes[{}]".format(size), size / elapsed, "frames/s")
+
+        # Read requests from the query frame cache
+        queries = [ ( address, param ) for address, param, datatype in registerList(proto) ]
+        queries = [ queries[i % len(queries)] for i in range(size) ]
+
+        def encodeQuery():
+            for address, param in queries:
+                proto.encodeQueryBytes(address, param)
+        elapsed = bestOf(repeat, encodeQuery)
+        res.add("encodeQueryBytes[{}]".format(size), size / elapsed, "frames/s")
+
+def benchFraming(res, proto, sizes, repeat):
+    # Framing of a byte stream written into a pseudo terminal
+    from pfeifferpumps.pfeifferrs485 import PfeifferRS485Serial
+
+    for size in sizes:
+        frames = generateFrames(proto, size)
+        data = "".join(frames).encode("ASCII")
+
+        masterFd, slaveFd = pty.openpty()
+        tty.setraw(slaveFd)
+        try:
+            with PfeifferRS485Serial(os.ttyname(slaveFd), REGISTERSETS) as port:
+                def run():
+                    def writer():
+                        view = memoryview(data)
+                        while len(view) > 0:
+                            written = os.write(masterFd, view[:4096])
+                            view = view[written:]
+                    thread = threading.Thread(target = writer)
+                    thread.start()
+                    for i in range(size):
+                        port.serialReadNextLine()
+                    thread.join()
+                elapsed = bestOf(repeat, run)
+            res.add("serialReadNextLine pty[{}]".format(size), size / elapsed, "frames/s")
+        finally:
+            os.close(masterFd)
+            os.close(slaveFd)
+
+def benchReplay(res, proto, sizes, repeat, tmpdir):
+    from pfeifferpumps.pfeifferrs485 import PfeifferRS485Serial
+
+    for size in sizes:
+        jsonFile = os.path.join(tmpdir, "corpus{}.json".format(size))
+        captureFile = os.path.join(tmpdir, "corpus{}.pfcap".format(size))
+        for name, filename in ( ( "json", jsonFile ), ( "capture", captureFile ) ):
+            def run():
+                with PfeifferRS485Serial(None, REGISTERSETS, simulationfile = filename, rawsimulationdump = False) as port:
+                    while True:
+                        try:
+                            port.nextMessage()
+                        except SerialSimulationDone:
+                            break
+                        except SerialProtocolUnknownRegister:
+                            pass
+            elapsed = bestOf(repeat, run)
+            res.add("replay {}[{}]".format(name, size), size / elapsed, "frames/s")
+
+def benchSniffer(res, proto, sizes, repeat, tmpdir):
+    # End to end sniffer runs on the replayed corpus. Includes interpreter
+    # startup so the large corpus is the relevant figure
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([ p for p in [ os.path.dirname(os.path.dirname(os.path.abspath(pfeifferModulePath()))), env.get("PYTHONPATH") ] if p ])
+    for size in sizes:
+        jsonFile = os.path.join(tmpdir, "corpus{}.json".format(size))
+        logFile = os.path.join(tmpdir, "log.json")
+        captureFile = os.path.join(tmpdir, "log.pfcap")
+        variants = (
+            ( "sniffer", [ ] ),
+            ( "sniffer --logjson", [ "-j", logFile ] ),
+            ( "sniffer --logcapture", [ "-c", captureFile ] )
+        )
+        for name, extraArgs in variants:
+            def run():
+                for f in ( logFile, captureFile ):
+                    if os.path.exists(f):
+                        os.unlink(f)
+                cmd = [ sys.executable, "-m", "pfeifferpumps.pfeiffercli", "-s", jsonFile, "-d", "1:TC110", "-d", "2:MVP015" ] + extraArgs
+                subprocess.run(cmd, stdout = subprocess.DEVNULL, env = env, check = True)
+            elapsed = bestOf(repeat, run)
+            res.add("{}[{}]".format(name, size), size / elapsed, "frames/s")
+
+STARTUP_MODULES = ( "pfeifferpumps.pfeifferproto", "pfeifferpumps.pfeifferrs485", "pfeifferpumps.pfeiffercli", "pfeifferpumps.pfeifferrs485mqtt" )
+
+def benchStartup(res, repeat):
+    # Import time of the entry point modules (as reported by -X importtime,
+    # cumulative for the imported module in a fresh interpreter), the time to
+    # load a register set on first use and the wall clock time of a complete
+    # sniffer invocation that exits right away
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([ p for p in [ os.path.dirname(os.path.dirname(os.path.abspath(pfeifferModulePath()))), env.get("PYTHONPATH") ] if p ])
+
+    def importTime(module):
+        best = None
+        for i in range(repeat):
+            proc = subprocess.run([ sys.executable, "-X", "importtime", "-c", "import {}".format(module) ], stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, env = env, check = True)
+            for line in proc.stderr.decode("UTF-8").splitlines():
+                fields = line.split("|")
+                if (len(fields) == 3) and (fields[2].strip() == module):
+                    cumulative = int(fields[1]) / 1000.0
+                    if (best is None) or (cumulative < best):
+                        best = cumulative
+        return best
+
+    for module in STARTUP_MODULES:
+        res.add("import {}".format(module), importTime(module), "ms", higherIsBetter = False)
+
+    code = "import time; from pfeifferpumps.pfeifferproto import PfeifferProtocol; t = time.perf_counter(); PfeifferProtocol().registerSet('TC110'); print(time.perf_counter() - t)"
+    best = None
+    for i in range(repeat):
+        proc = subprocess.run([ sys.executable, "-c", code ], stdout = subprocess.PIPE, env = env, check = True)
+        elapsed = float(proc.stdout)
+        if (best is None) or (elapsed < best):
+            best = elapsed
+    res.add("first registerSet(TC110)", best * 1000.0, "ms", higherIsBetter = False)
+
+    def run():
+        subprocess.run([ sys.executable, "-m", "pfeifferpumps.pfeiffercli", "--help" ], stdout = subprocess.DEVNULL, env = env, check = True)
+    res.add("sniffer --help", bestOf(repeat, run) * 1000.0, "ms", higherIsBetter = False)
+
+def pfeifferModulePath():
+    import pfeifferpumps.pfeifferproto
+    return pfeifferpumps.pfeifferproto.__file__
+
+# Baseline handling
+
+def compareBaseline(results, baseline, threshold):
+    regressions = [ ]
+    for name, entry in results.items():
+        base = baseline.get(name)
+        if (base is None) or (base["value"] == 0):
+            continue
+        ratio = entry["value"] / base["value"]
+        if entry["higherIsBetter"]:
+            regressed = ratio < 1.0 - threshold
+        else:
+            regressed = ratio > 1.0 + threshold
+        if regressed:
+            regressions.append(( name, base["value"], entry["value"], entry["unit"] ))
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser(description = 'Benchmarks for the pfeifferpumps protocol and transport hot paths')
+    ap.add_argument('--quick', action='store_true', help="Only run the small corpus")
+    ap.add_argument('--repeat', type=int, required=False, default=3, help="Number of runs per benchmark (best is reported)")
+    ap.add_argument('--only', type=str, required=False, default=None, action='append', help="Only run the given group (protocol, framing, replay, sniffer, startup). Can be used multiple times")
+    ap.add_argument('--save', type=str, required=False, default=None, help="Save the results as baseline into the given file")
+    ap.add_argument('--compare', type=str, required=False, default=None, help="Compare the results against the given baseline")
+    ap.add_argument('--threshold', type=float, required=False, default=0.1, help="Relative change that is reported as regression")
+    args = ap.parse_args()
+
+    sizes = [ CORPUS_SMALL ] if args.quick else [ CORPUS_SMALL, CORPUS_LARGE ]
+    groups = args.only if args.only else [ "protocol", "framing", "replay", "sniffer", "startup" ]
+    proto = PfeifferProtocol()
+    res = BenchmarkResults()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if ("replay" in groups) or ("sniffer" in groups):
+            for size in sizes:
+                jsonFile = os.path.join(tmpdir, "corpus{}.json".format(size))
+                writeJsonCorpus(proto, generateFrames(proto, size), jsonFile)
+                jsonToCapture(jsonFile, os.path.join(tmpdir, "corpus{}.pfcap".format(size)))
+
+        if "protocol" in groups:
+            benchProtocol(res, proto, sizes, args.repeat)
+        if "framing" in groups:
+            benchFraming(res, proto, sizes, args.repeat)
+        if "replay" in groups:
+            benchReplay(res, proto, sizes, args.repeat, tmpdir)
+        if "sniffer" in groups:
+            benchSniffer(res, proto, sizes, args.repeat, tmpdir)
+        if "startup" in groups:
+            benchStartup(res, args.repeat)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({ "python" : sys.version, "results" : res.results }, f, indent = 4)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)["results"]
+        regressions = compareBaseline(res.results, baseline, args.threshold)
+        for name, old, new, unit in regressions:
+            print("[REGRESSION] {}: {:.1f} -> {:.1f} {}".format(name, old, new, unit))
+        if len(regressions) > 0:
+            sys.exit(1)
+        print("No regressions (threshold {:.0%})".format(args.threshold))
+
+if __name__ == "__main__":
+    main()
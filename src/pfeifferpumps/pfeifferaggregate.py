@@ -0,0 +1,249 @@
+from pfeifferpumps.pfeifferproto import SerialProtocolViolation
+
+# Streaming windowed aggregation of register values
+#
+# Responses are aggregated per series (device address and parameter) over
+# time windows of a fixed length. Windows are either tumbling (slide equal
+# to the window length) or sliding by a fraction of the window length - the
+# window length has to be a multiple of the slide interval. Windows are
+# aligned to multiples of the slide interval (seconds since the epoch).
+#
+# Every series keeps a ring of window / slide panes (one per slide interval)
+# holding count, sum, minimum, maximum and last value of the responses that
+# have been received during that interval. A window is the combination of
+# the last window / slide panes, so memory per series is constant and does
+# not depend on the poll rate. Whenever a slide interval has completed one
+# aggregate (start, end, count, min, max, mean, last) is emitted for every
+# series that received at least one value inside the window.
+#
+# Time is taken from the receive time of the packets (event time). Windows
+# complete when a packet of the same series arrives after the window end or
+# when advance() is called with a later point in time - live sources call it
+# with the current time, replays with the timestamp of the latest packet.
+# Non numeric values (strings) are only counted and the last value is kept.
+
+PANE_INDEX      = 0
+PANE_COUNT      = 1
+PANE_NUMERIC    = 2
+PANE_SUM        = 3
+PANE_MIN        = 4
+PANE_MAX        = 5
+PANE_LAST       = 6
+
+AGGREGATE_STATISTICS = ( "min", "max", "mean", "last" )
+
+class PfeifferAggregate:
+    __slots__ = ( "address", "param", "register", "start", "end", "count", "min", "max", "mean", "last" )
+
+    def __init__(self, address, param, register, start, end, count, minimum, maximum, mean, last):
+        self.address = address
+        self.param = param
+        self.register = register
+        self.start = start
+        self.end = end
+        self.count = count
+        self.min = minimum
+        self.max = maximum
+        self.mean = mean
+        self.last = last
+
+    def as_dict(self):
+        res = {
+            "address"   : self.address,
+            "param"     : self.param,
+            "start"     : self.start,
+            "end"       : self.end,
+            "count"     : self.count,
+            "min"       : self.min,
+            "max"       : self.max,
+            "mean"      : self.mean,
+            "last"      : self.last
+        }
+        if self.register is not None:
+            res["designation"] = self.register.designation
+            res["unit"] = self.register.unit
+        return res
+
+    def __repr__(self):
+        return "PfeifferAggregate({})".format(self.as_dict())
+
+class PfeifferSeriesWindow:
+    __slots__ = ( "address", "param", "register", "panes", "nextEmit", "lastPane" )
+
+    def __init__(self, address, param, register, paneCount, firstPane):
+        self.address = address
+        self.param = param
+        self.register = register
+        self.panes = [ None ] * paneCount
+        # First pane whose window has not been emitted yet and last pane
+        # that received a value
+        self.nextEmit = firstPane
+        self.lastPane = firstPane
+
+class PfeifferAggregator:
+    def __init__(self, window, slide = None, registers = None, onAggregate = None):
+        # window and slide in seconds. registers optionally restricts the
+        # aggregation to a list of ( address, param ). onAggregate is called
+        # with every PfeifferAggregate
+        if slide is None:
+            slide = window
+        if (window <= 0) or (slide <= 0):
+            raise ValueError("Window and slide interval have to be positive")
+        paneCount = int(round(window / slide))
+        if (paneCount < 1) or (abs(paneCount * slide - window) > 1e-9 * window):
+            raise ValueError("Window length {} is not a multiple of the slide interval {}".format(window, slide))
+
+        self.window = window
+        self.slide = slide
+        self.paneCount = paneCount
+        self.registers = set(registers) if registers is not None else None
+        self.onAggregate = onAggregate
+        self.series = { }
+        self.watermark = None
+
+    def update(self, packet):
+        # Adds a decoded response. Returns True in case the packet has been
+        # aggregated, False for packets that are not aggregated (queries,
+        # unknown registers, registers that have not been selected)
+        if (packet.action != 1) or (packet.register is None):
+            return False
+        key = ( packet.address, packet.param )
+        if (self.registers is not None) and (not key in self.registers):
+            return False
+
+        rxTime = packet.rxTime
+        paneIndex = int(rxTime // self.slide)
+        series = self.series.get(key)
+        if series is None:
+            series = PfeifferSeriesWindow(packet.address, packet.param, packet.register, self.paneCount, paneIndex)
+            self.series[key] = series
+        elif paneIndex < series.nextEmit:
+            # Late value for a window that has already been emitted - counted
+            # into the oldest open interval
+            paneIndex = series.nextEmit
+        else:
+            self.emitUntil(series, paneIndex)
+
+        pane = series.panes[paneIndex % self.paneCount]
+        if (pane is None) or (pane[PANE_INDEX] != paneIndex):
+            pane = [ paneIndex, 0, 0, 0, None, None, None ]
+            series.panes[paneIndex % self.paneCount] = pane
+
+        value = packet.payload
+        pane[PANE_COUNT] = pane[PANE_COUNT] + 1
+        if isinstance(value, (int, float)):
+            pane[PANE_NUMERIC] = pane[PANE_NUMERIC] + 1
+            pane[PANE_SUM] = pane[PANE_SUM] + value
+            if (pane[PANE_MIN] is None) or (value < pane[PANE_MIN]):
+                pane[PANE_MIN] = value
+            if (pane[PANE_MAX] is None) or (value > pane[PANE_MAX]):
+                pane[PANE_MAX] = value
+        pane[PANE_LAST] = value
+        series.lastPane = paneIndex
+
+        if (self.watermark is None) or (rxTime > self.watermark):
+            self.watermark = rxTime
+        return True
+
+    def advance(self, now = None):
+        # Emits all windows that ended at or before now (seconds since the
+        # epoch, by default the receive time of the latest packet)
+        if now is None:
+            now = self.watermark
+            if now is None:
+                return
+        paneIndex = int(now // self.slide)
+        for series in self.series.values():
+            if series.nextEmit < paneIndex:
+                self.emitUntil(series, paneIndex)
+
+    def flush(self):
+        # Emits all windows that contain values including the current,
+        # incomplete one (for example at shutdown) and forgets all series
+        for series in self.series.values():
+            self.emitUntil(series, series.lastPane + self.paneCount)
+        self.series = { }
+
+    def nextBoundary(self, now):
+        # Point in time (seconds since the epoch) at which the next window ends
+        return (int(now // self.slide) + 1) * self.slide
+
+    def emitUntil(self, series, paneIndex):
+        # Emits the windows ending with all panes before paneIndex
+        k = series.nextEmit
+        while k < paneIndex:
+            if k >= series.lastPane + self.paneCount:
+                # All remaining windows are empty
+                k = paneIndex
+                break
+            aggregate = self.aggregate(series, k)
+            if (aggregate is not None) and (self.onAggregate is not None):
+                self.onAggregate(aggregate)
+            k = k + 1
+        series.nextEmit = k
+
+    def aggregate(self, series, lastPane):
+        # Combines the panes of the window that ends with pane lastPane
+        count = 0
+        numeric = 0
+        total = 0
+        minimum = None
+        maximum = None
+        last = None
+        lastIndex = None
+        firstPane = lastPane - self.paneCount + 1
+        for pane in series.panes:
+            if (pane is None) or (pane[PANE_INDEX] < firstPane) or (pane[PANE_INDEX] > lastPane):
+                continue
+            count = count + pane[PANE_COUNT]
+            if pane[PANE_NUMERIC] > 0:
+                numeric = numeric + pane[PANE_NUMERIC]
+                total = total + pane[PANE_SUM]
+                if (minimum is None) or (pane[PANE_MIN] < minimum):
+                    minimum = pane[PANE_MIN]
+                if (maximum is None) or (pane[PANE_MAX] > maximum):
+                    maximum = pane[PANE_MAX]
+            if (lastIndex is None) or (pane[PANE_INDEX] > lastIndex):
+                lastIndex = pane[PANE_INDEX]
+                last = pane[PANE_LAST]
+        if count == 0:
+            return None
+        return PfeifferAggregate(
+            series.address,
+            series.param,
+            series.register,
+            firstPane * self.slide,
+            (lastPane + 1) * self.slide,
+            count,
+            minimum,
+            maximum,
+            (total / numeric) if numeric > 0 else None,
+            last
+        )
+
+def aggregatePortName(portName, statistic):
+    return "{}/{}".format(portName, statistic)
+
+def writeAggregateCapture(capture, proto, portName, aggregate):
+    # Stores an aggregate in a binary capture (PfeifferCaptureWriter) as
+    # synthetic response frames timestamped with the end of the window - one
+    # per statistic on the ports <portName>/min, /max, /mean and /last. The
+    # capture can then be replayed and decoded like any other capture.
+    # Statistics that cannot be encoded in the datatype of the register are
+    # skipped, the count is not stored
+    register = aggregate.register
+    timestampNs = int(round(aggregate.end * 1e6)) * 1000
+    for statistic in AGGREGATE_STATISTICS:
+        value = getattr(aggregate, statistic)
+        if value is None:
+            continue
+        if register.datatype == 0:
+            value = bool(value >= 0.5)
+        elif isinstance(value, float) and (register.datatype != 2):
+            value = int(round(value))
+        try:
+            payloadRaw = proto.encodeDataType(value, register.datatype)
+        except (SerialProtocolViolation, ValueError, TypeError):
+            continue
+        frame = proto.encodeFrame(aggregate.address, 1, aggregate.param, payloadRaw)
+        capture.write(frame, timestampNs, capture.portId(aggregatePortName(portName, statistic)))
@@ -0,0 +1,207 @@
+# Passive bus utilisation and latency analysis
+#
+# Observes the traffic on a bus (as seen by the sniffer, live or replayed)
+# and pairs every request with the next response (action 1) of the same
+# device and parameter. Requests are queries (action 0) and writes - a write
+# is a frame with action 1 while no request for the register is outstanding,
+# the device acknowledges it by echoing the frame. Per window (of window
+# seconds, aligned to multiples of the window length like the aggregator) a
+# report is emitted containing
+#
+#   - the bus occupancy: transmission time of all frames (10 bits per
+#     character at the given baud rate) relative to the window length
+#   - the response latency per device (time between the end of the request
+#     and the end of the response) as percentiles
+#   - the number of unanswered queries per device. A query is unanswered in
+#     case no response arrives within responseTimeout or the same register
+#     is queried again before
+#   - the number of unmatched frames with action 1: presumed writes that
+#     have not been acknowledged or responses whose query has not been seen
+#     (for example after a protocol violation)
+#   - the poll rate per register (queries per second)
+#
+# Time is taken from the receive time of the packets so captures can be
+# analysed the same way as live ports. Windows without any traffic are not
+# reported.
+
+ANALYSE_BITS_PER_CHAR = 10
+ANALYSE_PERCENTILES = ( 50, 90, 99 )
+
+def percentile(sortedValues, p):
+    # Nearest rank percentile of an already sorted list
+    if len(sortedValues) == 0:
+        return None
+    rank = int(round(p / 100.0 * (len(sortedValues) - 1)))
+    return sortedValues[rank]
+
+class PfeifferDeviceStats:
+    __slots__ = ( "queries", "writes", "responses", "unanswered", "unmatched", "latencies" )
+
+    def __init__(self):
+        self.queries = 0
+        self.writes = 0
+        self.responses = 0
+        self.unanswered = 0
+        self.unmatched = 0
+        self.latencies = [ ]
+
+    def as_dict(self):
+        latencies = sorted(self.latencies)
+        res = {
+            "queries"       : self.queries,
+            "writes"        : self.writes,
+            "responses"     : self.responses,
+            "unanswered"    : self.unanswered,
+            "unmatched"     : self.unmatched,
+            "latency"       : {
+                "count"         : len(latencies),
+                "min"           : latencies[0] if len(latencies) > 0 else None,
+                "max"           : latencies[-1] if len(latencies) > 0 else None,
+                "mean"          : (sum(latencies) / len(latencies)) if len(latencies) > 0 else None
+            }
+        }
+        for p in ANALYSE_PERCENTILES:
+            res["latency"]["p{}".format(p)] = percentile(latencies, p)
+        return res
+
+class PfeifferBusReport:
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.frames = 0
+        self.chars = 0
+        self.busyTime = 0.0
+        self.violations = 0
+        self.devices = { }
+        self.polls = { }
+
+    def device(self, address):
+        stats = self.devices.get(address)
+        if stats is None:
+            stats = PfeifferDeviceStats()
+            self.devices[address] = stats
+        return stats
+
+    @property
+    def occupancy(self):
+        # Fraction of the window the bus has been transmitting
+        return self.busyTime / (self.end - self.start)
+
+    def pollRates(self):
+        # Queries per second by ( address, param )
+        length = self.end - self.start
+        return { key : count / length for key, count in self.polls.items() }
+
+    def as_dict(self):
+        return {
+            "start"         : self.start,
+            "end"           : self.end,
+            "frames"        : self.frames,
+            "chars"         : self.chars,
+            "occupancy"     : self.occupancy,
+            "violations"    : self.violations,
+            "devices"       : { address : stats.as_dict() for address, stats in self.devices.items() },
+            "polls"         : [ { "address" : address, "param" : param, "rate" : rate } for ( address, param ), rate in sorted(self.pollRates().items()) ]
+        }
+
+class PfeifferBusAnalyser:
+    def __init__(self, window = 10.0, baudrate = 9600, responseTimeout = 1.0, onReport = None):
+        if window <= 0:
+            raise ValueError("Window length has to be positive")
+        if baudrate <= 0:
+            raise ValueError("Baud rate has to be positive")
+        self.window = window
+        self.charTime = ANALYSE_BITS_PER_CHAR / float(baudrate)
+        self.responseTimeout = responseTimeout
+        self.onReport = onReport
+
+        self.report = None
+        # Outstanding requests by ( address, param ): ( receive time, write )
+        self.pending = { }
+
+    def windowFor(self, rxTime):
+        start = (rxTime // self.window) * self.window
+        return PfeifferBusReport(start, start + self.window)
+
+    def update(self, packet):
+        # Adds a frame seen on the bus (PfeifferPacket, decoded or not)
+        rxTime = packet.rxTime
+        if rxTime is None:
+            return
+        self.advance(rxTime)
+        if self.report is None:
+            self.report = self.windowFor(rxTime)
+        report = self.report
+
+        chars = len(packet.packetRaw)
+        report.frames = report.frames + 1
+        report.chars = report.chars + chars
+        report.busyTime = report.busyTime + chars * self.charTime
+
+        key = ( packet.address, packet.param )
+        device = report.device(packet.address)
+        request = self.pending.get(key)
+        if packet.action == 0:
+            device.queries = device.queries + 1
+            report.polls[key] = report.polls.get(key, 0) + 1
+            if request is not None:
+                # Requested again without having received a response
+                self.unanswered(device, request)
+            self.pending[key] = ( rxTime, False )
+        elif request is None:
+            self.pending[key] = ( rxTime, True )
+        else:
+            del self.pending[key]
+            if request[1]:
+                device.writes = device.writes + 1
+            else:
+                device.responses = device.responses + 1
+            device.latencies.append(rxTime - request[0])
+
+    @staticmethod
+    def unanswered(device, request):
+        if request[1]:
+            # Presumed write without acknowledgement (or a response whose
+            # query has not been seen)
+            device.unmatched = device.unmatched + 1
+        else:
+            device.unanswered = device.unanswered + 1
+
+    def violation(self, rxTime = None):
+        # Counts a frame that could not be decoded
+        if rxTime is not None:
+            self.advance(rxTime)
+        if self.report is not None:
+            self.report.violations = self.report.violations + 1
+
+    def expire(self, now):
+        # Requests without response within responseTimeout are unanswered.
+        # They are counted in the current window (or the window in which
+        # they expired)
+        expired = [ ( key, request ) for key, request in self.pending.items() if now - request[0] > self.responseTimeout ]
+        for key, request in expired:
+            del self.pending[key]
+            if self.report is None:
+                self.report = self.windowFor(request[0] + self.responseTimeout)
+            self.unanswered(self.report.device(key[0]), request)
+
+    def emit(self):
+        report = self.report
+        self.report = None
+        if self.onReport is not None:
+            self.onReport(report)
+
+    def advance(self, now):
+        # Emits all reports whose window ended before now
+        while True:
+            if (self.report is not None) and (now >= self.report.end):
+                self.expire(self.report.end)
+                self.emit()
+            self.expire(now)
+            if (self.report is None) or (now < self.report.end):
+                break
+
+    def flush(self):
+        # Emits the current (incomplete) window, for example at shutdown
+        if self.report is not None:
+            self.emit()
@@ -0,0 +1,194 @@
+import re
+import json
+
+import numpy as np
+
+# Vectorized decoding of large amounts of captured frames using NumPy
+#
+# Frames are packed into a two dimensional array of bytes (one row per frame,
+# zero padded to a fixed width). All checks that decodePacketRaw does per line
+# (minimum length, termination, numeric header fields and checksum) as well
+# as decoding of the numeric datatypes are performed column wise on the whole
+# array at once. Non numeric datatypes (strings, tms_old, u_expo) are not
+# decoded - their frames are marked as not decoded and can be handled by the
+# per packet routines of PfeifferProtocol if required.
+
+FRAME_WIDTH = 32
+
+batchDtype = np.dtype([
+    ("address",         np.uint16),
+    ("action",          np.uint8),
+    ("param",           np.uint16),
+    ("payloadLength",   np.uint8),
+    ("datatype",        np.int8),
+    ("valid",           np.bool_),
+    ("decoded",         np.bool_),
+    ("value",           np.float64),
+    ("timestamp",       np.float64)
+])
+
+def framesToArray(frames):
+    # Converts a sequence of frames (str or bytes, including the terminating
+    # carriage return) into a zero padded (N, FRAME_WIDTH) uint8 array and
+    # the array of frame lengths
+    if isinstance(frames, np.ndarray) and (frames.dtype.kind == 'S'):
+        arr = frames
+    else:
+        arr = np.array(frames, dtype = 'S')
+    if arr.ndim != 1:
+        arr = arr.reshape(-1)
+
+    lengths = np.char.str_len(arr).astype(np.int64)
+    itemsize = arr.dtype.itemsize if len(arr) > 0 else 1
+    raw = np.frombuffer(arr.tobytes(), dtype = np.uint8).reshape(len(arr), itemsize)
+
+    width = max(itemsize, FRAME_WIDTH)
+    buf = np.zeros((len(arr), width), dtype = np.uint8)
+    buf[:, :itemsize] = raw
+    return buf, lengths
+
+def datatypeTable(proto, registersets):
+    # Builds a dense address x parameter lookup table of datatypes (-1 for
+    # unknown registers or addresses without register set)
+    table = np.full((1000, 1000), -1, dtype = np.int8)
+    if registersets:
+        for address, regsetName in registersets.items():
+            regset = proto.registerSet(regsetName)
+            for param, register in regset.registers.items():
+                table[address, param] = register.datatype
+    return table
+
+def digitsValue(d, first, count):
+    value = np.zeros(d.shape[0], dtype = np.int64)
+    for i in range(first, first + count):
+        value = value * 10 + d[:, i]
+    return value
+
+def decodeFramesBatch(proto, frames, registersets = None, timestamps = None):
+    buf, lengths = framesToArray(frames)
+    n = buf.shape[0]
+
+    result = np.zeros(n, dtype = batchDtype)
+    result["datatype"] = -1
+    result["value"] = np.nan
+    if timestamps is not None:
+        result["timestamp"] = timestamps
+    else:
+        result["timestamp"] = np.nan
+    if n == 0:
+        return result
+
+    rows = np.arange(n)
+    d = buf.astype(np.int16) - 0x30
+    isDigit = (d >= 0) & (d <= 9)
+
+    # Framing: minimum length, carriage return termination, only printable
+    # characters before the termination
+    valid = (lengths >= 14) & (lengths <= buf.shape[1])
+    lastIdx = np.clip(lengths - 1, 0, buf.shape[1] - 1)
+    valid &= buf[rows, lastIdx] == 0x0D
+
+    columns = np.arange(buf.shape[1])
+    inFrame = columns[np.newaxis, :] < (lengths - 1)[:, np.newaxis]
+    printable = (buf >= 0x20) & (buf <= 0x7F)
+    valid &= np.all(printable | ~inFrame, axis = 1)
+
+    # Numeric header fields (address, action, parameter, data length)
+    valid &= np.all(isDigit[:, 0:4], axis = 1) & np.all(isDigit[:, 5:10], axis = 1)
+
+    # Checksum over everything except the checksum itself and the termination
+    chkIdx = np.clip(lengths - 4, 0, buf.shape[1] - 3)
+    chkDigits = np.stack([ d[rows, chkIdx], d[rows, chkIdx + 1], d[rows, chkIdx + 2] ], axis = 1)
+    valid &= np.all((chkDigits >= 0) & (chkDigits <= 9), axis = 1)
+    chkSumFrame = chkDigits[:, 0].astype(np.int64) * 100 + chkDigits[:, 1] * 10 + chkDigits[:, 2]
+
+    cumSum = np.cumsum(buf, axis = 1, dtype = np.int32)
+    chkSumReal = cumSum[rows, np.clip(lengths - 5, 0, buf.shape[1] - 1)] % 256
+    valid &= chkSumReal == chkSumFrame
+
+    address = digitsValue(d, 0, 3)
+    param = digitsValue(d, 5, 3)
+
+    result["valid"] = valid
+    result["address"] = np.where(valid, address, 0)
+    result["action"] = np.where(valid, d[:, 3], 0)
+    result["param"] = np.where(valid, param, 0)
+    result["payloadLength"] = np.where(valid, digitsValue(d, 8, 2), 0)
+
+    # Payload decoding for responses with a known register set
+    datatype = np.where(valid, datatypeTable(proto, registersets)[np.where(valid, address, 0), np.where(valid, param, 0)], -1)
+    result["datatype"] = datatype
+
+    payloadLen = lengths - 14
+    isResponse = valid & (result["action"] == 1)
+    value = np.full(n, np.nan)
+    decoded = np.zeros(n, dtype = np.bool_)
+
+    payloadWidth = min(buf.shape[1] - 10, 16)
+    payload = buf[:, 10:10 + payloadWidth]
+    p6Digits = np.all(isDigit[:, 10:16], axis = 1) & (payloadLen == 6)
+    p6 = digitsValue(d, 10, 6).astype(np.float64)
+
+    # boolean_old
+    sel = isResponse & (datatype == 0) & (payloadLen == 6)
+    isTrue = np.all(payload[:, 0:6] == ord('1'), axis = 1)
+    isFalse = np.all(payload[:, 0:6] == ord('0'), axis = 1)
+    sel &= isTrue | isFalse
+    value[sel] = isTrue[sel]
+    decoded |= sel
+
+    # u_integer
+    sel = isResponse & (datatype == 1) & p6Digits
+    value[sel] = p6[sel]
+    decoded |= sel
+
+    # u_real
+    sel = isResponse & (datatype == 2) & p6Digits
+    value[sel] = p6[sel] / 100.0
+    decoded |= sel
+
+    # boolean_new
+    sel = isResponse & (datatype == 6) & (payloadLen == 1) & ((payload[:, 0] == ord('0')) | (payload[:, 0] == ord('1')))
+    value[sel] = payload[sel, 0] == ord('1')
+    decoded |= sel
+
+    # u_short_int
+    sel = isResponse & (datatype == 7) & (payloadLen == 3) & np.all(isDigit[:, 10:13], axis = 1)
+    value[sel] = digitsValue(d, 10, 3)[sel]
+    decoded |= sel
+
+    # u_expo_new
+    sel = isResponse & (datatype == 10) & p6Digits
+    mantissa = digitsValue(d, 10, 4).astype(np.float64) / 1000.0
+    exponent = digitsValue(d, 14, 2).astype(np.float64)
+    value[sel] = mantissa[sel] * np.power(10.0, exponent[sel])
+    decoded |= sel
+
+    result["value"] = value
+    result["decoded"] = decoded
+    return result
+
+# Loads all frames (and their timestamps) from a JSON lines capture as
+# written by pfeiffersniff -j. Instead of parsing every line the raw frames
+# and timestamps are extracted with a single regular expression pass
+
+reCaptureLine = re.compile(rb'"packetRaw": "((?:[^"\\]|\\.)*)".*?"time": "[^"]*?(?:\.(\d+))?", "timestamp": (\d+)')
+
+def loadJsonCaptureFrames(filename):
+    with open(filename, "rb") as f:
+        data = f.read()
+
+    frames = []
+    timestamps = []
+    for frame, fraction, timestamp in reCaptureLine.findall(data):
+        if frame.endswith(b'\\r') and (frame.count(b'\\') == 1):
+            frame = frame[:-2] + b'\r'
+        else:
+            frame = json.loads(b'"' + frame + b'"').encode("ASCII")
+        frames.append(frame)
+        if fraction:
+            timestamps.append(int(timestamp) + int(fraction) / (10 ** len(fraction)))
+        else:
+            timestamps.append(float(timestamp))
+
+    return np.array(frames, dtype = 'S'), np.array(timestamps, dtype = np.float64)
@@ -0,0 +1,519 @@
+import argparse
+import json
+import os
+import struct
+import time
+import zlib
+
+from datetime import datetime
+
+from pfeifferpumps.pfeifferproto import PfeifferProtocol, SerialProtocolViolation, SerialProtocolUnknownRegister
+
+# Compact binary capture format
+#
+# A capture file starts with an 8 byte file header (magic "PFCAP", format
+# version and two reserved bytes) followed by a sequence of blocks. Every
+# block starts with a block header
+#
+#   tag         4 bytes     DATA, INDX, PORT
+#   flags       uint8       bit 0: payload is zlib compressed
+#                           bit 1: index payload starts with the chain offsets
+#   length      uint32      length of the (stored) payload
+#   records     uint32      number of records in the block
+#   firstTs     int64       first timestamp in the block (ns since epoch)
+#   lastTs      int64       last timestamp in the block (ns since epoch)
+#
+# DATA blocks contain records consisting of a record header (timestamp in
+# ns since the epoch as int64, port id as uint16 and frame length as uint8)
+# followed by the raw frame bytes (including the terminating carriage return).
+# Records are collected in memory and written as a whole block (optionally
+# compressed) so writing never happens once per packet. A block is written as
+# soon as it reaches blockSize bytes or flushInterval seconds after the
+# previous one (checked on write() and pump()) so a crash loses at most
+# flushInterval seconds of data on a quiet bus.
+#
+# After every indexInterval data blocks an INDX block is written that
+# contains (firstTs, lastTs, offset, records) entries for the preceding data
+# blocks. Index blocks are flagged as chained: their payload starts with the
+# offset of the previous index block and of the latest PORT block. On close a
+# final INDX block covering all data blocks is written, followed by a fixed
+# size trailer (magic "PFTR" and the offset of the final index block). A
+# reader can thus locate the index in O(1) - in case the trailer is missing
+# (for example after a crash) the last complete index block is searched from
+# the end of the file, the chain of index blocks is followed back and only
+# the block headers written after the last index block have to be scanned.
+#
+# PORT blocks contain a JSON dictionary mapping port ids to port names.
+
+FILE_MAGIC = b'PFCAP'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<5sBxx')
+BLOCK_HEADER = struct.Struct('<4sBIIqq')
+RECORD_HEADER = struct.Struct('<qHB')
+INDEX_ENTRY = struct.Struct('<qqQI')
+INDEX_CHAIN = struct.Struct('<QQ')
+TRAILER = struct.Struct('<4sQ')
+
+TAG_DATA = b'DATA'
+TAG_INDEX = b'INDX'
+TAG_PORT = b'PORT'
+TRAILER_MAGIC = b'PFTR'
+
+FLAG_ZLIB = 0x01
+FLAG_CHAINED = 0x02
+
+# Maximum distance from the end of a capture without trailer that is searched
+# for the last index block before falling back to scanning all block headers
+RECOVERY_SEARCH = 64 * 1048576
+
+def isCaptureFile(filename):
+    with open(filename, "rb") as f:
+        return f.read(len(FILE_MAGIC)) == FILE_MAGIC
+
+def timestampNow():
+    return int(time.time() * 1e9)
+
+class PfeifferCaptureWriter:
+    def __init__(self, filename, blockSize = 65536, indexInterval = 16, compress = True, flushInterval = 1.0):
+        self.filename = filename
+        self.blockSize = blockSize
+        self.indexInterval = indexInterval
+        self.compress = compress
+        self.flushInterval = flushInterval
+
+        self.buffer = bytearray()
+        self.records = 0
+        self.firstTs = None
+        self.lastTs = None
+        self.lastFlush = time.monotonic()
+
+        self.index = [ ]
+        self.unindexed = 0
+        self.portNames = { }
+        # Offsets of the last periodic index block and of the last PORT
+        # block (0 if none has been written)
+        self.lastIndexOffset = 0
+        self.portOffset = 0
+
+        if os.path.exists(filename) and (os.path.getsize(filename) > 0):
+            # Append to an existing capture. The final index and the trailer
+            # are dropped and rewritten on close
+            with PfeifferCaptureReader(filename) as reader:
+                self.index = list(reader.blockIndex())
+                self.portNames = dict(reader.portNames)
+                self.lastIndexOffset = reader.lastIndexOffset
+                self.portOffset = reader.portOffset
+                truncateAt = reader.appendOffset()
+            self.file = open(filename, "r+b")
+            self.file.truncate(truncateAt)
+            self.file.seek(truncateAt)
+            if (len(self.portNames) > 0) and (self.portOffset == 0):
+                # Written without index chain - record the port names again
+                # so the chained index blocks can reference them
+                self.writePortBlock()
+        else:
+            self.file = open(filename, "wb")
+            self.file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def portId(self, portName):
+        # Returns the id for a named port - new names are recorded in the file
+        for portId, name in self.portNames.items():
+            if name == portName:
+                return portId
+        portId = len(self.portNames)
+        self.portNames[portId] = portName
+        self.writePortBlock()
+        return portId
+
+    def writePortBlock(self):
+        # Every PORT block contains all port names known so far
+        self.portOffset = self.file.tell()
+        payload = json.dumps({ str(k) : v for k, v in self.portNames.items() }).encode("UTF-8")
+        self.file.write(BLOCK_HEADER.pack(TAG_PORT, 0, len(payload), len(self.portNames), 0, 0))
+        self.file.write(payload)
+
+    def write(self, frame, timestampNs = None, portId = 0):
+        if isinstance(frame, str):
+            frame = frame.encode("ASCII")
+        if timestampNs is None:
+            timestampNs = timestampNow()
+        if len(frame) > 255:
+            raise SerialProtocolViolation("Frame too long for capture record")
+
+        self.buffer += RECORD_HEADER.pack(timestampNs, portId, len(frame))
+        self.buffer += frame
+        self.records = self.records + 1
+        if self.firstTs is None:
+            self.firstTs = timestampNs
+        self.lastTs = timestampNs
+
+        if len(self.buffer) >= self.blockSize:
+            self.flushBlock()
+        else:
+            self.pump()
+
+    def writePacket(self, packet, portId = 0):
+        timestampNs = int(packet.rxTime * 1e9) if packet.rxTime is not None else None
+        self.write(packet.packetRaw, timestampNs, portId)
+
+    def pump(self):
+        # Writes the buffered records in case the flush interval has passed
+        if (self.records > 0) and (self.flushInterval is not None) and (time.monotonic() - self.lastFlush >= self.flushInterval):
+            self.flushBlock()
+
+    def nextFlush(self):
+        # Monotonic time at which buffered records are due or None
+        if (self.records == 0) or (self.flushInterval is None):
+            return None
+        return self.lastFlush + self.flushInterval
+
+    def flushBlock(self):
+        self.lastFlush = time.monotonic()
+        if self.records == 0:
+            return
+        payload = bytes(self.buffer)
+        flags = 0
+        if self.compress:
+            payload = zlib.compress(payload, 1)
+            flags = FLAG_ZLIB
+
+        offset = self.file.tell()
+        self.file.write(BLOCK_HEADER.pack(TAG_DATA, flags, len(payload), self.records, self.firstTs, self.lastTs))
+        self.file.write(payload)
+        self.index.append(( self.firstTs, self.lastTs, offset, self.records ))
+        self.unindexed = self.unindexed + 1
+
+        del self.buffer[:]
+        self.records = 0
+        self.firstTs = None
+        self.lastTs = None
+
+        if self.unindexed >= self.indexInterval:
+            # The first index block of the chain covers all preceding blocks
+            # (in case blocks have been appended to a capture without chain)
+            self.lastIndexOffset = self.writeIndex(self.index[-self.unindexed:] if self.lastIndexOffset else self.index)
+            self.unindexed = 0
+
+        # Hand the block to the operating system so it survives a crash of
+        # the process
+        self.file.flush()
+
+    def writeIndex(self, entries):
+        offset = self.file.tell()
+        payload = INDEX_CHAIN.pack(self.lastIndexOffset, self.portOffset) + b''.join(INDEX_ENTRY.pack(*entry) for entry in entries)
+        firstTs = entries[0][0] if len(entries) > 0 else 0
+        lastTs = entries[-1][1] if len(entries) > 0 else 0
+        self.file.write(BLOCK_HEADER.pack(TAG_INDEX, FLAG_CHAINED, len(payload), len(entries), firstTs, lastTs))
+        self.file.write(payload)
+        return offset
+
+    def flush(self):
+        self.flushBlock()
+        self.file.flush()
+
+    def close(self):
+        if self.file is None:
+            return
+        self.flushBlock()
+        indexOffset = self.writeIndex(self.index)
+        self.file.write(TRAILER.pack(TRAILER_MAGIC, indexOffset))
+        self.file.close()
+        self.file = None
+
+class PfeifferCaptureReader:
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, "rb")
+        header = self.file.read(FILE_HEADER.size)
+        if len(header) != FILE_HEADER.size:
+            raise SerialProtocolViolation("Capture file {} too short".format(filename))
+        magic, version = FILE_HEADER.unpack(header)
+        if magic != FILE_MAGIC:
+            raise SerialProtocolViolation("{} is not a capture file".format(filename))
+        if version != FILE_VERSION:
+            raise SerialProtocolViolation("Unsupported capture file version {}".format(version))
+
+        self.fileSize = os.fstat(self.file.fileno()).st_size
+        self.portNames = { }
+        self.index = None
+        self.finalIndexOffset = None
+        self.lastIndexOffset = 0
+        self.portOffset = 0
+        self.dataEnd = self.fileSize
+
+        self.loadIndex()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def readBlockHeader(self, offset):
+        self.file.seek(offset)
+        data = self.file.read(BLOCK_HEADER.size)
+        if len(data) != BLOCK_HEADER.size:
+            return None
+        return BLOCK_HEADER.unpack(data)
+
+    def readIndexBlock(self, hdr):
+        # Returns ( previous index offset, port block offset, entries ) of
+        # the index block whose header has just been read. The offsets are
+        # None for index blocks without chain
+        tag, flags, length, records, firstTs, lastTs = hdr
+        payload = self.file.read(length)
+        start = 0
+        previous, portOffset = None, None
+        if flags & FLAG_CHAINED:
+            previous, portOffset = INDEX_CHAIN.unpack_from(payload)
+            start = INDEX_CHAIN.size
+        return previous, portOffset, [ INDEX_ENTRY.unpack_from(payload, start + i * INDEX_ENTRY.size) for i in range(records) ]
+
+    def isChainedIndex(self, offset):
+        # Checks if a complete chained index block starts at the given offset
+        hdr = self.readBlockHeader(offset)
+        if hdr is None:
+            return False
+        tag, flags, length, records, firstTs, lastTs = hdr
+        if (tag != TAG_INDEX) or (not (flags & FLAG_CHAINED)):
+            return False
+        if (length != INDEX_CHAIN.size + records * INDEX_ENTRY.size) or (offset + BLOCK_HEADER.size + length > self.fileSize):
+            return False
+        previous, portOffset = INDEX_CHAIN.unpack(self.file.read(INDEX_CHAIN.size))
+        if (previous >= offset) or (portOffset >= offset):
+            return False
+        if previous != 0:
+            hdr = self.readBlockHeader(previous)
+            return (hdr is not None) and (hdr[0] == TAG_INDEX)
+        return True
+
+    def findLastIndex(self):
+        # Searches the end of the file backwards for the last complete
+        # chained index block
+        chunkSize = 65536
+        end = self.fileSize
+        limit = max(FILE_HEADER.size, self.fileSize - RECOVERY_SEARCH)
+        while end > limit:
+            start = max(limit, end - chunkSize)
+            self.file.seek(start)
+            # Overlap with the previous chunk so tags on the boundary are found
+            data = self.file.read(end - start + len(TAG_INDEX) - 1)
+            pos = data.rfind(TAG_INDEX)
+            while pos >= 0:
+                if self.isChainedIndex(start + pos):
+                    return start + pos
+                pos = data.rfind(TAG_INDEX, 0, pos)
+            end = start
+        return None
+
+    def loadIndex(self):
+        # Use the trailer if present, otherwise recover from the last index
+        # block (or by scanning all block headers)
+        if self.fileSize >= FILE_HEADER.size + TRAILER.size:
+            self.file.seek(self.fileSize - TRAILER.size)
+            magic, indexOffset = TRAILER.unpack(self.file.read(TRAILER.size))
+            if (magic == TRAILER_MAGIC) and (indexOffset < self.fileSize):
+                hdr = self.readBlockHeader(indexOffset)
+                if (hdr is not None) and (hdr[0] == TAG_INDEX):
+                    previous, portOffset, self.index = self.readIndexBlock(hdr)
+                    self.finalIndexOffset = indexOffset
+                    self.dataEnd = indexOffset
+                    if portOffset is None:
+                        self.scanPortBlocks()
+                    else:
+                        self.lastIndexOffset = previous
+                        self.loadPortBlockAt(portOffset)
+                    return
+
+        self.index = [ ]
+        offset = FILE_HEADER.size
+        indexOffset = self.findLastIndex()
+        if indexOffset is not None:
+            # Follow the chain of index blocks back to the first one
+            chain = [ ]
+            portOffset = None
+            previous = indexOffset
+            while previous:
+                hdr = self.readBlockHeader(previous)
+                if (hdr is None) or (hdr[0] != TAG_INDEX):
+                    # Broken chain - scan all block headers instead
+                    chain = None
+                    break
+                previous, blockPortOffset, entries = self.readIndexBlock(hdr)
+                if portOffset is None:
+                    portOffset = blockPortOffset
+                chain.append(entries)
+            if chain is not None:
+                for entries in reversed(chain):
+                    self.index.extend(entries)
+                self.lastIndexOffset = indexOffset
+                self.loadPortBlockAt(portOffset)
+                offset = indexOffset + BLOCK_HEADER.size + self.readBlockHeader(indexOffset)[2]
+
+        while offset + BLOCK_HEADER.size <= self.fileSize:
+            hdr = self.readBlockHeader(offset)
+            tag, flags, length, records, firstTs, lastTs = hdr
+            if offset + BLOCK_HEADER.size + length > self.fileSize:
+                # Truncated block (crash while writing)
+                break
+            if tag == TAG_DATA:
+                self.index.append(( firstTs, lastTs, offset, records ))
+            elif tag == TAG_PORT:
+                self.portOffset = offset
+                self.loadPortBlock(length)
+            elif tag != TAG_INDEX:
+                break
+            offset = offset + BLOCK_HEADER.size + length
+        self.dataEnd = offset
+
+    def scanPortBlocks(self):
+        # Port blocks are rare and small - they're located by walking the
+        # block headers without reading any data payload
+        offset = FILE_HEADER.size
+        while offset < self.dataEnd:
+            hdr = self.readBlockHeader(offset)
+            if hdr is None:
+                break
+            if hdr[0] == TAG_PORT:
+                self.loadPortBlock(hdr[2])
+            offset = offset + BLOCK_HEADER.size + hdr[2]
+
+    def loadPortBlockAt(self, offset):
+        self.portOffset = offset
+        if offset:
+            hdr = self.readBlockHeader(offset)
+            self.loadPortBlock(hdr[2])
+
+    def loadPortBlock(self, length):
+        names = json.loads(self.file.read(length).decode("UTF-8"))
+        self.portNames = { int(k) : v for k, v in names.items() }
+
+    def appendOffset(self):
+        return self.dataEnd
+
+    def blockIndex(self):
+        return self.index
+
+    def readBlock(self, offset):
+        # Returns all records of the data block at the given offset
+        hdr = self.readBlockHeader(offset)
+        tag, flags, length, records, firstTs, lastTs = hdr
+        payload = self.file.read(length)
+        return decodeDataBlock(flags, payload, records)
+
+    def __iter__(self):
+        for firstTs, lastTs, offset, records in self.index:
+            for record in self.readBlock(offset):
+                yield record
+
+def decodeDataBlock(flags, payload, records):
+    # Decodes the payload of a data block into a list of records
+    # (timestampNs, portId, frame)
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    res = [ ]
+    pos = 0
+    for i in range(records):
+        timestampNs, portId, frameLen = RECORD_HEADER.unpack_from(payload, pos)
+        pos = pos + RECORD_HEADER.size
+        res.append(( timestampNs, portId, payload[pos:pos + frameLen].decode("ASCII") ))
+        pos = pos + frameLen
+    return res
+
+# Conversion from and to the JSON lines format written by pfeiffersniff -j
+
+def jsonTimestampNs(packet):
+    return jsonFieldsTimestampNs(packet.get("timestamp", 0), packet.get("time", ""))
+
+def jsonFieldsTimestampNs(timestamp, tm):
+    # The JSON format contains the epoch in seconds and a human readable
+    # local time with microsecond resolution. Both have been generated from
+    # the same instant so the fraction can be taken from the human readable
+    # representation
+    timestampNs = int(timestamp) * 1000000000
+    if "." in tm:
+        fraction = tm.rsplit(".", 1)[1]
+        if fraction.isdigit():
+            timestampNs = timestampNs + int(fraction.ljust(9, "0")[:9])
+    return timestampNs
+
+def jsonToCapture(jsonFilename, captureFilename, portName = None, blockSize = 65536):
+    count = 0
+    with PfeifferCaptureWriter(captureFilename, blockSize = blockSize) as writer:
+        portId = writer.portId(portName) if portName is not None else 0
+        with open(jsonFilename, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                packet = json.loads(line)
+                writer.write(packet['packetRaw'], jsonTimestampNs(packet), portId)
+                count = count + 1
+    return count
+
+def captureToJson(captureFilename, jsonFilename, registersets = None):
+    proto = PfeifferProtocol()
+    regsets = proto.compileAddressMap(registersets)
+    count = 0
+    with PfeifferCaptureReader(captureFilename) as reader:
+        with open(jsonFilename, "w") as f:
+            for timestampNs, portId, frame in reader:
+                try:
+                    packet = proto.decodeFrame(frame, timestampNs / 1e9)
+                    regset = regsets.get(packet.address)
+                    if regset is not None:
+                        try:
+                            regset.decode(packet)
+                        except (SerialProtocolViolation, SerialProtocolUnknownRegister):
+                            pass
+                    msg = packet.as_dict()
+                except SerialProtocolViolation:
+                    # Keep corrupted frames so the conversion is lossless
+                    msg = { "packetRaw" : frame, "time" : str(datetime.fromtimestamp(timestampNs / 1e9)), "timestamp" : int(timestampNs // 1000000000) }
+                f.write(json.dumps(msg))
+                f.write("\n")
+                count = count + 1
+    return count
+
+def pfeifferCaptureConvertCLI():
+    ap = argparse.ArgumentParser(description = 'Convert Pfeiffer RS485 captures between the JSON lines and the binary capture format')
+    ap.add_argument('input', type=str, help="Input file (JSON lines or binary capture, detected automatically)")
+    ap.add_argument('output', type=str, help="Output file")
+    ap.add_argument('-d', '--device', type=str, required=False, default=None, action='append', help="Adds a device registerset to a given address (ADR:DEVTYPE) when converting into JSON. Can be used multiple times")
+    ap.add_argument('--portname', type=str, required=False, default=None, help="Port name recorded when converting into the binary format")
+    args = ap.parse_args()
+
+    regsets = { }
+    if args.device:
+        for devspec in args.device:
+            devspecparts = devspec.split(':')
+            if len(devspecparts) != 2:
+                print("Invalid device address : name specification {}".format(devspec))
+                exit(1)
+            try:
+                regsets[int(devspecparts[0])] = devspecparts[1]
+            except ValueError:
+                print("Invalid device address {}".format(devspecparts[0]))
+                exit(1)
+
+    if isCaptureFile(args.input):
+        count = captureToJson(args.input, args.output, regsets)
+    else:
+        count = jsonToCapture(args.input, args.output, args.portname)
+    print("Converted {} packets".format(count))
+
+if __name__ == "__main__":
+    pfeifferCaptureConvertCLI()
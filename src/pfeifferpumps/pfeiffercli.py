@@ -1,23 +1,54 @@
 import sys
-import serial
 import json
 import argparse
+import signal
+import time
+
+from datetime import datetime
 
 from pfeifferpumps.pfeifferproto import PfeifferProtocol, SerialProtocolViolation, SerialCommunicationError, SerialSimulationDone, SerialProtocolUnknownRegister
 from pfeifferpumps.pfeifferrs485 import PfeifferRS485Serial
+from pfeifferpumps.pfeifferstate import PfeifferStateStore
+from pfeifferpumps.pfeiffercapture import PfeifferCaptureWriter
+from pfeifferpumps.pfeifferreplay import parseTimestamp
+from pfeifferpumps.pfeifferregisterfile import loadRegisterFile
+from pfeifferpumps.pfeifferaggregate import PfeifferAggregator, writeAggregateCapture
 
 def pfeifferSnifferCLI():
     ap = argparse.ArgumentParser(description = 'Simple access to Pfeiffer pumps on an RS485 bus attached to a serial port')
     ap.add_argument('-p', '--port', type=str, required=False, default="/dev/ttyU0", help="Serial port to be used to access the RS485 bus")
     ap.add_argument('-s', '--simfile', type=str, required=False, default=None, help="Simulation file. One can supply a JSON dump that should be injected instead of a real serial port")
     ap.add_argument('-d', '--device', type=str, required=False, default=None, action='append', help="Adds a device registerset to a given address (ADR:DEVTYPE). Can be used multiple times")
+    ap.add_argument('--regfile', type=str, required=False, default=None, action='append', help="Loads an additional register set definition (JSON or TOML) that can be used with --device. Can be used multiple times")
     ap.add_argument('-j', '--logjson', type=str, required=False, default=None, help="Specifies a logfile that all captured packets are appended to - in JSON format line per line")
+    ap.add_argument('-c', '--logcapture', type=str, required=False, default=None, help="Specifies a binary capture file that all captured packets are appended to (raw frames with timestamps, see pfeifferconvert)")
+    ap.add_argument('--historian', type=str, required=False, default=None, help="Stores all responses in the given historian database (SQLite, see pfeifferhistory)")
+    ap.add_argument('--simspeed', type=float, required=False, default=None, help="Replay the simulation file at the given multiple of real time (default: as fast as possible)")
+    ap.add_argument('--simstart', type=str, required=False, default=None, help="Start the replay of the simulation file at the given time (YYYY-MM-DD HH:MM:SS or seconds since the epoch)")
     ap.add_argument('--showsim', action='store_true', help="Show simulated messages")
     ap.add_argument('--noshowquery', action='store_true', help="Disable output of query messages")
     ap.add_argument('--noerror', action='store_true', help="Disable error messages (protocol violation, etc.)")
+    ap.add_argument('--poll', type=str, required=False, default=None, action='append', help="Master mode: Poll a register periodically (ADR:PARAM:RATE with rate in Hz). Can be used multiple times")
+    ap.add_argument('--onlychanges', action='store_true', help="Only show responses whose value changed by more than the deadband")
+    ap.add_argument('--deadband', type=float, required=False, default=0, help="Relative deadband (fraction of the register range) used with --onlychanges")
+    ap.add_argument('--aggregate', type=str, required=False, default=None, help="Show min/max/mean/last/count of responses per register over windows of WINDOW seconds instead of every response (WINDOW or WINDOW:SLIDE for sliding windows)")
+    ap.add_argument('--aggregateregister', type=str, required=False, default=None, action='append', help="Only aggregate the given register (ADR:PARAM). Can be used multiple times")
+    ap.add_argument('--aggregatecapture', type=str, required=False, default=None, help="Binary capture file that aggregates are appended to (see pfeifferaggregate)")
+    ap.add_argument('--analyse', type=float, required=False, default=None, help="Show bus occupancy, response latency percentiles, unanswered queries and poll rates over windows of ANALYSE seconds instead of every message")
+    ap.add_argument('--analysebaudrate', type=int, required=False, default=9600, help="Baud rate of the bus used to calculate the occupancy with --analyse")
+    ap.add_argument('--analysetimeout', type=float, required=False, default=1.0, help="Time in seconds after which a query without response is counted as unanswered with --analyse")
+    ap.add_argument('--rules', type=str, required=False, default=None, help="Evaluates the alarm rules from the given JSON file on every response and shows raised, cleared and changed alarms (see pfeifferrules)")
     args = ap.parse_args()
 
     serialPort = args.port
+    if args.regfile:
+        for regfile in args.regfile:
+            try:
+                loadRegisterFile(regfile)
+            except (OSError, SerialProtocolViolation) as e:
+                print(e)
+                exit(1)
+
     regsets = { }
     if args.device:
         for devspec in args.device:
@@ -32,35 +63,241 @@ def pfeifferSnifferCLI():
                 exit(1)
             regsets[adr] = devspecparts[1]
 
-    with PfeifferRS485Serial(serialPort, regsets, simulationfile = args.simfile, rawsimulationdump = args.showsim) as port:
-        while True:
+    polls = [ ]
+    if args.poll:
+        for pollspec in args.poll:
+            pollspecparts = pollspec.split(':')
+            if len(pollspecparts) != 3:
+                print("Invalid poll specification {}".format(pollspec))
+                exit(1)
+            try:
+                polls.append((int(pollspecparts[0]), int(pollspecparts[1]), float(pollspecparts[2])))
+            except ValueError:
+                print("Invalid poll specification {}".format(pollspec))
+                exit(1)
+
+    aggregator = None
+    aggregateCapture = None
+    if args.aggregate:
+        aggregateRegisters = None
+        try:
+            aggspecparts = [ float(part) for part in args.aggregate.split(':') ]
+            if len(aggspecparts) > 2:
+                raise ValueError("Invalid aggregation window {}".format(args.aggregate))
+            if args.aggregateregister:
+                aggregateRegisters = [ ]
+                for regspec in args.aggregateregister:
+                    regspecparts = regspec.split(':')
+                    if len(regspecparts) != 2:
+                        raise ValueError("Invalid register specification {}".format(regspec))
+                    aggregateRegisters.append(( int(regspecparts[0]), int(regspecparts[1]) ))
+            aggregator = PfeifferAggregator(aggspecparts[0], aggspecparts[1] if len(aggspecparts) > 1 else None, aggregateRegisters)
+        except ValueError as e:
+            print(e)
+            exit(1)
+        if args.aggregatecapture:
             try:
-                # nextLine = serialNextLine(port)
-                # packet = proto.decodePacketRaw(nextLine)
-
-                # Currently decode everything according to TC110 register map
-                # packet = proto.decodePacket(packet, proto.registersTC110)
-                nextMsg = port.nextMessage()
-                if ("designation" in nextMsg) and ("payload" in nextMsg):
-                    if nextMsg['action'] == 1:
-                        if "regunit" in nextMsg:
-                            unit = nextMsg['regunit']
-                        else:
-                            unit = ""
-                        if unit == None:
-                            unit = ""
-                        print("[DECODED] {}, {}: {} {} {}".format(nextMsg['time'], nextMsg['address'], nextMsg['designation'], nextMsg['payload'], unit))
-                    else:
-                        if not args.noshowquery:
-                            print("[DECODED QUERY] {}, {}: {}".format(nextMsg['time'], nextMsg['address'], nextMsg['designation']))
+                aggregateCapture = PfeifferCaptureWriter(args.aggregatecapture)
+            except (OSError, SerialProtocolViolation) as e:
+                print("Failed to open capture {}: {}".format(args.aggregatecapture, e))
+                exit(1)
+        aggregateProto = PfeifferProtocol()
+
+        def handleAggregate(aggregate):
+            unit = aggregate.register.unit or ""
+            print("[AGGREGATE] {} - {}, {}: {} count {} min {} max {} mean {} last {} {}".format(
+                datetime.fromtimestamp(aggregate.start),
+                datetime.fromtimestamp(aggregate.end),
+                aggregate.address,
+                aggregate.register.designation,
+                aggregate.count,
+                aggregate.min,
+                aggregate.max,
+                aggregate.mean,
+                aggregate.last,
+                unit
+            ))
+            if aggregateCapture:
+                writeAggregateCapture(aggregateCapture, aggregateProto, serialPort if not args.simfile else "simulation", aggregate)
+
+        aggregator.onAggregate = handleAggregate
+
+    analyser = None
+    if args.analyse is not None:
+        from pfeifferpumps.pfeifferanalyse import PfeifferBusAnalyser, ANALYSE_PERCENTILES
+
+        def formatLatency(value):
+            return "-" if value is None else "{:.1f}".format(value * 1000.0)
+
+        def handleReport(report):
+            print("[BUS] {} - {}: occupancy {:.1f} %, {} frames, {} violations".format(
+                datetime.fromtimestamp(report.start),
+                datetime.fromtimestamp(report.end),
+                report.occupancy * 100.0,
+                report.frames,
+                report.violations
+            ))
+            for address in sorted(report.devices):
+                stats = report.devices[address].as_dict()
+                latency = stats["latency"]
+                print("[BUS] {}: {} queries, {} responses, {} writes, {} unanswered, {} unmatched, latency {} ms (min {} max {})".format(
+                    address,
+                    stats["queries"],
+                    stats["responses"],
+                    stats["writes"],
+                    stats["unanswered"],
+                    stats["unmatched"],
+                    " ".join("p{} {}".format(p, formatLatency(latency["p{}".format(p)])) for p in ANALYSE_PERCENTILES),
+                    formatLatency(latency["min"]),
+                    formatLatency(latency["max"])
+                ))
+            pollRates = report.pollRates()
+            for address in sorted(set(key[0] for key in pollRates)):
+                print("[BUS] {}: poll rates (parameter:Hz) {}".format(address, " ".join("{}:{:.2f}".format(param, pollRates[(adr, param)]) for adr, param in sorted(pollRates) if adr == address)))
+
+        try:
+            analyser = PfeifferBusAnalyser(args.analyse, args.analysebaudrate, args.analysetimeout, onReport = handleReport)
+        except ValueError as e:
+            print(e)
+            exit(1)
+
+    rules = None
+    if args.rules:
+        from pfeifferpumps.pfeifferrules import PfeifferRuleEngine, loadRules
+
+        def handleAlarm(event):
+            print("[ALARM] {}, {}".format(datetime.fromtimestamp(event.timestamp), event))
+
+        try:
+            rules = PfeifferRuleEngine(loadRules(args.rules), onEvent = handleAlarm)
+        except (OSError, ValueError) as e:
+            print("Failed to load rules {}: {}".format(args.rules, e))
+            exit(1)
+
+    stateStore = None
+    if args.onlychanges:
+        stateStore = PfeifferStateStore(relativeDeadband = args.deadband)
+
+    # Log files are opened once - the JSON log is line buffered, the binary
+    # capture is written in whole blocks (at least once a second)
+    logJson = None
+    logCapture = None
+    if args.logjson:
+        logJson = open(args.logjson, "a", buffering = 1)
+    if args.logcapture:
+        try:
+            logCapture = PfeifferCaptureWriter(args.logcapture)
+        except (OSError, SerialProtocolViolation) as e:
+            print("Failed to open capture {}: {}".format(args.logcapture, e))
+            exit(1)
+    historian = None
+    if args.historian:
+        import sqlite3
+        from pfeifferpumps.pfeifferhistorian import PfeifferHistorian
+        try:
+            historian = PfeifferHistorian(args.historian)
+        except (ValueError, sqlite3.Error) as e:
+            print("Failed to open historian database {}: {}".format(args.historian, e))
+            exit(1)
+
+    def handlePacket(nextMsg):
+        showPacket = True
+        if analyser:
+            showPacket = False
+        if rules:
+            rules.evaluate(nextMsg, serialPort if not args.simfile else "simulation")
+        if aggregator:
+            if aggregator.update(nextMsg):
+                showPacket = False
+            aggregator.advance(nextMsg.rxTime)
+        if showPacket and stateStore and (nextMsg.action == 1):
+            showPacket = stateStore.update(nextMsg)
+
+        if not showPacket:
+            pass
+        elif ("designation" in nextMsg) and ("payload" in nextMsg):
+            if nextMsg['action'] == 1:
+                if "regunit" in nextMsg:
+                    unit = nextMsg['regunit']
                 else:
-                    print("[UNKNOWN] {}".format(nextMsg))
-                if args.logjson:
-                    with open(args.logjson, "a") as f:
-                        f.write(json.dumps(nextMsg))
-                        f.write("\n")
-            except serial.SerialException as e:
-                print("Failed to connect to serial port {}".format(portFile))
+                    unit = ""
+                if unit == None:
+                    unit = ""
+                print("[DECODED] {}, {}: {} {} {}".format(nextMsg['time'], nextMsg['address'], nextMsg['designation'], nextMsg['payload'], unit))
+            else:
+                if not args.noshowquery:
+                    print("[DECODED QUERY] {}, {}: {}".format(nextMsg['time'], nextMsg['address'], nextMsg['designation']))
+        else:
+            print("[UNKNOWN] {}".format(nextMsg.as_dict()))
+        if logJson:
+            logJson.write(json.dumps(nextMsg.as_dict()))
+            logJson.write("\n")
+        if logCapture:
+            logCapture.writePacket(nextMsg)
+        if historian:
+            historian.write(nextMsg, serialPort if not args.simfile else "simulation")
+
+    def handleTimeout(address, param):
+        if not args.noerror:
+            print("[TIMEOUT] {}: No response for parameter {}".format(address, param))
+
+    if args.simstart is not None:
+        try:
+            parseTimestamp(args.simstart)
+        except ValueError as e:
+            print(e)
+            exit(1)
+
+    # SIGTERM ends the sniffer the same way as an interrupt so the buffered
+    # block and the trailer of binary captures are written
+    def handleTerm(*args):
+        raise KeyboardInterrupt()
+    signal.signal(signal.SIGTERM, handleTerm)
+
+    with PfeifferRS485Serial(serialPort, regsets, simulationfile = args.simfile, rawsimulationdump = args.showsim, simulationspeed = args.simspeed, simulationstart = args.simstart) as port:
+        if analyser:
+            port.setAnalyser(analyser)
+        scheduler = None
+        if len(polls) > 0:
+            from pfeifferpumps.pfeifferscheduler import PfeifferPollScheduler
+            scheduler = PfeifferPollScheduler(port)
+            scheduler.onPacket = handlePacket
+            scheduler.onTimeout = handleTimeout
+            try:
+                for address, param, rate in polls:
+                    scheduler.addPoll(address, param, rate)
+            except (ValueError, SerialProtocolUnknownRegister) as e:
+                print(e)
+                exit(1)
+            for poll in scheduler.unservable():
+                print("[SCHEDULER] {}: Parameter {} can only be polled at {:.2f} Hz instead of {:.2f} Hz".format(poll['address'], poll['param'], poll['achievable'], poll['requested']))
+
+        captures = [ capture for capture in ( logCapture, aggregateCapture ) if capture ]
+
+        while True:
+            try:
+                if scheduler:
+                    scheduler.step()
+                    for capture in captures:
+                        capture.pump()
+                    continue
+
+                # Wake up in time to write buffered capture records on a
+                # quiet bus
+                timeout = None
+                for capture in captures:
+                    nextFlush = capture.nextFlush()
+                    if nextFlush is not None:
+                        remaining = max(nextFlush - time.monotonic(), 0)
+                        timeout = remaining if timeout is None else min(timeout, remaining)
+
+                nextMsg = port.nextMessage(timeout = timeout)
+                for capture in captures:
+                    capture.pump()
+                if nextMsg is not None:
+                    handlePacket(nextMsg)
+            except port.portExceptions as e:
+                print("Failed to connect to serial port {}".format(serialPort))
             except SerialProtocolViolation as e:
                 if not args.noerror:
                     print(e)
@@ -77,5 +314,18 @@ def pfeifferSnifferCLI():
                 print("Exiting (simulation done)")
                 break
 
+    if analyser:
+        analyser.flush()
+    if aggregator:
+        aggregator.flush()
+    if aggregateCapture:
+        aggregateCapture.close()
+    if logJson:
+        logJson.close()
+    if logCapture:
+        logCapture.close()
+    if historian:
+        historian.close()
+
 if __name__ == "__main__":
     pfeifferSnifferCLI()
@@ -0,0 +1,416 @@
+import argparse
+import heapq
+import os
+import pty
+import random
+import select
+import threading
+import time
+import tty
+
+from pfeifferpumps.pfeifferproto import PfeifferProtocol, PfeifferFramer, SerialProtocolViolation
+
+# Slave mode device emulator
+#
+# Emulates one or more devices (TC110, MVP015, ...) on a virtual RS485 bus.
+# The bus is a pseudo terminal pair - clients (the sniffer, the transaction
+# engine, the MQTT bridge, ...) simply open the slave side as serial port.
+#
+# Every emulated device keeps the raw payload of all registers of its
+# register set (initialized from the register defaults) and answers read
+# requests as well as write requests to writable registers. Timing follows the
+# selected baud rate - a frame is delivered after the time it would take to
+# transmit it (10 bit times per character) and only when the bus is idle, a
+# device answers after a configurable turnaround delay. Errors can be injected
+# by corrupting responses, dropping responses or inserting noise between
+# frames. A synthetic traffic generator can keep the bus busy with query and
+# response pairs as if another master were polling the devices.
+
+# Zero payloads per datatype used when a register has no (encodable) default
+DATATYPE_DEFAULTPAYLOAD = {
+    0 : "000000", 1 : "000000", 2 : "000000", 3 : "0.0E00", 4 : "      ", 5 : "000000",
+    6 : "0", 7 : "000", 9 : "000000", 10 : "000000", 11 : " " * 16, 12 : " " * 8
+}
+
+# Error responses of the devices
+ERROR_NODEF = "NO_DEF"
+ERROR_RANGE = "_RANGE"
+ERROR_LOGIC = "_LOGIC"
+
+class PfeifferDeviceEmulator:
+    def __init__(self, address, registerSetName, proto = None):
+        self.proto = proto if proto is not None else PfeifferProtocol()
+        self.address = address
+        self.registerSet = self.proto.registerSet(registerSetName)
+        self.payloads = { }
+        self.generators = { }
+
+        self.reads = 0
+        self.writes = 0
+        self.errors = 0
+
+        for param, register in self.registerSet.registers.items():
+            payload = None
+            if register.default is not None:
+                try:
+                    payload = self.proto.encodeDataType(register.default, register.datatype)
+                except SerialProtocolViolation:
+                    payload = None
+            if payload is None:
+                payload = DATATYPE_DEFAULTPAYLOAD.get(register.datatype, "000000")
+            self.payloads[param] = payload
+
+        # Parameters that synthetic bus traffic may query
+        self.readable = [ param for param, register in self.registerSet.registers.items() if register.access != PfeifferProtocol.ACCESS_W ]
+
+    def setRaw(self, param, payloadRaw):
+        if not param in self.payloads:
+            raise SerialProtocolViolation("Unknown register {} for device {}".format(param, self.address))
+        self.payloads[param] = payloadRaw
+
+    def setValue(self, param, value):
+        register = self.registerSet.get(param)
+        if register is None:
+            raise SerialProtocolViolation("Unknown register {} for device {}".format(param, self.address))
+        self.payloads[param] = self.proto.encodeDataType(value, register.datatype)
+
+    def setGenerator(self, param, generator):
+        # The generator is called as generator(param, now) on every read and
+        # returns the raw payload that should be reported
+        self.generators[param] = generator
+
+    def readRaw(self, param, now = None):
+        generator = self.generators.get(param)
+        if generator is not None:
+            return generator(param, time.time() if now is None else now)
+        return self.payloads[param]
+
+    def handleRequest(self, packet):
+        # Returns the raw payload of the response to a request packet
+        register = self.registerSet.get(packet.param)
+        if register is None:
+            self.errors = self.errors + 1
+            return ERROR_NODEF
+
+        payloadRaw = packet.payloadRaw
+        if (packet.action == 0) and (payloadRaw == "=?"):
+            if register.access == PfeifferProtocol.ACCESS_W:
+                self.errors = self.errors + 1
+                return ERROR_LOGIC
+            self.reads = self.reads + 1
+            return self.readRaw(packet.param)
+
+        if register.access == PfeifferProtocol.ACCESS_R:
+            self.errors = self.errors + 1
+            return ERROR_LOGIC
+        try:
+            value = register.decoder(payloadRaw)
+        except SerialProtocolViolation:
+            self.errors = self.errors + 1
+            return ERROR_RANGE
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            if ((register.min is not None) and (value < register.min)) or ((register.max is not None) and (value > register.max)):
+                self.errors = self.errors + 1
+                return ERROR_RANGE
+
+        self.writes = self.writes + 1
+        self.payloads[packet.param] = payloadRaw
+        return payloadRaw
+
+class PfeifferBusEmulator:
+    # Synthetic traffic is only generated while the scheduled transmissions
+    # occupy the bus for less than this number of seconds
+    BUSY_HORIZON = 0.05
+
+    def __init__(self, devices = None, baudrate = 9600, responseDelay = 0.005, responseJitter = 0.0, errorRate = 0.0, dropRate = 0.0, noiseRate = 0.0, busyRate = 0.0, echo = False, seed = None):
+        self.proto = PfeifferProtocol()
+        self.devices = { }
+        self.baudrate = baudrate
+        self.responseDelay = responseDelay
+        self.responseJitter = responseJitter
+        self.errorRate = errorRate
+        self.dropRate = dropRate
+        self.noiseRate = noiseRate
+        self.busyRate = busyRate
+        self.echo = echo
+        self.random = random.Random(seed)
+
+        self.masterFd = None
+        self.slaveFd = None
+        self.slaveName = None
+        self.framer = PfeifferFramer()
+
+        # Scheduled transmissions (due time, sequence, frame bytes)
+        self.transmissions = [ ]
+        self.sequence = 0
+        self.busFreeAt = 0
+        self.nextBusy = None
+
+        self.thread = None
+        self.running = False
+
+        self.requests = 0
+        self.responses = 0
+        self.corrupted = 0
+        self.dropped = 0
+        self.noise = 0
+        self.generated = 0
+        self.violations = 0
+
+        if devices:
+            for address, registerSetName in devices.items():
+                self.addDevice(address, registerSetName)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def addDevice(self, address, registerSetName):
+        device = PfeifferDeviceEmulator(address, registerSetName, self.proto)
+        self.devices[address] = device
+        return device
+
+    def charTime(self):
+        return 10.0 / self.baudrate
+
+    def stats(self):
+        return {
+            "requests"      : self.requests,
+            "responses"     : self.responses,
+            "corrupted"     : self.corrupted,
+            "dropped"       : self.dropped,
+            "noise"         : self.noise,
+            "generated"     : self.generated,
+            "violations"    : self.violations
+        }
+
+    def open(self):
+        # Creates the pseudo terminal pair. Clients open slaveName. The slave
+        # side is kept open so the bus survives clients reconnecting
+        if self.masterFd is not None:
+            return self.slaveName
+        self.masterFd, self.slaveFd = pty.openpty()
+        tty.setraw(self.slaveFd)
+        self.slaveName = os.ttyname(self.slaveFd)
+        return self.slaveName
+
+    def close(self):
+        self.stop()
+        if self.masterFd is not None:
+            os.close(self.masterFd)
+            os.close(self.slaveFd)
+            self.masterFd = None
+            self.slaveFd = None
+
+    # Bus timing
+
+    def schedule(self, frame, notBefore):
+        # Queues a frame for transmission. The frame occupies the bus for its
+        # transmission time and is delivered as soon as it has been "sent"
+        start = max(notBefore, self.busFreeAt)
+        self.busFreeAt = start + len(frame) * self.charTime()
+        self.sequence = self.sequence + 1
+        heapq.heappush(self.transmissions, ( self.busFreeAt, self.sequence, frame ))
+
+    def corrupt(self, frame):
+        # Replaces one digit of the frame (all frames start with at least ten
+        # digits) by a different one so the checksum fails
+        pos = self.random.randrange(0, 10)
+        corrupted = bytearray(frame)
+        corrupted[pos] = 0x30 + (corrupted[pos] - 0x30 + self.random.randrange(1, 10)) % 10
+        return bytes(corrupted)
+
+    def respond(self, device, packet, receivedAt):
+        payloadRaw = device.handleRequest(packet)
+        if (self.dropRate > 0) and (self.random.random() < self.dropRate):
+            self.dropped = self.dropped + 1
+            return
+        frame = self.proto.encodeFrameBytes(device.address, 1, packet.param, payloadRaw)
+        if (self.errorRate > 0) and (self.random.random() < self.errorRate):
+            frame = self.corrupt(frame)
+            self.corrupted = self.corrupted + 1
+        delay = self.responseDelay
+        if self.responseJitter > 0:
+            delay = delay + self.random.uniform(0, self.responseJitter)
+        self.schedule(frame, receivedAt + delay)
+        self.responses = self.responses + 1
+
+    def generateBusyTraffic(self, now):
+        # One query / response pair for a random register of a random device
+        if len(self.devices) == 0:
+            return
+        device = self.devices[self.random.choice(list(self.devices.keys()))]
+        if len(device.readable) == 0:
+            return
+        param = self.random.choice(device.readable)
+        query = self.proto.encodeQueryBytes(device.address, param)
+        self.schedule(query, now)
+        response = self.proto.encodeFrameBytes(device.address, 1, param, device.readRaw(param, now))
+        self.schedule(response, self.busFreeAt + self.responseDelay)
+        self.generated = self.generated + 1
+
+    def processInput(self, data, now):
+        self.framer.feed(data)
+        while True:
+            try:
+                frame = self.framer.nextFrame()
+            except SerialProtocolViolation:
+                self.violations = self.violations + 1
+                continue
+            if frame is None:
+                break
+
+            # The request arrives after its transmission time on the bus
+            receivedAt = max(now, self.busFreeAt) + len(frame) * self.charTime()
+            self.busFreeAt = receivedAt
+            if self.echo:
+                self.sequence = self.sequence + 1
+                heapq.heappush(self.transmissions, ( receivedAt, self.sequence, frame.encode("ASCII") ))
+
+            try:
+                packet = self.proto.decodeFrame(frame)
+            except SerialProtocolViolation:
+                self.violations = self.violations + 1
+                continue
+            self.requests = self.requests + 1
+
+            device = self.devices.get(packet.address)
+            if device is not None:
+                self.respond(device, packet, receivedAt)
+
+    def transmitDue(self, now):
+        while (len(self.transmissions) > 0) and (self.transmissions[0][0] <= now):
+            _, _, frame = heapq.heappop(self.transmissions)
+            if (self.noiseRate > 0) and (self.random.random() < self.noiseRate):
+                noise = bytes(self.random.randrange(0x20, 0x7F) for i in range(self.random.randrange(1, 8)))
+                os.write(self.masterFd, noise)
+                self.noise = self.noise + 1
+            os.write(self.masterFd, frame)
+
+    def step(self, maxWait = 0.1):
+        # Handles input and due transmissions once, waits at most maxWait
+        now = time.monotonic()
+        if self.busyRate > 0:
+            if self.nextBusy is None:
+                self.nextBusy = now
+            while self.nextBusy <= now:
+                if self.busFreeAt - now > self.BUSY_HORIZON:
+                    # The bus is saturated - skip the traffic that is due
+                    # instead of queueing it without bound and continue once
+                    # the backlog drained
+                    self.nextBusy = self.busFreeAt - self.BUSY_HORIZON + self.random.expovariate(self.busyRate)
+                    break
+                self.generateBusyTraffic(max(self.nextBusy, self.busFreeAt))
+                self.nextBusy = self.nextBusy + self.random.expovariate(self.busyRate)
+
+        timeout = maxWait
+        if len(self.transmissions) > 0:
+            timeout = min(timeout, max(self.transmissions[0][0] - now, 0))
+        if self.nextBusy is not None:
+            timeout = min(timeout, max(self.nextBusy - now, 0))
+
+        readable, _, _ = select.select([ self.masterFd ], [], [], timeout)
+        now = time.monotonic()
+        if readable:
+            try:
+                data = os.read(self.masterFd, 4096)
+            except OSError:
+                data = b''
+            if data:
+                self.processInput(data, now)
+        self.transmitDue(now)
+
+    def run(self):
+        self.open()
+        self.running = True
+        while self.running:
+            self.step()
+
+    def start(self):
+        # Runs the emulator in a background thread
+        if self.running:
+            return self.slaveName
+        self.open()
+        self.running = True
+        self.thread = threading.Thread(target = self.runThread, daemon = True)
+        self.thread.start()
+        return self.slaveName
+
+    def runThread(self):
+        while self.running:
+            self.step()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+def pfeifferEmulatorCLI():
+    ap = argparse.ArgumentParser(description = 'Emulate Pfeiffer devices on a virtual RS485 bus (pseudo terminal)')
+    ap.add_argument('-d', '--device', type=str, required=True, action='append', help="Emulates a device with the given registerset at the given address (ADR:DEVTYPE). Can be used multiple times")
+    ap.add_argument('--link', type=str, required=False, default=None, help="Create a symbolic link to the pseudo terminal at the given path")
+    ap.add_argument('--baudrate', type=int, required=False, default=9600, help="Baud rate used for the bus timing")
+    ap.add_argument('--delay', type=float, required=False, default=5, help="Response delay of the devices in milliseconds")
+    ap.add_argument('--jitter', type=float, required=False, default=0, help="Additional random response delay in milliseconds")
+    ap.add_argument('--errorrate', type=float, required=False, default=0, help="Fraction of responses that get corrupted")
+    ap.add_argument('--droprate', type=float, required=False, default=0, help="Fraction of requests that are not answered")
+    ap.add_argument('--noiserate', type=float, required=False, default=0, help="Fraction of frames preceded by random noise")
+    ap.add_argument('--busy', type=float, required=False, default=0, help="Generate synthetic query / response pairs at the given rate in Hz")
+    ap.add_argument('--echo', action='store_true', help="Echo received requests back onto the bus like a half duplex transceiver")
+    ap.add_argument('--seed', type=int, required=False, default=None, help="Seed for the random number generator")
+    args = ap.parse_args()
+
+    devices = { }
+    for devspec in args.device:
+        devspecparts = devspec.split(':')
+        if len(devspecparts) != 2:
+            print("Invalid device address : name specification {}".format(devspec))
+            exit(1)
+        try:
+            devices[int(devspecparts[0])] = devspecparts[1]
+        except ValueError:
+            print("Invalid device address {}".format(devspecparts[0]))
+            exit(1)
+
+    try:
+        emulator = PfeifferBusEmulator(
+            devices,
+            baudrate = args.baudrate,
+            responseDelay = args.delay / 1000.0,
+            responseJitter = args.jitter / 1000.0,
+            errorRate = args.errorrate,
+            dropRate = args.droprate,
+            noiseRate = args.noiserate,
+            busyRate = args.busy,
+            echo = args.echo,
+            seed = args.seed
+        )
+    except SerialProtocolViolation as e:
+        print(e)
+        exit(1)
+
+    with emulator:
+        slaveName = emulator.open()
+        if args.link:
+            if os.path.islink(args.link):
+                os.unlink(args.link)
+            os.symlink(slaveName, args.link)
+        print("Emulating devices {} on {}".format(", ".join("{}:{}".format(adr, name) for adr, name in devices.items()), args.link if args.link else slaveName))
+        try:
+            emulator.run()
+        except KeyboardInterrupt:
+            print("\r", end="")
+            print("Exiting ...")
+        finally:
+            if args.link and os.path.islink(args.link):
+                os.unlink(args.link)
+        print(emulator.stats())
+
+if __name__ == "__main__":
+    pfeifferEmulatorCLI()
@@ -0,0 +1,526 @@
+import argparse
+import json
+import logging
+import os
+import selectors
+import signal
+import socket
+import stat
+import time
+
+from collections import deque
+
+from pfeifferpumps.pfeifferproto import SerialProtocolViolation, SerialProtocolUnknownRegister, SerialCommunicationError, SerialSimulationDone
+from pfeifferpumps.pfeifferrs485 import PfeifferRS485Serial
+from pfeifferpumps.pfeifferregisterfile import loadRegisterFile
+
+# Local fan-out server so many consumers share one serial port
+#
+# Only one process can own the tty of a bus. The fan-out server owns the port
+# and streams every frame to any number of subscribers connected via TCP or a
+# Unix domain socket. The protocol is line based - clients send JSON objects,
+# one per line:
+#
+#   { "cmd" : "subscribe", "format" : "decoded", "filter" : [ "1:309", "2" ] }
+#       Selects the output format and optionally restricts the stream to some
+#       devices (ADR) or registers (ADR:PARAM). A new connection receives all
+#       frames in decoded format until it subscribes
+#   { "cmd" : "query", "address" : 1, "param" : 309, "id" : 17 }
+#   { "cmd" : "write", "address" : 1, "param" : 10, "value" : true, "id" : 18 }
+#       Requests a read or a write of a register (the register set of the
+#       device has to be known to the server)
+#
+# The server sends one line per frame: in raw format the frame itself (as
+# received, terminated by \r\n), in decoded format a JSON object (the same as
+# the JSON log of the sniffer). Requests are answered with a JSON object
+# containing the id of the request, "ok" and either the "response" packet or
+# an "error" message.
+#
+# Requests of all clients are serialized onto the bus: only one request is on
+# the bus at a time, the next one is sent when the response (a frame with
+# action 1 of the same device and parameter) arrived or the request timed out.
+#
+# Every client has a bounded queue (message count and bytes). A slow client
+# never blocks reading the serial port - in case its queue overflows either
+# the oldest lines are dropped (policy dropoldest) or the client is
+# disconnected (policy disconnect).
+
+FANOUT_FORMAT_RAW       = "raw"
+FANOUT_FORMAT_DECODED   = "decoded"
+
+FANOUT_MAX_LINE         = 65536
+
+class PfeifferFanoutClient:
+    def __init__(self, sock, name):
+        self.sock = sock
+        self.name = name
+        self.format = FANOUT_FORMAT_DECODED
+        # Selected devices (all registers) and registers - None for all frames
+        self.addresses = None
+        self.registers = None
+
+        self.rxBuffer = b''
+        self.queue = deque()
+        self.queueBytes = 0
+        # The first queued line has been sent partially
+        self.partial = False
+        self.writing = False
+
+        self.sent = 0
+        self.dropped = 0
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def subscribe(self, outputFormat, filterSpec):
+        if not outputFormat in ( FANOUT_FORMAT_RAW, FANOUT_FORMAT_DECODED ):
+            raise ValueError("Unknown format {}".format(outputFormat))
+        addresses = None
+        registers = None
+        if filterSpec:
+            addresses = set()
+            registers = set()
+            for spec in filterSpec:
+                parts = str(spec).split(':')
+                try:
+                    if len(parts) == 1:
+                        addresses.add(int(parts[0]))
+                    elif len(parts) == 2:
+                        registers.add(( int(parts[0]), int(parts[1]) ))
+                    else:
+                        raise ValueError()
+                except ValueError:
+                    raise ValueError("Invalid filter {} (ADR or ADR:PARAM)".format(spec))
+        self.format = outputFormat
+        self.addresses = addresses
+        self.registers = registers
+
+    def matches(self, packet):
+        if self.addresses is None:
+            return True
+        return (packet.address in self.addresses) or (( packet.address, packet.param ) in self.registers)
+
+    def stats(self):
+        return {
+            "format"        : self.format,
+            "sent"          : self.sent,
+            "dropped"       : self.dropped,
+            "queuelength"   : len(self.queue),
+            "queuebytes"    : self.queueBytes
+        }
+
+class PfeifferFanoutServer:
+    POLICY_DROPOLDEST = "dropoldest"
+    POLICY_DISCONNECT = "disconnect"
+
+    PORT_BATCH = 64
+
+    def __init__(self, port, tcp = None, unixPath = None, maxMessages = 1000, maxBytes = 262144, policy = "dropoldest", requestTimeout = 1.0, logger = None):
+        # port is an open PfeifferRS485Serial (opened with pollingAsync = True),
+        # tcp an optional ( host, port ) and unixPath an optional path of a
+        # Unix domain socket to listen on
+        if not policy in ( self.POLICY_DROPOLDEST, self.POLICY_DISCONNECT ):
+            raise ValueError("Unknown queue policy {}".format(policy))
+        if (tcp is None) and (unixPath is None):
+            raise ValueError("No listening socket configured")
+        self.port = port
+        self.maxMessages = maxMessages
+        self.maxBytes = maxBytes
+        self.policy = policy
+        self.requestTimeout = requestTimeout
+        self.logger = logger if logger is not None else logging.getLogger()
+
+        self.terminate = False
+        self.clients = { }
+        self.listeners = [ ]
+        self.unixPath = None
+
+        # Requests waiting for the bus: ( client, id, address, param, frame )
+        # and the request currently on the bus with its deadline
+        self.requests = deque()
+        self.inflight = None
+        self.inflightDeadline = None
+
+        self.frames = 0
+        self.disconnects = 0
+
+        self.selector = selectors.DefaultSelector()
+        if port.pollDelay() is None:
+            self.selector.register(port.fileno(), selectors.EVENT_READ, None)
+
+        try:
+            if tcp is not None:
+                listener = socket.create_server(tcp)
+                self.listen(listener)
+            if unixPath is not None:
+                if os.path.exists(unixPath) and stat.S_ISSOCK(os.stat(unixPath).st_mode):
+                    # Stale socket of a previous instance
+                    os.unlink(unixPath)
+                listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                listener.bind(unixPath)
+                self.unixPath = unixPath
+                self.listen(listener)
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def listen(self, listener):
+        listener.listen(16)
+        listener.setblocking(False)
+        self.listeners.append(listener)
+        self.selector.register(listener, selectors.EVENT_READ, listener)
+
+    def close(self):
+        for client in list(self.clients.values()):
+            self.disconnect(client)
+        for listener in self.listeners:
+            self.selector.unregister(listener)
+            listener.close()
+        self.listeners = [ ]
+        if self.unixPath is not None:
+            try:
+                os.unlink(self.unixPath)
+            except OSError:
+                pass
+            self.unixPath = None
+        self.selector.close()
+
+    def addresses(self):
+        # Addresses the server listens on (for example to find the TCP port
+        # that has been assigned when listening on port 0)
+        return [ listener.getsockname() for listener in self.listeners ]
+
+    def serve(self):
+        # Runs until stop() has been called or the simulation is done
+        self.terminate = False
+        while not self.terminate:
+            try:
+                self.step()
+            except SerialSimulationDone:
+                self.logger.info("Simulation done")
+                break
+
+    def stop(self):
+        self.terminate = True
+
+    def step(self, timeout = 1.0):
+        # Waits for serial data, new connections, client requests and
+        # writable clients (at most timeout seconds) and handles all of them
+        delay = self.port.pollDelay()
+        if delay is not None:
+            timeout = min(timeout, max(delay, 0))
+        if self.inflightDeadline is not None:
+            timeout = min(timeout, max(self.inflightDeadline - time.monotonic(), 0))
+
+        readPort = False
+        for key, mask in self.selector.select(timeout):
+            if key.data is None:
+                readPort = True
+            elif isinstance(key.data, PfeifferFanoutClient):
+                if mask & selectors.EVENT_READ:
+                    self.receive(key.data)
+                if (mask & selectors.EVENT_WRITE) and (key.data.sock is not None):
+                    self.flush(key.data)
+            else:
+                self.accept(key.data)
+        if (delay is not None) and (self.port.pollDelay() <= 0):
+            readPort = True
+
+        if readPort:
+            self.readPort()
+        if (self.inflight is not None) and (time.monotonic() >= self.inflightDeadline):
+            request = self.inflight
+            self.inflight = None
+            self.inflightDeadline = None
+            self.reply(request[0], request[1], False, error = "Timeout")
+        self.sendRequest()
+
+        for client in list(self.clients.values()):
+            if (len(client.queue) > 0) and (not client.writing):
+                self.flush(client)
+
+    # Serial port
+
+    def readPort(self):
+        for i in range(self.PORT_BATCH):
+            try:
+                packet = self.port.nextMessage()
+            except (SerialProtocolViolation, SerialProtocolUnknownRegister) as e:
+                self.logger.debug(e)
+                continue
+            if packet is None:
+                break
+            self.distribute(packet)
+
+    def distribute(self, packet):
+        self.frames = self.frames + 1
+        if (self.inflight is not None) and (packet.action == 1) and (packet.address == self.inflight[2]) and (packet.param == self.inflight[3]):
+            request = self.inflight
+            self.inflight = None
+            self.inflightDeadline = None
+            self.reply(request[0], request[1], True, response = packet.as_dict())
+
+        # Every format is encoded at most once per frame
+        lines = { }
+        for client in list(self.clients.values()):
+            if not client.matches(packet):
+                continue
+            line = lines.get(client.format)
+            if line is None:
+                if client.format == FANOUT_FORMAT_RAW:
+                    line = (packet.packetRaw + "\n").encode("ASCII", errors = "replace")
+                else:
+                    line = (json.dumps(packet.as_dict()) + "\n").encode("UTF-8")
+                lines[client.format] = line
+            self.enqueue(client, line)
+
+    # Requests
+
+    def sendRequest(self):
+        # Puts the next request onto the bus while no other request is pending
+        while (self.inflight is None) and (len(self.requests) > 0):
+            request = self.requests.popleft()
+            if request[0].sock is None:
+                # Client disconnected in the meantime
+                continue
+            try:
+                self.port.writeFrame(request[4])
+            except SerialCommunicationError as e:
+                self.reply(request[0], request[1], False, error = str(e))
+                continue
+            self.inflight = request
+            self.inflightDeadline = time.monotonic() + self.requestTimeout
+
+    def request(self, client, msg):
+        cmd = msg.get('cmd')
+        reqId = msg.get('id')
+        try:
+            if cmd == "subscribe":
+                client.subscribe(msg.get('format', FANOUT_FORMAT_DECODED), msg.get('filter'))
+                self.reply(client, reqId, True)
+                return
+            if (cmd != "query") and (cmd != "write"):
+                raise ValueError("Unknown command {}".format(cmd))
+
+            address = int(msg['address'])
+            param = int(msg['param'])
+            proto = self.port.proto
+            if cmd == "query":
+                frame = proto.encodeQueryBytes(address, param)
+            else:
+                if not "value" in msg:
+                    raise ValueError("Missing value")
+                regset = self.port.registerSets.get(address)
+                if regset is None:
+                    raise ValueError("Unknown register set of device {}".format(address))
+                register = regset.get(param)
+                if register is None:
+                    raise ValueError("Unknown parameter {} of device {}".format(param, address))
+                frame = proto.encodeWriteBytes(address, register, msg['value'])
+        except (KeyError, TypeError, ValueError, SerialProtocolViolation) as e:
+            if isinstance(e, KeyError):
+                e = "Missing {}".format(e)
+            self.reply(client, reqId, False, error = str(e))
+            return
+        self.requests.append(( client, reqId, address, param, frame ))
+
+    def reply(self, client, reqId, ok, error = None, response = None):
+        if client.sock is None:
+            return
+        msg = { "id" : reqId, "ok" : ok }
+        if error is not None:
+            msg["error"] = error
+        if response is not None:
+            msg["response"] = response
+        self.enqueue(client, (json.dumps(msg) + "\n").encode("UTF-8"))
+
+    # Clients
+
+    def accept(self, listener):
+        try:
+            sock, peer = listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        sock.setblocking(False)
+        client = PfeifferFanoutClient(sock, str(peer) if peer else "local")
+        self.clients[sock.fileno()] = client
+        self.selector.register(sock, selectors.EVENT_READ, client)
+        self.logger.info("Client {} connected".format(client.name))
+
+    def disconnect(self, client, reason = None):
+        if client.sock is None:
+            return
+        self.clients.pop(client.sock.fileno(), None)
+        self.selector.unregister(client.sock)
+        client.sock.close()
+        client.sock = None
+        self.disconnects = self.disconnects + 1
+        self.logger.info("Client {} disconnected{} ({} lines sent, {} dropped)".format(client.name, "" if reason is None else ": {}".format(reason), client.sent, client.dropped))
+
+    def receive(self, client):
+        try:
+            data = client.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self.disconnect(client, str(e))
+            return
+        if not data:
+            self.disconnect(client)
+            return
+
+        client.rxBuffer = client.rxBuffer + data
+        while client.sock is not None:
+            pos = client.rxBuffer.find(b'\n')
+            if pos < 0:
+                if len(client.rxBuffer) > FANOUT_MAX_LINE:
+                    self.disconnect(client, "Request too long")
+                return
+            line = client.rxBuffer[:pos].strip()
+            client.rxBuffer = client.rxBuffer[pos+1:]
+            if len(line) == 0:
+                continue
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                self.reply(client, None, False, error = "Invalid request")
+                continue
+            if not isinstance(msg, dict):
+                self.reply(client, None, False, error = "Invalid request")
+                continue
+            self.request(client, msg)
+
+    def enqueue(self, client, line):
+        if client.sock is None:
+            return
+        client.queue.append(line)
+        client.queueBytes = client.queueBytes + len(line)
+        while (len(client.queue) > self.maxMessages) or (client.queueBytes > self.maxBytes):
+            if self.policy == self.POLICY_DISCONNECT:
+                self.disconnect(client, "Queue overflow")
+                return
+            # A partially sent line is completed so the stream stays intact
+            if client.partial:
+                dropped = client.queue[1]
+                del client.queue[1]
+            else:
+                dropped = client.queue.popleft()
+            client.queueBytes = client.queueBytes - len(dropped)
+            client.dropped = client.dropped + 1
+
+    def flush(self, client):
+        # Sends as much as the socket accepts without blocking. Clients with
+        # remaining data are watched for writability
+        while len(client.queue) > 0:
+            line = client.queue[0]
+            try:
+                n = client.sock.send(line)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                self.disconnect(client, str(e))
+                return
+            client.queueBytes = client.queueBytes - n
+            if n < len(line):
+                client.queue[0] = line[n:]
+                client.partial = True
+                break
+            client.queue.popleft()
+            client.partial = False
+            client.sent = client.sent + 1
+
+        writing = len(client.queue) > 0
+        if writing != client.writing:
+            client.writing = writing
+            self.selector.modify(client.sock, (selectors.EVENT_READ | selectors.EVENT_WRITE) if writing else selectors.EVENT_READ, client)
+
+    def stats(self):
+        return {
+            "frames"        : self.frames,
+            "clients"       : len(self.clients),
+            "disconnects"   : self.disconnects,
+            "requests"      : len(self.requests) + (1 if self.inflight is not None else 0),
+            "dropped"       : sum(client.dropped for client in self.clients.values())
+        }
+
+def pfeifferFanoutCLI():
+    ap = argparse.ArgumentParser(description = 'Share one RS485 bus with many local clients via TCP or a Unix domain socket')
+    ap.add_argument('-p', '--port', type=str, required=False, default="/dev/ttyU0", help="Serial port to be used to access the RS485 bus")
+    ap.add_argument('-s', '--simfile', type=str, required=False, default=None, help="Simulation file. One can supply a JSON dump or binary capture that should be replayed instead of a real serial port")
+    ap.add_argument('--simspeed', type=float, required=False, default=1.0, help="Replay the simulation file at the given multiple of real time")
+    ap.add_argument('-d', '--device', type=str, required=False, default=None, action='append', help="Adds a device registerset to a given address (ADR:DEVTYPE). Can be used multiple times")
+    ap.add_argument('--regfile', type=str, required=False, default=None, action='append', help="Loads an additional register set definition (JSON or TOML) that can be used with --device. Can be used multiple times")
+    ap.add_argument('--listen', type=str, required=False, default=None, help="TCP address to listen on (HOST:PORT, default 127.0.0.1:4170 unless --unix is given)")
+    ap.add_argument('--unix', type=str, required=False, default=None, help="Path of a Unix domain socket to listen on")
+    ap.add_argument('--maxmessages', type=int, required=False, default=1000, help="Maximum number of lines queued per client")
+    ap.add_argument('--maxbytes', type=int, required=False, default=262144, help="Maximum number of bytes queued per client")
+    ap.add_argument('--policy', type=str, required=False, default="dropoldest", choices=[ "dropoldest", "disconnect" ], help="What happens when the queue of a slow client overflows")
+    ap.add_argument('--timeout', type=float, required=False, default=1.0, help="Time in seconds after which a query or write request of a client fails without response")
+    args = ap.parse_args()
+
+    logging.basicConfig(level = logging.INFO, format = "%(asctime)s %(message)s")
+
+    if args.regfile:
+        for regfile in args.regfile:
+            try:
+                loadRegisterFile(regfile)
+            except (OSError, SerialProtocolViolation) as e:
+                print(e)
+                exit(1)
+
+    regsets = { }
+    if args.device:
+        for devspec in args.device:
+            devspecparts = devspec.split(':')
+            if len(devspecparts) != 2:
+                print("Invalid device address : name specification {}".format(devspec))
+                exit(1)
+            try:
+                regsets[int(devspecparts[0])] = devspecparts[1]
+            except ValueError:
+                print("Invalid device address {}".format(devspecparts[0]))
+                exit(1)
+
+    tcp = None
+    if (args.listen is not None) or (args.unix is None):
+        listenspec = args.listen if args.listen is not None else "127.0.0.1:4170"
+        host, _, tcpPort = listenspec.rpartition(':')
+        try:
+            tcp = ( host, int(tcpPort) )
+        except ValueError:
+            print("Invalid listen address {}".format(listenspec))
+            exit(1)
+
+    try:
+        port = PfeifferRS485Serial(args.port, regsets, simulationfile = args.simfile, rawsimulationdump = False, pollingAsync = True, simulationspeed = args.simspeed)
+    except SerialProtocolViolation as e:
+        print(e)
+        exit(1)
+
+    with port:
+        try:
+            server = PfeifferFanoutServer(port, tcp = tcp, unixPath = args.unix, maxMessages = args.maxmessages, maxBytes = args.maxbytes, policy = args.policy, requestTimeout = args.timeout)
+        except (OSError, ValueError) as e:
+            print(e)
+            exit(1)
+        with server:
+            # SIGTERM stops the server so the Unix domain socket is removed
+            signal.signal(signal.SIGTERM, lambda *args: server.stop())
+            print("Serving {} on {}".format(args.port if not args.simfile else args.simfile, ", ".join(str(adr) for adr in server.addresses())))
+            try:
+                server.serve()
+            except KeyboardInterrupt:
+                print("\r", end="")
+                print("Exiting ...")
+            except port.portExceptions as e:
+                print("Serial port {} failed: {}".format(args.port, e))
+            print(server.stats())
+
+if __name__ == "__main__":
+    pfeifferFanoutCLI()
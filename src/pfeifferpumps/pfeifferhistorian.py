@@ -0,0 +1,350 @@
+import argparse
+import json
+import sqlite3
+import time
+
+from datetime import datetime
+
+from pfeifferpumps.pfeifferreplay import parseTimestamp
+
+# Embedded historian
+#
+# Decoded responses are stored in an SQLite database in WAL mode so queries
+# can run while the sniffer or the MQTT bridge keeps writing. The schema
+# keeps the register metadata once per register:
+#
+#   registers   id, port, address, param, designation, display, unit,
+#               datatype, min, max
+#   samples     register (id), ts (seconds since the epoch), value
+#
+# Samples are stored clustered by their primary key (register, ts) - together
+# with the unique (port, address, param) key of the registers table every
+# range query for a single register reads one contiguous range of the table
+# independent of the size of the database. Values keep their native type
+# (integer, real or text). A second sample of the same register with the
+# identical timestamp is ignored so importing the same data twice does not
+# duplicate it.
+#
+# Samples are collected in memory and written in a single transaction
+# whenever batchSize samples are pending or flushInterval seconds passed
+# since the last commit (checked on write() and pump()), so the write cost
+# per packet is a list append in the common case. In case a commit fails
+# (database locked, disk full, ...) the samples stay pending and the commit is
+# retried every flushInterval seconds. Every failed attempt keeps at most
+# maxPending samples - the oldest ones beyond that are dropped and counted in
+# dropped.
+
+SCHEMA_VERSION = 1
+
+# Datatypes that decode into numbers (or booleans) and can be aggregated
+HISTORIAN_NUMERIC_DATATYPES = ( 0, 1, 2, 3, 6, 7, 10 )
+
+# Downsampling runs one aggregate query per bucket (each one a range of the
+# clustered table) up to this number of buckets and a single grouped query
+# otherwise - the latter has to sort all samples of the range
+DOWNSAMPLE_BUCKET_QUERIES = 10000
+
+NUMERIC_VALUE = "CASE WHEN typeof(value) IN ('integer', 'real') THEN value END"
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS registers (id INTEGER PRIMARY KEY, port TEXT NOT NULL, address INTEGER NOT NULL, param INTEGER NOT NULL, designation TEXT, display TEXT, unit TEXT, datatype INTEGER, min REAL, max REAL, UNIQUE (port, address, param))",
+    "CREATE TABLE IF NOT EXISTS samples (register INTEGER NOT NULL, ts REAL NOT NULL, value, PRIMARY KEY (register, ts)) WITHOUT ROWID"
+)
+
+class PfeifferHistorian:
+    def __init__(self, filename, batchSize = 1000, flushInterval = 1.0, readOnly = False, maxPending = 100000):
+        self.filename = filename
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self.maxPending = maxPending
+        self.readOnly = readOnly
+
+        if readOnly:
+            self.db = sqlite3.connect("file:{}?mode=ro".format(filename), uri = True)
+        else:
+            self.db = sqlite3.connect(filename)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            version = self.db.execute("PRAGMA user_version").fetchone()[0]
+            if version > SCHEMA_VERSION:
+                self.db.close()
+                raise ValueError("Historian database {} has unsupported schema version {}".format(filename, version))
+            with self.db:
+                for statement in SCHEMA:
+                    self.db.execute(statement)
+                self.db.execute("PRAGMA user_version={}".format(SCHEMA_VERSION))
+
+        # Register ids by (port, address, param) together with the register
+        # definition they have been stored with
+        self.registerIds = { }
+        self.pending = [ ]
+        self.lastFlush = time.monotonic()
+        self.written = 0
+        self.dropped = 0
+        self.failures = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.db is None:
+            return
+        try:
+            if not self.readOnly:
+                self.flush()
+        finally:
+            self.db.close()
+            self.db = None
+
+    def registerId(self, port, address, param, register):
+        key = ( port, address, param )
+        cached = self.registerIds.get(key)
+        if (cached is not None) and (cached[1] is register):
+            return cached[0]
+
+        if register is not None:
+            metadata = ( register.designation, register.display, register.unit, register.datatype, register.min, register.max )
+        else:
+            metadata = ( None, None, None, None, None, None )
+        row = self.db.execute("SELECT id, designation, display, unit, datatype, min, max FROM registers WHERE port = ? AND address = ? AND param = ?", key).fetchone()
+        with self.db:
+            if row is None:
+                regId = self.db.execute("INSERT INTO registers (port, address, param, designation, display, unit, datatype, min, max) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", key + metadata).lastrowid
+            else:
+                regId = row[0]
+                if (register is not None) and (tuple(row[1:]) != metadata):
+                    self.db.execute("UPDATE registers SET designation = ?, display = ?, unit = ?, datatype = ?, min = ?, max = ? WHERE id = ?", metadata + ( regId, ))
+        self.registerIds[key] = ( regId, register )
+        return regId
+
+    def write(self, packet, port = ""):
+        # Stores a response. Queries are ignored. Responses of unknown
+        # registers are stored with their raw payload, structured values
+        # (tms_old) as JSON
+        if packet.action != 1:
+            return False
+        register = packet.register
+        if register is not None:
+            value = packet.payload
+            if isinstance(value, bool):
+                value = int(value)
+            elif isinstance(value, dict):
+                value = json.dumps(value)
+        else:
+            value = packet.payloadRaw
+        rxTime = packet.rxTime if packet.rxTime is not None else time.time()
+
+        self.pending.append(( self.registerId(port or "", packet.address, packet.param, register), rxTime, value ))
+        if (len(self.pending) >= self.batchSize) and (self.failures == 0):
+            self.flush()
+        else:
+            self.pump()
+        return True
+
+    def pump(self):
+        # Writes pending samples in case the flush interval has passed
+        if (len(self.pending) > 0) and (time.monotonic() - self.lastFlush >= self.flushInterval):
+            self.flush()
+
+    def nextFlush(self):
+        # Monotonic time at which pending samples are due or None
+        if len(self.pending) == 0:
+            return None
+        return self.lastFlush + self.flushInterval
+
+    def flush(self):
+        self.lastFlush = time.monotonic()
+        if len(self.pending) == 0:
+            return
+        try:
+            with self.db:
+                self.db.executemany("INSERT OR IGNORE INTO samples (register, ts, value) VALUES (?, ?, ?)", self.pending)
+        except sqlite3.Error:
+            # Kept for the next attempt (after flushInterval) up to maxPending
+            self.failures = self.failures + 1
+            excess = len(self.pending) - self.maxPending
+            if excess > 0:
+                del self.pending[:excess]
+                self.dropped = self.dropped + excess
+            raise
+        self.failures = 0
+        self.written = self.written + len(self.pending)
+        self.pending = [ ]
+
+    # Queries
+
+    def registers(self):
+        # Returns a list of dictionaries describing all stored registers
+        res = [ ]
+        for row in self.db.execute("SELECT id, port, address, param, designation, display, unit, datatype, min, max FROM registers ORDER BY port, address, param"):
+            res.append({
+                "id"            : row[0],
+                "port"          : row[1],
+                "address"       : row[2],
+                "param"         : row[3],
+                "designation"   : row[4],
+                "display"       : row[5],
+                "unit"          : row[6],
+                "datatype"      : row[7],
+                "min"           : row[8],
+                "max"           : row[9]
+            })
+        return res
+
+    def findRegisters(self, address, param, port = None):
+        # Resolves ( id, datatype ) of (address, param) on the given port or
+        # on all ports. param may also be the designation or display name
+        if isinstance(param, str) and not param.isdigit():
+            condition = "(designation = ? OR display = ?)"
+            values = [ address, param, param ]
+        else:
+            condition = "param = ?"
+            values = [ address, int(param) ]
+        sql = "SELECT id, datatype FROM registers WHERE address = ? AND " + condition
+        if port is not None:
+            sql = sql + " AND port = ?"
+            values.append(port)
+        return self.db.execute(sql, values).fetchall()
+
+    def rangeCondition(self, registerIds, start, end):
+        condition = "register IN ({})".format(", ".join("?" * len(registerIds)))
+        values = list(registerIds)
+        if start is not None:
+            condition = condition + " AND ts >= ?"
+            values.append(start)
+        if end is not None:
+            condition = condition + " AND ts < ?"
+            values.append(end)
+        return condition, values
+
+    def query(self, address, param, start = None, end = None, port = None, limit = None):
+        # Returns ( ts, value ) of all samples of a register in [start, end)
+        registerIds = [ row[0] for row in self.findRegisters(address, param, port) ]
+        if len(registerIds) == 0:
+            return [ ]
+        condition, values = self.rangeCondition(registerIds, start, end)
+        sql = "SELECT ts, value FROM samples WHERE {} ORDER BY ts".format(condition)
+        if limit is not None:
+            sql = sql + " LIMIT ?"
+            values.append(int(limit))
+        return self.db.execute(sql, values).fetchall()
+
+    def timeRange(self, registerIds):
+        # First and last timestamp of the given registers (two lookups in
+        # the primary key per register)
+        first = None
+        last = None
+        for regId in registerIds:
+            row = self.db.execute("SELECT (SELECT MIN(ts) FROM samples WHERE register = ?), (SELECT MAX(ts) FROM samples WHERE register = ?)", ( regId, regId )).fetchone()
+            if row[0] is None:
+                continue
+            first = row[0] if (first is None) or (row[0] < first) else first
+            last = row[1] if (last is None) or (row[1] > last) else last
+        return first, last
+
+    def downsample(self, address, param, bucket, start = None, end = None, port = None):
+        # Returns ( bucketStart, count, min, max, mean ) for buckets of the
+        # given length (seconds, aligned to multiples of the bucket length).
+        # Non numeric values are only counted
+        registers = self.findRegisters(address, param, port)
+        if len(registers) == 0:
+            return [ ]
+        registerIds = [ row[0] for row in registers ]
+        value = "value"
+        for regId, datatype in registers:
+            if not datatype in HISTORIAN_NUMERIC_DATATYPES:
+                value = NUMERIC_VALUE
+
+        first, last = self.timeRange(registerIds)
+        if first is None:
+            return [ ]
+        if start is not None:
+            first = max(first, start)
+        if end is not None:
+            last = min(last, end)
+        if first > last:
+            return [ ]
+
+        firstBucket = int(first // bucket)
+        lastBucket = int(last // bucket)
+        res = [ ]
+        if lastBucket - firstBucket < DOWNSAMPLE_BUCKET_QUERIES:
+            sql = "SELECT COUNT(*), MIN({0}), MAX({0}), AVG({0}) FROM samples WHERE register IN ({1}) AND ts >= ? AND ts < ?".format(value, ", ".join("?" * len(registerIds)))
+            for b in range(firstBucket, lastBucket + 1):
+                bucketStart = b * bucket
+                bucketEnd = bucketStart + bucket
+                if (start is not None) and (bucketStart < start):
+                    bucketStart = start
+                if (end is not None) and (bucketEnd > end):
+                    bucketEnd = end
+                row = self.db.execute(sql, registerIds + [ bucketStart, bucketEnd ]).fetchone()
+                if row[0] > 0:
+                    res.append(( b * bucket, ) + tuple(row))
+        else:
+            condition, values = self.rangeCondition(registerIds, start, end)
+            sql = "SELECT CAST(ts / ? AS INTEGER) AS b, COUNT(*), MIN({0}), MAX({0}), AVG({0}) FROM samples WHERE {1} GROUP BY b ORDER BY b".format(value, condition)
+            for row in self.db.execute(sql, [ bucket ] + values):
+                res.append(( row[0] * bucket, row[1], row[2], row[3], row[4] ))
+        return res
+
+def pfeifferHistoryCLI():
+    ap = argparse.ArgumentParser(description = 'Query the Pfeiffer RS485 historian database (see pfeiffersniff --historian)')
+    ap.add_argument('database', type=str, help="Historian database")
+    ap.add_argument('-r', '--register', type=str, required=False, default=None, help="Register to query (ADR:PARAM, the parameter can also be given by designation)")
+    ap.add_argument('--port', type=str, required=False, default=None, help="Only query the register on the given port")
+    ap.add_argument('--start', type=str, required=False, default=None, help="Start of the time range (YYYY-MM-DD HH:MM:SS or seconds since the epoch)")
+    ap.add_argument('--end', type=str, required=False, default=None, help="End of the time range (YYYY-MM-DD HH:MM:SS or seconds since the epoch)")
+    ap.add_argument('--last', type=float, required=False, default=None, help="Query the last LAST seconds instead of --start")
+    ap.add_argument('--bucket', type=float, required=False, default=None, help="Downsample into buckets of the given length in seconds (count, min, max, mean)")
+    ap.add_argument('--limit', type=int, required=False, default=None, help="Maximum number of samples")
+    ap.add_argument('--json', action='store_true', help="Output JSON lines instead of text")
+    args = ap.parse_args()
+
+    try:
+        historian = PfeifferHistorian(args.database, readOnly = True)
+    except sqlite3.Error as e:
+        print("Failed to open historian database {}: {}".format(args.database, e))
+        exit(1)
+
+    with historian:
+        if not args.register:
+            for reg in historian.registers():
+                if args.json:
+                    print(json.dumps(reg))
+                else:
+                    print("{:10s} {:3d} {:3d} {:16s} {}".format(reg['port'], reg['address'], reg['param'], reg['designation'] or "", reg['unit'] or ""))
+            return
+
+        regspecparts = args.register.split(':')
+        try:
+            if len(regspecparts) != 2:
+                raise ValueError("Invalid register specification {}".format(args.register))
+            address = int(regspecparts[0])
+            start = parseTimestamp(args.start) if args.start is not None else None
+            end = parseTimestamp(args.end) if args.end is not None else None
+            if args.last is not None:
+                start = (end if end is not None else time.time()) - args.last
+            if (args.bucket is not None) and (args.bucket <= 0):
+                raise ValueError("Bucket length has to be positive")
+        except ValueError as e:
+            print(e)
+            exit(1)
+
+        if args.bucket is not None:
+            for bucketStart, count, minValue, maxValue, mean in historian.downsample(address, regspecparts[1], args.bucket, start, end, args.port):
+                if args.json:
+                    print(json.dumps({ "start" : bucketStart, "end" : bucketStart + args.bucket, "count" : count, "min" : minValue, "max" : maxValue, "mean" : mean }))
+                else:
+                    print("{} count {} min {} max {} mean {}".format(datetime.fromtimestamp(bucketStart), count, minValue, maxValue, mean))
+        else:
+            for ts, value in historian.query(address, regspecparts[1], start, end, args.port, args.limit):
+                if args.json:
+                    print(json.dumps({ "timestamp" : ts, "value" : value }))
+                else:
+                    print("{} {}".format(datetime.fromtimestamp(ts), value))
+
+if __name__ == "__main__":
+    pfeifferHistoryCLI()
@@ -0,0 +1,307 @@
+import bisect
+import threading
+
+# Runtime metrics (counters, gauges and histograms)
+#
+# Metrics are organized in families (name, type, help text and label names).
+# Every combination of label values is a child that is created once and then
+# updated by plain attribute arithmetic - hot paths keep references to their
+# children so an update is a single addition (or a bisect for histograms).
+# Updates are not locked; readers (the HTTP endpoint, the MQTT stats topic)
+# may observe a histogram while it is updated which is fine for monitoring.
+#
+# The registry renders all metrics in the Prometheus text exposition format
+# (optionally served by a small local HTTP server) or as a dictionary that is
+# published periodically as JSON on an MQTT stats topic. Collector callbacks
+# are invoked before rendering to update values that are cheaper to sample
+# than to track (queue lengths, ...).
+
+LATENCY_BUCKETS = ( 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5 )
+DECODE_BUCKETS = ( 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001 )
+INTERARRIVAL_BUCKETS = ( 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0 )
+
+class PfeifferCounterValue:
+    __slots__ = ( "value", )
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount = 1):
+        self.value = self.value + amount
+
+    def set(self, value):
+        self.value = value
+
+class PfeifferHistogramValue:
+    __slots__ = ( "bounds", "counts", "sum", "count" )
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [ 0 ] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum = self.sum + value
+        self.count = self.count + 1
+
+class PfeifferMetricFamily:
+    TYPE_COUNTER = "counter"
+    TYPE_GAUGE = "gauge"
+    TYPE_HISTOGRAM = "histogram"
+
+    def __init__(self, name, kind, helpText, labelNames = (), buckets = None):
+        self.name = name
+        self.kind = kind
+        self.helpText = helpText
+        self.labelNames = tuple(labelNames)
+        self.buckets = tuple(buckets) if buckets is not None else None
+        self.children = { }
+
+    def labels(self, *labelValues):
+        child = self.children.get(labelValues)
+        if child is None:
+            if len(labelValues) != len(self.labelNames):
+                raise ValueError("Metric {} requires labels {}".format(self.name, self.labelNames))
+            if self.kind == self.TYPE_HISTOGRAM:
+                child = PfeifferHistogramValue(self.buckets)
+            else:
+                child = PfeifferCounterValue()
+            self.children[labelValues] = child
+        return child
+
+    @staticmethod
+    def formatLabels(names, values, extra = None):
+        labels = [ '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in zip(names, values) ]
+        if extra is not None:
+            labels.append(extra)
+        if len(labels) == 0:
+            return ""
+        return "{" + ",".join(labels) + "}"
+
+    @staticmethod
+    def formatValue(value):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(float(value)) if isinstance(value, float) else str(value)
+
+    def exposition(self):
+        lines = [ "# HELP {} {}".format(self.name, self.helpText), "# TYPE {} {}".format(self.name, self.kind) ]
+        for labelValues, child in list(self.children.items()):
+            if self.kind == self.TYPE_HISTOGRAM:
+                cumulative = 0
+                for bound, count in zip(self.buckets + ( float("inf"), ), child.counts):
+                    cumulative = cumulative + count
+                    lines.append("{}_bucket{} {}".format(self.name, self.formatLabels(self.labelNames, labelValues, 'le="{}"'.format(self.formatValue(bound))), cumulative))
+                lines.append("{}_sum{} {}".format(self.name, self.formatLabels(self.labelNames, labelValues), self.formatValue(child.sum)))
+                lines.append("{}_count{} {}".format(self.name, self.formatLabels(self.labelNames, labelValues), child.count))
+            else:
+                lines.append("{}{} {}".format(self.name, self.formatLabels(self.labelNames, labelValues), self.formatValue(child.value)))
+        return lines
+
+    def snapshot(self):
+        res = [ ]
+        for labelValues, child in list(self.children.items()):
+            entry = { "labels" : dict(zip(self.labelNames, labelValues)) }
+            if self.kind == self.TYPE_HISTOGRAM:
+                entry["count"] = child.count
+                entry["sum"] = child.sum
+                entry["buckets"] = { self.formatValue(bound) : count for bound, count in zip(self.buckets + ( float("inf"), ), child.counts) }
+            else:
+                entry["value"] = child.value
+            res.append(entry)
+        return res
+
+class PfeifferMetrics:
+    def __init__(self):
+        self.families = { }
+        self.collectors = [ ]
+        self.httpServer = None
+        self.httpThread = None
+
+    def family(self, name, kind, helpText, labelNames = (), buckets = None):
+        fam = self.families.get(name)
+        if fam is None:
+            fam = PfeifferMetricFamily(name, kind, helpText, labelNames, buckets)
+            self.families[name] = fam
+        elif fam.kind != kind:
+            raise ValueError("Metric {} already registered as {}".format(name, fam.kind))
+        return fam
+
+    def counter(self, name, helpText, labelNames = ()):
+        return self.family(name, PfeifferMetricFamily.TYPE_COUNTER, helpText, labelNames)
+
+    def gauge(self, name, helpText, labelNames = ()):
+        return self.family(name, PfeifferMetricFamily.TYPE_GAUGE, helpText, labelNames)
+
+    def histogram(self, name, helpText, labelNames = (), buckets = LATENCY_BUCKETS):
+        return self.family(name, PfeifferMetricFamily.TYPE_HISTOGRAM, helpText, labelNames, buckets)
+
+    def addCollector(self, callback):
+        # The callback is invoked (without arguments) before metrics are rendered
+        self.collectors.append(callback)
+
+    def removeCollector(self, callback):
+        if callback in self.collectors:
+            self.collectors.remove(callback)
+
+    def collect(self):
+        for collector in list(self.collectors):
+            try:
+                collector()
+            except Exception:
+                pass
+
+    def exposition(self):
+        # Prometheus text exposition format
+        self.collect()
+        lines = [ ]
+        for fam in list(self.families.values()):
+            lines.extend(fam.exposition())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        self.collect()
+        return { name : fam.snapshot() for name, fam in list(self.families.items()) }
+
+    # Local HTTP endpoint
+
+    def serve(self, host = "127.0.0.1", port = 9101):
+        if self.httpServer is not None:
+            return
+        metrics = self
+
+        # http.server pulls in a considerable part of the standard library
+        # and is only imported when the endpoint is actually enabled
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        from socketserver import ThreadingMixIn
+
+        class MetricsHTTPServer(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ( "/", "/metrics" ):
+                    self.send_error(404)
+                    return
+                body = metrics.exposition().encode("UTF-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpServer = MetricsHTTPServer(( host, port ), MetricsRequestHandler)
+        self.httpThread = threading.Thread(target = self.httpServer.serve_forever, daemon = True)
+        self.httpThread.start()
+
+    def stopServing(self):
+        if self.httpServer is None:
+            return
+        self.httpServer.shutdown()
+        self.httpServer.server_close()
+        self.httpThread.join()
+        self.httpServer = None
+        self.httpThread = None
+
+# Metrics of a single serial port. PfeifferRS485Serial calls these from its
+# receive path. Children per device address are created on first use and
+# cached together with the state required for inter arrival times
+
+class PfeifferPortMetrics:
+    def __init__(self, metrics, portName):
+        self.metrics = metrics
+        self.portName = portName
+
+        self.bytesReceived = metrics.counter("pfeiffer_bytes_received_total", "Bytes received from the bus", ( "port", )).labels(portName)
+        self.violations = metrics.counter("pfeiffer_protocol_violations_total", "Frames with checksum or framing violations", ( "port", )).labels(portName)
+        self.decodeTime = metrics.histogram("pfeiffer_decode_seconds", "Time required to decode a frame", ( "port", ), DECODE_BUCKETS).labels(portName)
+        self.reconnects = metrics.counter("pfeiffer_port_reconnects_total", "Number of times the port has been reopened", ( "port", )).labels(portName)
+
+        self.framesFamily = metrics.counter("pfeiffer_frames_received_total", "Frames received from the bus", ( "port", "address" ))
+        self.unknownFamily = metrics.counter("pfeiffer_unknown_registers_total", "Frames referencing registers unknown to the register set", ( "port", "address" ))
+        self.interarrivalFamily = metrics.histogram("pfeiffer_frame_interarrival_seconds", "Time between two frames of the same device", ( "port", "address" ), INTERARRIVAL_BUCKETS)
+        self.latencyFamily = metrics.histogram("pfeiffer_response_latency_seconds", "Time between a query and the matching response", ( "port", "address" ), LATENCY_BUCKETS)
+
+        self.addresses = { }
+        self.pendingQueries = { }
+
+    def address(self, address):
+        entry = self.addresses.get(address)
+        if entry is None:
+            label = str(address)
+            entry = [
+                self.framesFamily.labels(self.portName, label),
+                self.unknownFamily.labels(self.portName, label),
+                self.interarrivalFamily.labels(self.portName, label),
+                self.latencyFamily.labels(self.portName, label),
+                None
+            ]
+            self.addresses[address] = entry
+        return entry
+
+    def frameReceived(self, packet, decodeTime):
+        entry = self.address(packet.address)
+        entry[0].value += 1
+        self.decodeTime.observe(decodeTime)
+
+        now = packet.rxMonotonic
+        if now is None:
+            return
+        if entry[4] is not None:
+            entry[2].observe(now - entry[4])
+        entry[4] = now
+
+        key = ( packet.address, packet.param )
+        if packet.action == 0:
+            self.pendingQueries[key] = now
+        else:
+            sent = self.pendingQueries.pop(key, None)
+            if sent is not None:
+                entry[3].observe(now - sent)
+
+    def querySent(self, address, param, txMonotonic):
+        self.pendingQueries[( address, param )] = txMonotonic
+
+    def unknownRegister(self, address):
+        self.address(address)[1].value += 1
+
+class PfeifferPublisherMetrics:
+    # Metrics of the MQTT publishing stage. Queue state is sampled by a
+    # collector, publish latency is observed from the paho callback
+    def __init__(self, metrics, publisher):
+        self.metrics = metrics
+        self.publisher = publisher
+        self.queueMessages = metrics.gauge("pfeiffer_mqtt_queue_messages", "Messages waiting in the MQTT outbound queue").labels()
+        self.queueBytes = metrics.gauge("pfeiffer_mqtt_queue_bytes", "Bytes waiting in the MQTT outbound queue").labels()
+        self.inflight = metrics.gauge("pfeiffer_mqtt_inflight_messages", "Messages handed to the MQTT client that are not acknowledged").labels()
+        self.sent = metrics.counter("pfeiffer_mqtt_published_total", "Messages published via MQTT").labels()
+        self.dropped = metrics.counter("pfeiffer_mqtt_dropped_total", "Messages dropped due to the outbound queue limits").labels()
+        self.errors = metrics.counter("pfeiffer_mqtt_publish_errors_total", "Failed publish attempts").labels()
+        self.latency = metrics.histogram("pfeiffer_mqtt_publish_latency_seconds", "Time between handing a message to the MQTT client and its acknowledgement").labels()
+        self.reconnects = metrics.counter("pfeiffer_mqtt_reconnects_total", "Number of reconnects to the MQTT broker").labels()
+
+        # Counters continue where a previous publisher (before a configuration
+        # reload) stopped
+        self.baseSent = self.sent.value
+        self.baseDropped = self.dropped.value
+        self.baseErrors = self.errors.value
+        metrics.addCollector(self.collect)
+
+    def collect(self):
+        stats = self.publisher.stats()
+        self.queueMessages.value = stats["queuelength"]
+        self.queueBytes.value = stats["queuebytes"]
+        self.inflight.value = stats["inflight"]
+        self.sent.value = self.baseSent + stats["sent"]
+        self.dropped.value = self.baseDropped + stats["dropped"]
+        self.errors.value = self.baseErrors + stats["errors"]
+
+    def close(self):
+        self.collect()
+        self.metrics.removeCollector(self.collect)
@@ -0,0 +1,104 @@
+import os
+import selectors
+
+# Event driven servicing of several RS485 ports
+#
+# All ports (opened with pollingAsync = True) are registered with a single
+# selector (epoll, kqueue, ... whatever is available) and wait() blocks until
+# at least one of them has received data. Simulated ports have no file
+# descriptor that signals new data - for them the time until the next record
+# of the replay is due is used as timeout. A self pipe allows other threads
+# (the MQTT network thread) and signal handlers to interrupt the wait.
+#
+# Callers read frames from the returned ports until nextMessage() returns
+# None. To keep latency bounded on busy buses a caller may stop after a batch
+# of frames and mark the port as pending - pending ports are returned by the
+# next wait() without blocking.
+
+class PfeifferPortMultiplexer:
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.ports = { }
+        self.simulated = { }
+        self.pending = set()
+
+        self.wakeupRead, self.wakeupWrite = os.pipe()
+        os.set_blocking(self.wakeupRead, False)
+        os.set_blocking(self.wakeupWrite, False)
+        self.selector.register(self.wakeupRead, selectors.EVENT_READ, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.ports)
+
+    def close(self):
+        if self.selector is None:
+            return
+        self.selector.close()
+        self.selector = None
+        os.close(self.wakeupRead)
+        os.close(self.wakeupWrite)
+
+    def addPort(self, name, port):
+        self.ports[name] = port
+        if port.pollDelay() is None:
+            self.selector.register(port.fileno(), selectors.EVENT_READ, name)
+        else:
+            self.simulated[name] = port
+        # The receive buffer may already hold complete frames
+        self.pending.add(name)
+
+    def removePort(self, name):
+        port = self.ports.pop(name, None)
+        if port is None:
+            return
+        if self.simulated.pop(name, None) is None:
+            self.selector.unregister(port.fileno())
+        self.pending.discard(name)
+
+    def setPending(self, name):
+        if name in self.ports:
+            self.pending.add(name)
+
+    def wakeup(self):
+        # Interrupts wait(). Safe to call from other threads and from signal
+        # handlers
+        try:
+            os.write(self.wakeupWrite, b'\0')
+        except (BlockingIOError, OSError):
+            # Pipe full (a wakeup is pending anyway) or already closed
+            pass
+
+    def wait(self, timeout = None):
+        # Returns a list of ( name, port ) for all ports that have data (or
+        # a due simulated record). Returns an empty list on timeout or wakeup
+        if len(self.pending) > 0:
+            timeout = 0
+
+        for port in self.simulated.values():
+            delay = port.pollDelay()
+            if (timeout is None) or (delay < timeout):
+                timeout = delay
+
+        ready = self.pending
+        self.pending = set()
+        for key, mask in self.selector.select(timeout):
+            if key.data is None:
+                try:
+                    while os.read(self.wakeupRead, 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+            else:
+                ready.add(key.data)
+
+        for name, port in self.simulated.items():
+            if port.pollDelay() <= 0:
+                ready.add(name)
+
+        return [ ( name, port ) for name, port in self.ports.items() if name in ready ]
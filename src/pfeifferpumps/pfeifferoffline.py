@@ -0,0 +1,355 @@
+import argparse
+import heapq
+import json
+import mmap
+import os
+import sys
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pfeifferpumps.pfeifferproto import PfeifferProtocol, SerialProtocolViolation, SerialProtocolUnknownRegister
+from pfeifferpumps.pfeiffercapture import BLOCK_HEADER, FILE_MAGIC, TAG_DATA, PfeifferCaptureReader, decodeDataBlock
+from pfeifferpumps.pfeifferreplay import parseJsonRecord
+from pfeifferpumps.pfeifferregisterfile import loadRegisterFile
+
+# Parallel offline decoding of captures
+#
+# Captures (JSON dumps as well as binary captures) are split into chunks on
+# frame boundaries - JSON dumps at the first line break after every chunkSize
+# bytes, binary captures on block boundaries. The chunks are decoded by a
+# process pool, every worker process compiles the register sets once.
+#
+# Files are grouped into streams of files that do not overlap in time (for
+# example all files captured from one port). Chunks of a stream are already in
+# timestamp order, the streams are merged by timestamp. Only a bounded number
+# of chunks per stream is in flight at any time so memory usage does not grow
+# with the size of the captures.
+
+DEFAULT_CHUNKSIZE = 4 * 1048576
+
+# Worker process state
+
+workerProto = None
+workerRegsets = None
+
+def workerInit(registersets, registerFiles = None):
+    global workerProto
+    global workerRegsets
+    # Workers do not necessarily inherit the register sets of the parent
+    # (spawned processes) - external definitions are loaded again (from the
+    # cache that has been filled by the parent)
+    for registerFile in registerFiles or [ ]:
+        loadRegisterFile(registerFile)
+    workerProto = PfeifferProtocol()
+    workerRegsets = workerProto.compileAddressMap(registersets)
+
+def workerRecords(chunk):
+    filename, kind, start, end = chunk
+    with open(filename, "rb") as f:
+        if kind == "json":
+            f.seek(start)
+            data = f.read(end - start)
+            for line in data.split(b'\n'):
+                record = parseJsonRecord(line)
+                if record is not None:
+                    yield record
+        else:
+            f.seek(start)
+            data = f.read(end - start)
+            pos = 0
+            while pos + BLOCK_HEADER.size <= len(data):
+                tag, flags, length, records, firstTs, lastTs = BLOCK_HEADER.unpack_from(data, pos)
+                pos = pos + BLOCK_HEADER.size
+                if tag == TAG_DATA:
+                    for record in decodeDataBlock(flags, data[pos:pos + length], records):
+                        yield record
+                pos = pos + length
+
+def workerDecodePacket(record, stats):
+    # Decodes a single record. Returns the packet or None for corrupted frames
+    timestampNs, portId, frame = record
+    try:
+        packet = workerProto.decodeFrame(frame, timestampNs / 1e9)
+    except SerialProtocolViolation:
+        stats["violations"] = stats["violations"] + 1
+        return None
+    regset = workerRegsets.get(packet.address)
+    if regset is not None:
+        try:
+            regset.decode(packet)
+        except SerialProtocolUnknownRegister:
+            stats["unknown"] = stats["unknown"] + 1
+        except SerialProtocolViolation:
+            stats["violations"] = stats["violations"] + 1
+    return packet
+
+def workerDecodeChunk(chunk, noQuery = False):
+    # Returns a list of (timestampNs, JSON line) tuples and the chunk statistics
+    res = [ ]
+    stats = { "frames" : 0, "violations" : 0, "unknown" : 0 }
+    for record in workerRecords(chunk):
+        stats["frames"] = stats["frames"] + 1
+        packet = workerDecodePacket(record, stats)
+        if packet is None:
+            continue
+        if noQuery and (packet.action != 1):
+            continue
+        res.append(( record[0], json.dumps(packet.as_dict()) ))
+    return res, stats
+
+def workerSummarizeChunk(chunk):
+    # Returns per register statistics for the chunk:
+    # (address, param) -> [ count, numeric count, sum, min, max, first ts, last ts, last value ]
+    registers = { }
+    stats = { "frames" : 0, "violations" : 0, "unknown" : 0 }
+    for record in workerRecords(chunk):
+        stats["frames"] = stats["frames"] + 1
+        packet = workerDecodePacket(record, stats)
+        if (packet is None) or (packet.action != 1):
+            continue
+
+        value = packet.payload if packet.register is not None else packet.payloadRaw
+        key = ( packet.address, packet.param )
+        entry = registers.get(key)
+        if entry is None:
+            entry = [ 0, 0, 0.0, None, None, record[0], record[0], value ]
+            registers[key] = entry
+        entry[0] = entry[0] + 1
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            entry[1] = entry[1] + 1
+            entry[2] = entry[2] + value
+            if (entry[3] is None) or (value < entry[3]):
+                entry[3] = value
+            if (entry[4] is None) or (value > entry[4]):
+                entry[4] = value
+        if record[0] >= entry[6]:
+            entry[6] = record[0]
+            entry[7] = value
+        if record[0] < entry[5]:
+            entry[5] = record[0]
+    return registers, stats
+
+# Chunking (main process)
+
+def captureChunks(filename, chunkSize = DEFAULT_CHUNKSIZE):
+    # Returns the list of chunks (filename, kind, start, end) and the time
+    # range (firstTs, lastTs) of the capture in ns
+    size = os.path.getsize(filename)
+    if size == 0:
+        return [ ], None
+
+    with open(filename, "rb") as f:
+        isCapture = f.read(len(FILE_MAGIC)) == FILE_MAGIC
+
+    chunks = [ ]
+    if isCapture:
+        with PfeifferCaptureReader(filename) as reader:
+            index = reader.blockIndex()
+            dataEnd = reader.appendOffset()
+        if len(index) == 0:
+            return [ ], None
+        # Blocks are contiguous apart from index and port blocks which are
+        # skipped by the workers
+        chunkStart = index[0][2]
+        for i in range(1, len(index)):
+            if index[i][2] - chunkStart >= chunkSize:
+                chunks.append(( filename, "capture", chunkStart, index[i][2] ))
+                chunkStart = index[i][2]
+        chunks.append(( filename, "capture", chunkStart, dataEnd ))
+        return chunks, ( index[0][0], index[-1][1] )
+
+    with open(filename, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        try:
+            start = 0
+            while start < size:
+                end = mm.find(b'\n', min(start + chunkSize, size - 1))
+                end = size if end < 0 else end + 1
+                chunks.append(( filename, "json", start, end ))
+                start = end
+
+            firstTs = None
+            pos = 0
+            while (firstTs is None) and (pos < size):
+                lineEnd = mm.find(b'\n', pos)
+                lineEnd = size if lineEnd < 0 else lineEnd
+                record = parseJsonRecord(mm[pos:lineEnd])
+                if record is not None:
+                    firstTs = record[0]
+                pos = lineEnd + 1
+
+            lastTs = None
+            pos = size
+            while (lastTs is None) and (pos > 0):
+                lineStart = mm.rfind(b'\n', 0, pos - 1) + 1
+                record = parseJsonRecord(mm[lineStart:pos])
+                if record is not None:
+                    lastTs = record[0]
+                pos = lineStart
+        finally:
+            mm.close()
+
+    if firstTs is None:
+        return chunks, None
+    return chunks, ( firstTs, lastTs )
+
+def captureStreams(filenames, chunkSize = DEFAULT_CHUNKSIZE):
+    # Partitions the captures into streams of files that do not overlap in
+    # time. Every stream is a list of chunks in timestamp order
+    files = [ ]
+    for filename in filenames:
+        chunks, timeRange = captureChunks(filename, chunkSize)
+        if len(chunks) > 0:
+            files.append(( timeRange if timeRange is not None else ( 0, 0 ), chunks ))
+    files.sort(key = lambda f: f[0][0])
+
+    streams = [ ]
+    for timeRange, chunks in files:
+        for stream in streams:
+            if stream[0] <= timeRange[0]:
+                stream[0] = timeRange[1]
+                stream[1].extend(chunks)
+                break
+        else:
+            streams.append([ timeRange[1], list(chunks) ])
+    return [ stream[1] for stream in streams ]
+
+def decodedStream(executor, chunks, window, noQuery):
+    # Yields the decoded records of a stream in order while keeping at most
+    # window chunks in flight
+    pending = deque()
+    chunkIter = iter(chunks)
+    for chunk in chunkIter:
+        pending.append(executor.submit(workerDecodeChunk, chunk, noQuery))
+        if len(pending) >= window:
+            break
+    while len(pending) > 0:
+        res, stats = pending.popleft().result()
+        chunk = next(chunkIter, None)
+        if chunk is not None:
+            pending.append(executor.submit(workerDecodeChunk, chunk, noQuery))
+        yield stats
+        for record in res:
+            yield record
+
+def mergeStats(total, stats):
+    for key, value in stats.items():
+        total[key] = total.get(key, 0) + value
+
+def decodeCaptures(filenames, registersets, output, jobs = None, chunkSize = DEFAULT_CHUNKSIZE, noQuery = False, registerFiles = None):
+    # Decodes all captures and writes the packets in timestamp order as JSON
+    # lines into the output file object. Returns the statistics
+    total = { "frames" : 0, "violations" : 0, "unknown" : 0, "written" : 0 }
+    streams = captureStreams(filenames, chunkSize)
+    jobs = jobs or os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers = jobs, initializer = workerInit, initargs = ( registersets, registerFiles )) as executor:
+        window = max(2, (2 * jobs) // max(len(streams), 1))
+
+        def records(stream):
+            for item in decodedStream(executor, stream, window, noQuery):
+                if isinstance(item, dict):
+                    mergeStats(total, item)
+                else:
+                    yield item
+
+        for timestampNs, line in heapq.merge(*[ records(stream) for stream in streams ], key = lambda r: r[0]):
+            output.write(line)
+            output.write("\n")
+            total["written"] = total["written"] + 1
+    return total
+
+def summarizeCaptures(filenames, registersets, jobs = None, chunkSize = DEFAULT_CHUNKSIZE, registerFiles = None):
+    # Returns (registers, stats) with per register statistics over all captures
+    total = { "frames" : 0, "violations" : 0, "unknown" : 0 }
+    registers = { }
+    chunks = [ chunk for stream in captureStreams(filenames, chunkSize) for chunk in stream ]
+    jobs = jobs or os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers = jobs, initializer = workerInit, initargs = ( registersets, registerFiles )) as executor:
+        futures = [ executor.submit(workerSummarizeChunk, chunk) for chunk in chunks ]
+        for fut in as_completed(futures):
+            chunkRegisters, stats = fut.result()
+            mergeStats(total, stats)
+            for key, entry in chunkRegisters.items():
+                current = registers.get(key)
+                if current is None:
+                    registers[key] = entry
+                    continue
+                current[0] = current[0] + entry[0]
+                current[1] = current[1] + entry[1]
+                current[2] = current[2] + entry[2]
+                if (entry[3] is not None) and ((current[3] is None) or (entry[3] < current[3])):
+                    current[3] = entry[3]
+                if (entry[4] is not None) and ((current[4] is None) or (entry[4] > current[4])):
+                    current[4] = entry[4]
+                if entry[5] < current[5]:
+                    current[5] = entry[5]
+                if entry[6] >= current[6]:
+                    current[6] = entry[6]
+                    current[7] = entry[7]
+    return registers, total
+
+def pfeifferOfflineDecodeCLI():
+    ap = argparse.ArgumentParser(description = 'Decode large Pfeiffer RS485 captures (JSON dumps or binary captures) using all available cores')
+    ap.add_argument('input', type=str, nargs='+', help="Capture files")
+    ap.add_argument('-d', '--device', type=str, required=False, default=None, action='append', help="Adds a device registerset to a given address (ADR:DEVTYPE). Can be used multiple times")
+    ap.add_argument('--regfile', type=str, required=False, default=None, action='append', help="Loads an additional register set definition (JSON or TOML) that can be used with --device. Can be used multiple times")
+    ap.add_argument('-o', '--output', type=str, required=False, default=None, help="Write all decoded packets in timestamp order into the given file (JSON line per line, - for standard output)")
+    ap.add_argument('--summary', action='store_true', help="Print per register statistics (default if no output file is given)")
+    ap.add_argument('--noquery', action='store_true', help="Do not write query messages into the output")
+    ap.add_argument('-j', '--jobs', type=int, required=False, default=None, help="Number of worker processes (default: number of cores)")
+    ap.add_argument('--chunksize', type=int, required=False, default=DEFAULT_CHUNKSIZE, help="Approximate chunk size in bytes")
+    args = ap.parse_args()
+
+    regsets = { }
+    if args.device:
+        for devspec in args.device:
+            devspecparts = devspec.split(':')
+            if len(devspecparts) != 2:
+                print("Invalid device address : name specification {}".format(devspec))
+                exit(1)
+            try:
+                regsets[int(devspecparts[0])] = devspecparts[1]
+            except ValueError:
+                print("Invalid device address {}".format(devspecparts[0]))
+                exit(1)
+
+    registerFiles = args.regfile or [ ]
+    try:
+        for registerFile in registerFiles:
+            loadRegisterFile(registerFile)
+        PfeifferProtocol().compileAddressMap(regsets)
+    except (OSError, SerialProtocolViolation) as e:
+        print(e)
+        exit(1)
+
+    if args.output:
+        if args.output == "-":
+            stats = decodeCaptures(args.input, regsets, sys.stdout, args.jobs, args.chunksize, args.noquery, registerFiles)
+        else:
+            with open(args.output, "w") as f:
+                stats = decodeCaptures(args.input, regsets, f, args.jobs, args.chunksize, args.noquery, registerFiles)
+        print("Decoded {} frames ({} protocol violations, {} unknown registers), wrote {} packets".format(stats["frames"], stats["violations"], stats["unknown"], stats["written"]), file = sys.stderr)
+
+    if args.summary or not args.output:
+        registers, stats = summarizeCaptures(args.input, regsets, args.jobs, args.chunksize, registerFiles)
+        proto = PfeifferProtocol()
+        regsetsCompiled = proto.compileAddressMap(regsets)
+        print("{} frames, {} protocol violations, {} unknown registers".format(stats["frames"], stats["violations"], stats["unknown"]))
+        for ( address, param ) in sorted(registers):
+            count, numericCount, total, minValue, maxValue, firstTs, lastTs, lastValue = registers[(address, param)]
+            name = str(param)
+            unit = ""
+            regset = regsetsCompiled.get(address)
+            if (regset is not None) and (param in regset):
+                name = regset[param].display
+                unit = regset[param].unit or ""
+            if numericCount > 0:
+                print("{:3d} {:3d} {:12s} {:8d} responses, min {} max {} mean {:.3f} last {} {}".format(address, param, name, count, minValue, maxValue, total / numericCount, lastValue, unit))
+            else:
+                print("{:3d} {:3d} {:12s} {:8d} responses, last {} {}".format(address, param, name, count, lastValue, unit))
+
+if __name__ == "__main__":
+    pfeifferOfflineDecodeCLI()
@@ -1,6 +1,30 @@
+import importlib
+import math
+
+from collections import namedtuple
+from collections.abc import Mapping
+from types import MappingProxyType
+from datetime import datetime
+
 class SerialProtocolViolation(Exception):
     pass
 
+# Raised for frames with a valid checksum whose payload cannot be decoded. The
+# offending packet is kept in packet
+
+class SerialProtocolPayloadError(SerialProtocolViolation):
+    def __init__(self, message, packet):
+        super().__init__(message)
+        self.packet = packet
+
+# Raised when a device answers with an error code (NO_DEF, _RANGE or _LOGIC)
+# instead of a value
+
+class SerialProtocolDeviceError(SerialProtocolPayloadError):
+    def __init__(self, packet, error):
+        super().__init__("Device {} rejected parameter {}: {}".format(packet.address, packet.param, error), packet)
+        self.error = error
+
 class SerialProtocolUnknownRegister(Exception):
     pass
 
@@ -10,22 +34,432 @@ class SerialCommunicationError(Exception):
 class SerialSimulationDone(Exception):
     pass
 
+DEVICE_ERRORS = frozenset(( "NO_DEF", "_RANGE", "_LOGIC" ))
+
+ACCESS_R  = 0
+ACCESS_RW = 1
+ACCESS_W  = 2
+
+# Splits a stream of bytes received from the RS485 bus into frames terminated
+# by carriage return. Data is appended into a single reusable bytearray and
+# only complete frames are copied out. Frames containing illegal (non printable)
+# bytes are dropped as a whole - the framer resynchronizes at the next
+# carriage return and keeps track of the number of discarded bytes. In case
+# no carriage return shows up within the maximum frame length (10 header bytes,
+# up to 99 payload bytes, checksum and terminator) the buffered data is dropped
+# so noise on the line cannot grow the buffer without bound
+
+class PfeifferFramer:
+    FRAME_VALIDBYTES = bytes(range(0x20, 0x80))
+    FRAME_MAXLENGTH = 10 + 99 + 3 + 1
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.scanned = 0
+        self.discardedBytes = 0
+        self.discardedFrames = 0
+
+    def feed(self, data):
+        self.buffer += data
+
+    def pending(self):
+        return len(self.buffer)
+
+    def reset(self):
+        del self.buffer[:]
+        self.scanned = 0
+
+    def nextFrame(self):
+        # Returns the next complete frame (including the terminating '\r')
+        # as string or None in case no complete frame is buffered
+        eolPos = self.buffer.find(b'\r', self.scanned)
+        if eolPos < 0:
+            dropped = len(self.buffer)
+            if dropped >= self.FRAME_MAXLENGTH:
+                del self.buffer[:]
+                self.scanned = 0
+                self.discardedBytes = self.discardedBytes + dropped
+                self.discardedFrames = self.discardedFrames + 1
+                raise SerialProtocolViolation('Protocol violation. No frame terminator within {} bytes, discarded {} bytes'.format(self.FRAME_MAXLENGTH, dropped))
+            self.scanned = dropped
+            return None
+
+        frame = bytes(self.buffer[:eolPos + 1])
+        del self.buffer[:eolPos + 1]
+        self.scanned = 0
+
+        illegal = frame[:-1].translate(None, self.FRAME_VALIDBYTES)
+        if illegal:
+            self.discardedBytes = self.discardedBytes + len(frame)
+            self.discardedFrames = self.discardedFrames + 1
+            raise SerialProtocolViolation('Protocol violation. Encountered illegal byte {}, discarded {} bytes'.format(illegal[0], len(frame)))
+
+        return frame.decode("ASCII")
+
+# Immutable metadata record for a single register. Instances are shared
+# between all packets decoded for the given register. The decoder field
+# contains the bound function that validates and decodes the raw payload
+
+PfeifferRegister = namedtuple("PfeifferRegister", [
+    "param", "datatype", "access", "display", "designation", "unit",
+    "min", "max", "persistent", "default", "valueDescriptions", "decoder"
+])
+
+# A single packet received from (or sent onto) the bus. Only the values that
+# vary from frame to frame are stored - register metadata is referenced via
+# the shared PfeifferRegister record and the human readable time is only
+# formatted on request. For existing callers the packet supports read
+# access like the previously used dictionaries and can be converted into one
+# using as_dict()
+
+class PfeifferPacket:
+    __slots__ = ( "address", "param", "action", "payloadLength", "packetRaw", "payload", "register", "rxTime", "rxMonotonic" )
+
+    def __init__(self, address, param, action, payloadLength, packetRaw, rxTime = None, rxMonotonic = None):
+        self.address = address
+        self.param = param
+        self.action = action
+        self.payloadLength = payloadLength
+        self.packetRaw = packetRaw
+        self.payload = None
+        self.register = None
+        self.rxTime = rxTime
+        self.rxMonotonic = rxMonotonic
+
+    @property
+    def payloadRaw(self):
+        return self.packetRaw[10:-4]
+
+    @property
+    def time(self):
+        if self.rxTime is None:
+            return None
+        return str(datetime.fromtimestamp(self.rxTime))
+
+    @property
+    def timestamp(self):
+        if self.rxTime is None:
+            return None
+        return int(self.rxTime)
+
+    def as_dict(self):
+        res = {
+            "address"       : self.address,
+            "param"         : self.param,
+            "action"        : self.action,
+            "payloadRaw"    : self.packetRaw[10:-4],
+            "payloadLength" : self.payloadLength,
+            "packetRaw"     : self.packetRaw
+        }
+        register = self.register
+        if register is not None:
+            res["payload"]          = self.payload
+            res["designation"]      = register.designation
+            res["displayreg"]       = register.display
+            res["regaccess"]        = register.access
+            res["regunit"]          = register.unit
+            res["regmin"]           = register.min
+            res["regmax"]           = register.max
+            res["regdefault"]       = register.default
+            res["regpersistent"]    = register.persistent
+        if self.rxTime is not None:
+            res["time"]             = self.time
+            res["timestamp"]        = self.timestamp
+        return res
+
+    # Dictionary compatibility view
+
+    def keys(self):
+        keys = [ "address", "param", "action", "payloadRaw", "payloadLength", "packetRaw" ]
+        if self.register is not None:
+            keys.extend(self.registerKeys)
+        if self.rxTime is not None:
+            keys.extend(( "time", "timestamp" ))
+        return keys
+
+    registerKeys = ( "payload", "designation", "displayreg", "regaccess", "regunit", "regmin", "regmax", "regdefault", "regpersistent" )
+
+    registerFields = {
+        "designation"   : "designation",
+        "displayreg"    : "display",
+        "regaccess"     : "access",
+        "regunit"       : "unit",
+        "regmin"        : "min",
+        "regmax"        : "max",
+        "regdefault"    : "default",
+        "regpersistent" : "persistent"
+    }
+
+    def __getitem__(self, key):
+        if key in self.registerFields:
+            if self.register is None:
+                raise KeyError(key)
+            return getattr(self.register, self.registerFields[key])
+        if key == "payload":
+            if self.register is None:
+                raise KeyError(key)
+            return self.payload
+        if key in ( "time", "timestamp" ):
+            if self.rxTime is None:
+                raise KeyError(key)
+        if key in ( "address", "param", "action", "payloadRaw", "payloadLength", "packetRaw", "time", "timestamp" ):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def get(self, key, default = None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        return self.as_dict().items()
+
+    def values(self):
+        return self.as_dict().values()
+
+    def __eq__(self, other):
+        if isinstance(other, PfeifferPacket):
+            return self.as_dict() == other.as_dict()
+        if isinstance(other, dict):
+            return self.as_dict() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return "PfeifferPacket({})".format(self.as_dict())
+
+# Register set definitions by device type. The definitions live in their own
+# modules (pfeifferpumps.registersets) that are only imported when a register
+# set is requested for the first time, so tools that only handle a single
+# device type (or none at all) do not pay for parsing all of them. Additional
+# sets can be added at runtime either as dictionary or as module name
+
+class PfeifferRegisterSets(Mapping):
+    def __init__(self, modules):
+        self.modules = dict(modules)
+        self.loaded = { }
+
+    def add(self, name, definition):
+        if isinstance(definition, str):
+            self.modules[name] = definition
+            self.loaded.pop(name, None)
+        else:
+            self.modules[name] = None
+            self.loaded[name] = definition
+
+    def __getitem__(self, name):
+        definition = self.loaded.get(name)
+        if definition is None:
+            moduleName = self.modules[name]
+            definition = importlib.import_module(moduleName).registers
+            self.loaded[name] = definition
+        return definition
+
+    def __contains__(self, name):
+        return name in self.modules
+
+    def __iter__(self):
+        return iter(self.modules)
+
+    def __len__(self):
+        return len(self.modules)
+
+    def loadedItems(self):
+        # Only the definitions that have already been imported
+        return list(self.loaded.items())
+
+# A register set definition (as kept in PfeifferProtocol.registers) compiled
+# into a mapping from parameter number to register metadata and to a
+# specialized decode function. Parameter numbers are three decimal digits so
+# the decode paths use dense tables indexed by parameter number - decoding a
+# packet only requires a single list index and a single function call
+
+REGISTER_TABLE_SIZE = 1000
+
+class PfeifferRegisterSet:
+    def __init__(self, name, sentenceDictionary, proto):
+        self.name = name
+        self.sentenceDictionary = sentenceDictionary
+        self.registers = { }
+        self.decoders = { }
+        self.table = [ None ] * REGISTER_TABLE_SIZE
+        self.decoderTable = [ None ] * REGISTER_TABLE_SIZE
+
+        for regParam, regDef in sentenceDictionary.items():
+            if (not isinstance(regParam, int)) or (regParam < 0) or (regParam >= REGISTER_TABLE_SIZE):
+                raise SerialProtocolViolation("Invalid parameter number {} in register set {}".format(regParam, name))
+            register = PfeifferRegister(
+                param               = regParam,
+                datatype            = regDef["datatype"],
+                access              = regDef["access"],
+                display             = regDef["display"],
+                designation         = regDef["designation"],
+                unit                = regDef["unit"],
+                min                 = regDef["min"],
+                max                 = regDef["max"],
+                persistent          = regDef["persistent"],
+                default             = regDef["default"],
+                valueDescriptions   = MappingProxyType(regDef.get("valueDescriptions") or { }),
+                decoder             = proto.decodeDataTypeFunction(regDef["datatype"])
+            )
+            self.registers[regParam] = register
+            self.decoders[regParam] = self.compileDecoder(register)
+            self.table[regParam] = register
+            self.decoderTable[regParam] = self.decoders[regParam]
+
+    @staticmethod
+    def compileDecoder(register):
+        decodeValue = register.decoder
+        packetFields = {
+            "designation"   : register.designation,
+            "displayreg"    : register.display,
+            "regaccess"     : register.access,
+            "regunit"       : register.unit,
+            "regmin"        : register.min,
+            "regmax"        : register.max,
+            "regdefault"    : register.default,
+            "regpersistent" : register.persistent
+        }
+
+        def decodePacket(packet):
+            if packet["action"] == 1:
+                packet["payload"] = decodeValue(packet["payloadRaw"])
+            else:
+                packet["payload"] = "=?"
+            packet.update(packetFields)
+            return packet
+
+        return decodePacket
+
+    def __contains__(self, regParam):
+        return regParam in self.registers
+
+    def __getitem__(self, regParam):
+        return self.registers[regParam]
+
+    def __len__(self):
+        return len(self.registers)
+
+    def get(self, regParam, default = None):
+        return self.registers.get(regParam, default)
+
+    def decode(self, packet):
+        # Decodes the payload of a PfeifferPacket and attaches the register
+        # metadata to it
+        regParam = packet.param
+        register = self.table[regParam] if 0 <= regParam < REGISTER_TABLE_SIZE else None
+        if register is None:
+            raise SerialProtocolUnknownRegister("Unknown register {} in packet".format(regParam))
+        packet.register = register
+        if packet.action == 1:
+            payloadRaw = packet.packetRaw[10:-4]
+            if payloadRaw in DEVICE_ERRORS:
+                raise SerialProtocolDeviceError(packet, payloadRaw)
+            try:
+                packet.payload = register.decoder(payloadRaw)
+            except SerialProtocolViolation as e:
+                raise SerialProtocolPayloadError(str(e), packet)
+        else:
+            packet.payload = "=?"
+        return packet
+
+    def decodePacket(self, packet):
+        if isinstance(packet, PfeifferPacket):
+            return self.decode(packet)
+        regParam = packet["param"]
+        decoder = self.decoderTable[regParam] if 0 <= regParam < REGISTER_TABLE_SIZE else None
+        if decoder is None:
+            raise SerialProtocolUnknownRegister("Unknown register {} in packet".format(packet["param"]))
+        return decoder(packet)
+
 class PfeifferProtocol:
     def __enter__(self):
         return self
     def __exit__(self, exc_type, exc_value, traceback):
         pass
     def __init__(self):
-        pass
-    def decodePacketRaw(self, line):
+        self.compiledRegisterSets = { }
+        self.compiledDictionaries = { }
+        # Pre-encoded read requests (bytes) by address, dense tables indexed
+        # by parameter number like the decode tables of PfeifferRegisterSet
+        self.queryFrames = { }
+
+    def registerSet(self, name):
+        # Returns the compiled register set for the given device type. Each
+        # set is only compiled once per protocol instance (and again in case
+        # the definition has been replaced, e.g. by a reloaded register file)
+        if not name in self.registers:
+            raise SerialProtocolViolation("Unknown register set {}".format(name))
+        definition = self.registers[name]
+        regset = self.compiledRegisterSets.get(name)
+        if (regset is None) or (regset.sentenceDictionary is not definition):
+            regset = PfeifferRegisterSet(name, definition, self)
+            self.compiledRegisterSets[name] = regset
+        return regset
+
+    def compileAddressMap(self, registersets):
+        # Resolves a dictionary from device address to register set name
+        # into a dictionary from address to compiled register set
+        compiled = { }
+        if registersets:
+            if not isinstance(registersets, dict):
+                raise SerialProtocolViolation('Register sets has to be a dictionary from address to register set identifier')
+            for address, regset in registersets.items():
+                if not regset in self.registers:
+                    raise SerialProtocolViolation("Unknown register set {} for address {}".format(regset, address))
+                compiled[address] = self.registerSet(regset)
+            for address, regset in compiled.items():
+                self.cacheQueryFrames(address, regset)
+        return compiled
+
+    def cacheQueryFrames(self, address, regset):
+        # Encodes the read requests for all readable registers of the
+        # register set assigned to the given address once
+        table = self.queryFrames.get(address)
+        if table is None:
+            table = [ None ] * REGISTER_TABLE_SIZE
+            self.queryFrames[address] = table
+        for regParam, register in regset.registers.items():
+            if (register.access != ACCESS_W) and (table[regParam] is None):
+                table[regParam] = self.encodeFrameBytes(address, 0, regParam, "=?")
+
+    def compileRegisterSet(self, sentenceDictionary):
+        # Compiles (and caches) an arbitrary sentence dictionary that has not
+        # been registered by name. The dictionary itself is kept referenced
+        # so the id used as key stays valid
+        if isinstance(sentenceDictionary, PfeifferRegisterSet):
+            return sentenceDictionary
+        cached = self.compiledDictionaries.get(id(sentenceDictionary))
+        if (cached is not None) and (cached[0] is sentenceDictionary):
+            return cached[1]
+        for name, regs in self.registers.loadedItems():
+            if regs is sentenceDictionary:
+                regset = self.registerSet(name)
+                break
+        else:
+            regset = PfeifferRegisterSet(None, sentenceDictionary, self)
+        self.compiledDictionaries[id(sentenceDictionary)] = (sentenceDictionary, regset)
+        return regset
+
+    def decodeFrame(self, line, rxTime = None, rxMonotonic = None):
         if len(line) < 14:
             raise SerialProtocolViolation('Protocol violation. Sentence too short')
         if line[-1] != '\r':
             raise SerialProtocolViolation('Protocol violation. Sentence not ended with carriage return')
 
-        devAddress = line[:3]
-        devAction = line[3]
-
         # The following check should verify if the byte at position 5 is
         # always 0 as specified in the docs. This does not seem to be a valid
         # constraint in reality?
@@ -33,24 +467,25 @@ class PfeifferProtocol:
         # if line[4] != '0':
         #    raise SerialProtocolViolation('Protocol violation. Byte at position 5 is not 0')
 
-        devParamNumber = line[5:8]
-        msgDataLength = line[8:10]
+        try:
+            devAddress = int(line[:3])
+            devAction = int(line[3])
+            devParamNumber = int(line[5:8])
+            msgDataLength = int(line[8:10])
+            msgChkSum = int(line[-4:-1])
+        except ValueError:
+            raise SerialProtocolViolation('Protocol violation. Sentence malformed')
 
         # Now calculate checksum
-        chkSum = 0
-        realChkSum = sum(bytearray(line[:-4].encode(encoding = "ASCII"))) % 256
-        if realChkSum != int(line[-4:-1]):
+        realChkSum = sum(line[:-4].encode(encoding = "ASCII")) % 256
+        if realChkSum != msgChkSum:
             raise SerialProtocolViolation('Protocol violation. Checksum invalid')
 
-        # In case the checksum passes return an dictionary containing the required information
-        return {
-            "address"       : int(devAddress),
-            "param"         : int(devParamNumber),
-            "action"        : int(devAction),
-            "payloadRaw"    : line[10:-4],
-            "payloadLength" : int(msgDataLength),
-            "packetRaw"     : line
-        }
+        # In case the checksum passes return a packet containing the required information
+        return PfeifferPacket(devAddress, devParamNumber, devAction, msgDataLength, line, rxTime, rxMonotonic)
+
+    def decodePacketRaw(self, line):
+        return self.decodeFrame(line).as_dict()
 
     def decodeDataType_0(self, payload):
         if len(payload) != 6:
@@ -183,9 +618,11 @@ class PfeifferProtocol:
         12  :   "decodeDataType_12"
     }
 
+    def decodeDataTypeFunction(self, datatype):
+        return getattr(self, self.decodeDataType_Dictionary.get(datatype, "decodeDataType_default"))
+
     def decodeDataType(self, payload, datatype):
-        fun = self.decodeDataType_Dictionary.get(datatype, self.decodeDataType_default)
-        return getattr(self, fun)(payload)
+        return self.decodeDataTypeFunction(datatype)(payload)
 
     def encodeDataType_0(self, payload):
         if not isinstance(payload, bool):
@@ -207,7 +644,90 @@ class PfeifferProtocol:
             raise SerialProtocolViolation("Trying to encode non positive floating point value {} into u_real type".format(payload))
         if payload < 0:
             raise SerialProtocolViolation("Trying to encode non positive floating point value {} into u_real type".format(payload))
-        return '{:06d}'.format(int(payload * 100.0))
+        return '{:06d}'.format(int(round(payload * 100.0)))
+
+    def encodeDataType_3(self, payload):
+        # One digit mantissa with one decimal and a single digit exponent
+        # (for example 1.0E-3)
+        if (not isinstance(payload, (int, float))) or isinstance(payload, bool):
+            raise SerialProtocolViolation("Trying to encode non numeric value {} into u_expo type".format(payload))
+        if payload < 0:
+            raise SerialProtocolViolation("Trying to encode negative value {} into u_expo type".format(payload))
+        if payload == 0:
+            return '0.0E+0'
+        exponent = math.floor(math.log10(payload))
+        mantissa = round(payload / pow(10, exponent), 1)
+        if mantissa >= 10:
+            mantissa = mantissa / 10
+            exponent = exponent + 1
+        if (exponent < -9) or (exponent > 9):
+            raise SerialProtocolViolation("Value {} out of range of u_expo type".format(payload))
+        return '{:.1f}E{:+d}'.format(mantissa, exponent)
+
+    def encodeDataType_String(self, payload, length, typename):
+        # Printable ASCII strings, padded with spaces to the fixed length
+        if not isinstance(payload, str):
+            raise SerialProtocolViolation("Trying to encode non string {} into {} type".format(payload, typename))
+        if len(payload) > length:
+            raise SerialProtocolViolation("String {} exceeds the {} characters of {} type".format(payload, length, typename))
+        for c in payload:
+            if (ord(c) < 0x20) or (ord(c) > 0x7E):
+                raise SerialProtocolViolation("Invalid character in {} payload {}".format(typename, payload))
+        return payload.ljust(length)
+
+    def encodeDataType_4(self, payload):
+        return self.encodeDataType_String(payload, 6, "u_string")
+
+    def encodeDataType_6(self, payload):
+        if not isinstance(payload, bool):
+            raise SerialProtocolViolation("Trying to encode non boolean {} into boolean_new type".format(payload))
+        if payload == True:
+            return '1'
+        else:
+            return '0'
+
+    def encodeDataType_7(self, payload):
+        if (not isinstance(payload, int)) or isinstance(payload, bool):
+            raise SerialProtocolViolation("Trying to encode non integer {} into u_short_int type".format(payload))
+        if (payload < 0) or (payload > 999):
+            raise SerialProtocolViolation("Value {} out of range of u_short_int type".format(payload))
+        return '{:03d}'.format(payload)
+
+    def encodeDataType_9(self, payload):
+        # Accepts the dictionary produced by decodeDataType_9
+        if (not isinstance(payload, dict)) or (not "onoff" in payload) or (not "temp" in payload):
+            raise SerialProtocolViolation("Trying to encode {} into tms_old type (requires onoff and temp)".format(payload))
+        if not isinstance(payload["onoff"], bool):
+            raise SerialProtocolViolation("Trying to encode non boolean {} into tms_old type".format(payload["onoff"]))
+        temp = payload["temp"]
+        if (not isinstance(temp, int)) or isinstance(temp, bool) or (temp < 0) or (temp > 999):
+            raise SerialProtocolViolation("Temperature {} out of range of tms_old type".format(temp))
+        return '{}{:03d}'.format('111' if payload["onoff"] else '000', temp)
+
+    def encodeDataType_10(self, payload):
+        # Inverse of decodeDataType_10: four digit mantissa (in thousandths)
+        # followed by a two digit exponent. Values below one are encoded with
+        # exponent zero
+        if (not isinstance(payload, (int, float))) or isinstance(payload, bool):
+            raise SerialProtocolViolation("Trying to encode non numeric value {} into u_expo_new type".format(payload))
+        if payload < 0:
+            raise SerialProtocolViolation("Trying to encode negative value {} into u_expo_new type".format(payload))
+        exponent = 0
+        if payload >= 1:
+            exponent = math.floor(math.log10(payload))
+        mantissa = round(payload / pow(10, exponent) * 1000)
+        if mantissa > 9999:
+            mantissa = round(mantissa / 10)
+            exponent = exponent + 1
+        if exponent > 99:
+            raise SerialProtocolViolation("Value {} out of range of u_expo_new type".format(payload))
+        return '{:04d}{:02d}'.format(mantissa, exponent)
+
+    def encodeDataType_11(self, payload):
+        return self.encodeDataType_String(payload, 16, "string16")
+
+    def encodeDataType_12(self, payload):
+        return self.encodeDataType_String(payload, 8, "string8")
 
     def encodeDataType_default(self, payload):
         raise SerialProtocolViolation("Data type not supported for encoding")
@@ -215,44 +735,35 @@ class PfeifferProtocol:
     encodeDataType_Dictionary = {
         0   :   "encodeDataType_0",
         1   :   "encodeDataType_1",
-        2   :   "encodeDataType_2"
-        # 3   :   "encodeDataType_3",
-        # 4   :   "encodeDataType_4",
+        2   :   "encodeDataType_2",
+        3   :   "encodeDataType_3",
+        4   :   "encodeDataType_4",
         # 5   :   "encodeDataType_5",
-        # 6   :   "encodeDataType_6",
-        # 7   :   "encodeDataType_7",
-        # 9   :   "encodeDataType_9",
-        # 10  :   "encodeDataType_10",
-        # 11  :   "encodeDataType_11",
-        # 12  :   "encodeDataType_12"
+        6   :   "encodeDataType_6",
+        7   :   "encodeDataType_7",
+        9   :   "encodeDataType_9",
+        10  :   "encodeDataType_10",
+        11  :   "encodeDataType_11",
+        12  :   "encodeDataType_12"
     }
 
     def encodeDataType(self, payload, datatype):
-        fun = self.encodeDataType_Dictionary.get(datatype, self.encodeDataType_default)
+        fun = self.encodeDataType_Dictionary.get(datatype, "encodeDataType_default")
         return getattr(self, fun)(payload)
 
     def decodePacket(self, packet, sentenceDictionary):
+        if isinstance(packet, PfeifferPacket):
+            return self.compileRegisterSet(sentenceDictionary).decode(packet)
         if not (("address" in packet) or ("action" in packet) or ("param" in packet) or ("payloadLength" in packet) or ("payloadRaw" in packet)):
             raise SerialProtocolViolation("Packet passed does not contain information about a received serial protocol")
 
-        regParam = int(packet["param"])
-        if not regParam in sentenceDictionary:
-            raise SerialProtocolUnknownRegister("Unknown register {} in packet".format(regParam))
+        return self.compileRegisterSet(sentenceDictionary).decodePacket(packet)
 
-        if packet["action"] == 1:
-            packet["payload"]   = self.decodeDataType(packet["payloadRaw"], sentenceDictionary[regParam]["datatype"])
-        else:
-            packet["payload"]   = "=?"
-        packet["designation"]   = sentenceDictionary[regParam]["designation"]
-        packet["displayreg"]    = sentenceDictionary[regParam]["display"]
-        packet["regaccess"]     = sentenceDictionary[regParam]["access"]
-        packet["regunit"]       = sentenceDictionary[regParam]["unit"]
-        packet["regmin"]        = sentenceDictionary[regParam]["min"]
-        packet["regmax"]        = sentenceDictionary[regParam]["max"]
-        packet["regdefault"]    = sentenceDictionary[regParam]["default"]
-        packet["regpersistent"] = sentenceDictionary[regParam]["persistent"]
-
-        return packet
+    def decodeFramesBatch(self, frames, registersets = None, timestamps = None):
+        # Vectorized decoding of many frames at once into a NumPy structured
+        # array. Requires NumPy which is only imported when used
+        from pfeifferpumps.pfeifferbatch import decodeFramesBatch
+        return decodeFramesBatch(self, frames, registersets, timestamps)
 
     def encodePacket(self, targetAddress, action, regParam, value, sentenceDictionary, checkWritable = True):
         # This function validates the passed value and creates an encoded packet
@@ -267,7 +778,7 @@ class PfeifferProtocol:
                 if value > sentenceDictionary[regParam]["max"]:
                     raise SerialProtocolViolation("Parameter {} has maximum value of {} but {} supplied".format(regParam, sentenceDictionary[regParam]["max"], value))
 
-        if checkWritable and (sentenceDictionary[regParam]["access"] != ACCESS_RW) and (sentenceDictionary[regParam]["access"] != ACCESS_W):
+        if checkWritable and (sentenceDictionary[regParam]["access"] != self.ACCESS_RW) and (sentenceDictionary[regParam]["access"] != self.ACCESS_W):
             raise SerialProtocolViolation("Parameter {} is not writable".format(regParam))
 
         # Try to encode the data ...
@@ -290,146 +801,63 @@ class PfeifferProtocol:
         packet["regdefault"]    = sentenceDictionary[regParam]["default"]
         packet["regpersistent"] = sentenceDictionary[regParam]["persistent"]
 
-        # First just build the whole checksummed area
-        packet["packetRaw"]     = "{:03d}{:1d}0{:03d}{:02d}{}".format(targetAddress, action, regParam, len(packet["payloadRaw"]), packet["payloadRaw"])
-
-        # Calculate the checksum
-        packet["packetRaw"]     = packet["packetRaw"] + "{:03d}".format(sum(bytearray(packet["packetRaw"].encode(encoding = "ASCII"))) % 256) + "\r"
+        packet["packetRaw"]     = self.encodeFrame(targetAddress, action, regParam, packet["payloadRaw"])
 
         return packet
 
-    ACCESS_R  = 0
-    ACCESS_RW = 1
-    ACCESS_W  = 2
-
-    registers = {
-        "TC110" : {
-            # Control commands (0xx)
-              1 : { "datatype" : 0,  "access" : ACCESS_RW, "display" : "Heating",     "designation" : "Heating",                                   "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 0,    "valueDescriptions" : { 0 : "off", 1 : "on" } },
-              2 : { "datatype" : 0,  "access" : ACCESS_RW, "display" : "Standby",     "designation" : "Standby",                                   "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 0,    "valueDescriptions" : { 0 : "off", 1 : "on" } },
-              4 : { "datatype" : 0,  "access" : ACCESS_RW, "display" : "RUTimeCtrl",  "designation" : "Run-up time control",                       "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 1,    "valueDescriptions" : { 0 : "off", 1 : "on" } },
-              9 : { "datatype" : 0,  "access" : ACCESS_W,  "display" : "ErrorAckn",   "designation" : "Error acknowledgement",                     "unit" : None,    "min" : 1,    "max" : 1,       "persistent" : False, "default" : None, "valueDescriptions" : { 1 : "Error acknowledgement" } },
-             10 : { "datatype" : 0,  "access" : ACCESS_RW, "display" : "PumpgStatn",  "designation" : "Pumping station",                           "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 0,    "valueDescriptions" : { 0 : "off", 1 : "on and error acknowledgement" } },
-             12 : { "datatype" : 0,  "access" : ACCESS_RW, "display" : "EnableVent",  "designation" : "Enable venting",                            "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 0,    "valueDescriptions" : { 0 : "no", 1 : "yes" } },
-             17 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "CfgSpdSwPt",  "designation" : "Configuration rotation speed switchpoint",  "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 0,    "valueDescriptions" : { 0 : "rotation speed switch point 1", 1 : "rotation speed switch points 1 and 2" } },
-             19 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "Cfg DO2",     "designation" : "Configuration output DO2",                  "unit" : None,    "min" : 0,    "max" : 22,      "persistent" : True,  "default" : 1,    "valueDescriptions" : { 0 : "Rotation speed switch point reached", 1 : "no error", 2 : "error", 3 : "warning", 4 : "error and/or warning", 5 : "set rotation speed reached", 6 : "pump on", 7 : "pump accelerating", 8 : "pump decelerating", 9 : "always 0", 10 : "always 1", 11 : "remote priority active", 12 : "heating", 13 : "backing pump", 14 : "sealing gas", 15 : "pumping station", 16 : "pump rotates", 17 : "pump does not rotate", 19 : "pressure switch point 1 underrund", 20 : "pressure switch point 2 underrun", 21 : "fore-vacuum valve, delayed", 22 : "backing pump standby" } },
-             23 : { "datatype" : 0,  "access" : ACCESS_RW, "display" : "MotorPump",   "designation" : "Motor pump",                                "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 1,    "valueDescriptions" : { 0 : "off", 1 : "on" } },
-             24 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "Cfg DO1",     "designation" : "Configuration output DO1",                  "unit" : None,    "min" : 0,    "max" : 22,      "persistent" : True,  "default" : 0,    "valueDescriptions" : { 0 : "Rotation speed switch point reached", 1 : "no error", 2 : "error", 3 : "warning", 4 : "error and/or warning", 5 : "set rotation speed reached", 6 : "pump on", 7 : "pump accelerating", 8 : "pump decelerating", 9 : "always 0", 10 : "always 1", 11 : "remote priority active", 12 : "heating", 13 : "backing pump", 14 : "sealing gas", 15 : "pumping station", 16 : "pump rotates", 17 : "pump does not rotate", 19 : "pressure switch point 1 underrund", 20 : "pressure switch point 2 underrun", 21 : "fore-vacuum valve, delayed", 22 : "backing pump standby" } },
-             25 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "OpMode BKP",  "designation" : "Backing pump mode",                         "unit" : None,    "min" : 0,    "max" : 3,       "persistent" : True,  "default" : 0,    "valueDescriptions" : { 0 : "continuous operation", 1 : "intermittent operation", 2 : "delayed switching on", 3 : "delayed switching off" } },
-             26 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "SpdSetMode",  "designation" : "Rotation speed setting mode",               "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 0,    "valueDescriptions" : { 0 : "off", 1 : "on" } },
-             27 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "GasMode",     "designation" : "Gas mode",                                  "unit" : None,    "min" : 0,    "max" : 2,       "persistent" : True,  "default" : 0,    "valueDescriptions" : { 0 : "heavy gases", 1 : "light gases", 2 : "Helium" } },
-             30 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "VentMode",    "designation" : "Venting mode",                              "unit" : None,    "min" : 0,    "max" : 2,       "persistent" : True,  "default" : 0,    "valueDescriptions" : { 0 : "delayed venting", 1 : "no venting", 2 : "direct venting" } },
-             35 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "Cfg Acc A1",  "designation" : "Configuration accessory connection A1",     "unit" : None,    "min" : 0,    "max" : 12,      "persistent" : True,  "default" : 0,    "valueDescriptions" : { 0 : "fan", 1 : "venting valve, closed without current", 2 : "heating", 3 : "backing pump", 4 : "fan (temperatuer controlled)", 5 : "sealing gas", 6 : "always 0", 7 : "always 1", 8 : "power failure venting unit", 9 : "TMS heating", 10 : "TMS cooling", 12 : "Second venting valve", 13 : "Sealing gas monitoring", 14 : "heating (bottom part temperature controlled)" } },
-             36 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "Cfg Acc B1",  "designation" : "Configuration accessory connection B1",     "unit" : None,    "min" : 0,    "max" : 12,      "persistent" : True,  "default" : 1,    "valueDescriptions" : { 0 : "fan", 1 : "venting valve, closed without current", 2 : "heating", 3 : "backing pump", 4 : "fan (temperatuer controlled)", 5 : "sealing gas", 6 : "always 0", 7 : "always 1", 8 : "power failure venting unit", 9 : "TMS heating", 10 : "TMS cooling", 12 : "Second venting valve", 13 : "Sealing gas monitoring", 14 : "heating (bottom part temperature controlled)" } },
-             37 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "Cfg Acc A2",  "designation" : "Configuration accessory connection B1",     "unit" : None,    "min" : 0,    "max" : 12,      "persistent" : True,  "default" : 3,    "valueDescriptions" : { 0 : "fan", 1 : "venting valve, closed without current", 2 : "heating", 3 : "backing pump", 4 : "fan (temperatuer controlled)", 5 : "sealing gas", 6 : "always 0", 7 : "always 1", 8 : "power failure venting unit", 9 : "TMS heating", 10 : "TMS cooling", 12 : "Second venting valve", 13 : "Sealing gas monitoring", 14 : "heating (bottom part temperature controlled)" } },
-             38 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "Cfg Acc B2",  "designation" : "Configuration accessory connection B1",     "unit" : None,    "min" : 0,    "max" : 12,      "persistent" : True,  "default" : 2,    "valueDescriptions" : { 0 : "fan", 1 : "venting valve, closed without current", 2 : "heating", 3 : "backing pump", 4 : "fan (temperatuer controlled)", 5 : "sealing gas", 6 : "always 0", 7 : "always 1", 8 : "power failure venting unit", 9 : "TMS heating", 10 : "TMS cooling", 12 : "Second venting valve", 13 : "Sealing gas monitoring", 14 : "heating (bottom part temperature controlled)" } },
-             41 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "Press1HVen",  "designation" : "Enable integrated HV sensor (IKT only)",    "unit" : None,    "min" : 0,    "max" : 3,       "persistent" : True,  "default" : 2,    "valueDescriptions" : { 0 : "off", 1 : "on", 2 : "on, when rotation speed switch point reached", 3 : "on when pressure switch point underrun" } },
-             50 : { "datatype" : 0,  "access" : ACCESS_RW, "display" : "SealingGas",  "designation" : "Sealing gas",                               "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 0,    "valueDescriptions" : { 0 : "off", 1 : "on" } },
-             55 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "Cfg AO1",     "designation" : "Configurtation output AO1",                 "unit" : None,    "min" : 0,    "max" : 8,       "persistent" : True,  "default" : 0,    "valueDescriptions" : { 0 : "Actual rotation speed", 1 : "Output", 2 : "Current", 3 : "Always 0V", 4 : "Always 10V", 6 : "Pressure value 1", 7 : "Pressure value 2", 8 : "Fore-vacuum control" } },
-             60 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "CtrlViaInt",  "designation" : "Control via Interface",                     "unit" : None,    "min" : 0,    "max" : 255,     "persistent" : True,  "default" : 1,    "valueDescriptions" : { 1 : "Remote", 2 : "RS-485", 4 : "PV.can", 8 : "Fieldbus", 16 : "E74", 255 : "Unlock interface selection" } },
-             61 : { "datatype" : 0,  "access" : ACCESS_RW, "display" : "IntSelLckd",  "designation" : "Interface selection locked",                "unit" : None,    "min" : 1,    "max" : 1,       "persistent" : True,  "default" : 0,    "valueDescriptions" : { 0 : "off", 1 : "on" } },
-             62 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "Cfg DI1",     "designation" : "Configuration input DI1",                   "unit" : None,    "min" : 0,    "max" : 7,       "persistent" : True,  "default" : 1,    "valueDescriptions" : { 0 : "deactivated" , 1 : "enable venting", 2 : "heating", 3 : "sealing gas", 4 : "run-up time monitoring", 5 : "rotation speed mode", 6 : "motor", 7 : "enable HV sensor 1" } },
-             63 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "Cfg DI2",     "designation" : "Configuration input DI2",                   "unit" : None,    "min" : 0,    "max" : 7,       "persistent" : True,  "default" : 2,    "valueDescriptions" : { 0 : "deactivated" , 1 : "enable venting", 2 : "heating", 3 : "sealing gas", 4 : "run-up time monitoring", 5 : "rotation speed mode", 6 : "motor", 7 : "enable HV sensor 1" } },
-
-            # Status requests (3xx)
-            300 : { "datatype" : 0,  "access" : ACCESS_R,  "display" : "RemotePrio",  "designation" : "Remote priority",                           "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : False, "default" : None, "valueDescriptions" : { 0 : "no", 1 : "yes" } },
-            302 : { "datatype" : 0,  "access" : ACCESS_R,  "display" : "SpdSwPtAtt",  "designation" : "Rotation speed switchpoint attained",       "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : False, "default" : None, "valueDescriptions" : { 0 : "no", 1 : "yes" } },
-            303 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "Error code",  "designation" : "Error code",                                "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            304 : { "datatype" : 0,  "access" : ACCESS_R,  "display" : "OvTempElec",  "designation" : "Excess temperature electronic drive unit",  "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : False, "default" : None, "valueDescriptions" : { 0 : "no", 1 : "yes" } },
-            305 : { "datatype" : 0,  "access" : ACCESS_R,  "display" : "OvTempPump",  "designation" : "Excess temperature pump",                   "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : False, "default" : None, "valueDescriptions" : { 0 : "no", 1 : "yes" } },
-            306 : { "datatype" : 0,  "access" : ACCESS_R,  "display" : "SetSpdAtt",   "designation" : "Set rotation speed attained",               "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : False, "default" : None, "valueDescriptions" : { 0 : "no", 1 : "yes" } },
-            307 : { "datatype" : 0,  "access" : ACCESS_R,  "display" : "PumpAccel",   "designation" : "Pump accelerates",                          "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : False, "default" : None, "valueDescriptions" : { 0 : "no", 1 : "yes" } },
-            308 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "SetRotSpd",   "designation" : "Set rotation speed",                        "unit" : "Hz",    "min" : 0,    "max" : 999999,  "persistent" : False, "default" : None, "valueDescriptions" : None },
-            309 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "ActualSpd",   "designation" : "Active rotation speed",                     "unit" : "Hz",    "min" : 0,    "max" : 999999,  "persistent" : False, "default" : None, "valueDescriptions" : None },
-            310 : { "datatype" : 2,  "access" : ACCESS_R,  "display" : "DrvCurrent",  "designation" : "Drive current",                             "unit" : "A",     "min" : 0,    "max" : 9999.99, "persistent" : False, "default" : None, "valueDescriptions" : None },
-            311 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "OpHrsPump",   "designation" : "Operating hours pump",                      "unit" : "h",     "min" : 0,    "max" : 65535,   "persistent" : True,  "default" : None, "valueDescriptions" : None },
-            312 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "Fw version",  "designation" : "Firmware version electronic drive unit",    "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            313 : { "datatype" : 2,  "access" : ACCESS_R,  "display" : "DrvVoltage",  "designation" : "Drive voltage",                             "unit" : "V",     "min" : 0,    "max" : 9999.99, "persistent" : False, "default" : None, "valueDescriptions" : None },
-            314 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "OpHrsElec",   "designation" : "Operating hours pump",                      "unit" : "h",     "min" : 0,    "max" : 65535,   "persistent" : True,  "default" : None, "valueDescriptions" : None },
-            315 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "Nominal Spd", "designation" : "Nominal rotation speed",                    "unit" : "Hz",    "min" : 0,    "max" : 999999,  "persistent" : False, "default" : None, "valueDescriptions" : None },
-            316 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "DrvPower",    "designation" : "Drive power",                               "unit" : "W",     "min" : 0,    "max" : 999999,  "persistent" : False, "default" : None, "valueDescriptions" : None },
-            319 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "PumpCycles",  "designation" : "Pump cycles",                               "unit" : None,    "min" : 0,    "max" : 65535,   "persistent" : True,  "default" : None, "valueDescriptions" : None },
-            326 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "TempElec",    "designation" : "Temperature electronic",                    "unit" : "C",     "min" : 0,    "max" : 999999,  "persistent" : False, "default" : None, "valueDescriptions" : None },
-            330 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "TempPmpBot",  "designation" : "Temperature pump bottom part",              "unit" : "C" ,    "min" : 0,    "max" : 999999,  "persistent" : False, "default" : None, "valueDescriptions" : None },
-            336 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "AccelDecel",  "designation" : "Acceleration / Deceleration",               "unit" : "rpm/s", "min" : 0,    "max" : 999999,  "persistent" : False, "default" : None, "valueDescriptions" : None },
-            342 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "TempBearng",  "designation" : "Temperature bearing",                       "unit" : "C",     "min" : 0,    "max" : 999999,  "persistent" : False, "default" : None, "valueDescriptions" : None },
-            346 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "TempMotor",   "designation" : "Temperature motor",                         "unit" : "C",     "min" : 0,    "max" : 999999,  "persistent" : False, "default" : None, "valueDescriptions" : None },
-            349 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "ElecName",    "designation" : "Name of electronic drive unit",             "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            354 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "HwVersion",   "designation" : "Hardware version electronic drive unit",    "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            360 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "ErrHist1",    "designation" : "Error code history, position 1",            "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            361 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "ErrHist2",    "designation" : "Error code history, position 2",            "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            362 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "ErrHist3",    "designation" : "Error code history, position 3",            "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            363 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "ErrHist4",    "designation" : "Error code history, position 4",            "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            364 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "ErrHist5",    "designation" : "Error code history, position 5",            "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            365 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "ErrHist6",    "designation" : "Error code history, position 6",            "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            366 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "ErrHist7",    "designation" : "Error code history, position 7",            "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            367 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "ErrHist8",    "designation" : "Error code history, position 8",            "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            368 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "ErrHist9",    "designation" : "Error code history, position 9",            "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            369 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "ErrHist10",   "designation" : "Error code history, position 10",           "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            397 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "SetRotSpd",   "designation" : "Set rotation speed",                        "unit" : "rpm",   "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            398 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "ActualSpd",   "designation" : "Actual rotation speed",                     "unit" : "rpm",   "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            399 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "NominalSpd",  "designation" : "Nominal rotation speed",                    "unit" : "rpm",   "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-
-            # Set value settings (7xx)
-            700 : { "datatype" : 1,  "access" : ACCESS_RW, "display" : "RUTimeSVal",  "designation" : "Set value run-up time",                     "unit" : "min",   "min" : 1,    "max" : 120,     "persistent" : True,  "default" : 8   , "valueDescriptions" : None },
-            701 : { "datatype" : 1,  "access" : ACCESS_RW, "display" : "SPdSwPt1",    "designation" : "Rotation speed switchpoint 1",              "unit" : "%",     "min" : 50,   "max" : 97,      "persistent" : True,  "default" : 80  , "valueDescriptions" : None },
-            707 : { "datatype" : 2,  "access" : ACCESS_RW, "display" : "SpdSVal",     "designation" : "Set value in rotation speed setting mode",  "unit" : "%",     "min" : 20,   "max" : 100,     "persistent" : True,  "default" : 65  , "valueDescriptions" : None },
-            708 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "PwrSVal",     "designation" : "Set value power consumption",               "unit" : "%",     "min" : 0,    "max" : 100,     "persistent" : True,  "default" : 100 , "valueDescriptions" : None },
-            710 : { "datatype" : 1,  "access" : ACCESS_RW, "display" : "Swoff BKP",   "designation" : "Switching off threshold for backing pump",  "unit" : "W",     "min" : 0,    "max" : 1000,    "persistent" : True,  "default" : 0   , "valueDescriptions" : None },
-            711 : { "datatype" : 1,  "access" : ACCESS_RW, "display" : "Swon BKP",    "designation" : "Switching on threshold for backing pump",   "unit" : "W",     "min" : 0,    "max" : 1000,    "persistent" : True,  "default" : 0   , "valueDescriptions" : None },
-            717 : { "datatype" : 2,  "access" : ACCESS_RW, "display" : "StdbySVal",   "designation" : "Set value rotation speed at standby",       "unit" : "%",     "min" : 20,   "max" : 100,     "persistent" : True,  "default" : 66.7, "valueDescriptions" : None },
-            719 : { "datatype" : 1,  "access" : ACCESS_RW, "display" : "SpdSwPt2",    "designation" : "Rotation speed switchpoint 2",              "unit" : "%",     "min" : 5,    "max" : 97,      "persistent" : True,  "default" : 20  , "valueDescriptions" : None },
-            720 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "VentSpd",     "designation" : "Venting rotation speed at delayed venting", "unit" : "%",     "min" : 40,   "max" : 98,      "persistent" : True,  "default" : 50  , "valueDescriptions" : None },
-            721 : { "datatype" : 1,  "access" : ACCESS_RW, "display" : "VentTime",    "designation" : "Venting time at delayed venting",           "unit" : "s",     "min" : 6,    "max" : 3600,    "persistent" : True,  "default" : 3600, "valueDescriptions" : None },
-            730 : { "datatype" : 10, "access" : ACCESS_RW, "display" : "PrsSwPt 1",   "designation" : "Pressure switchpoint 1",                    "unit" : "hPa",   "min" : None, "max" : None,    "persistent" : True,  "default" : None, "valueDescriptions" : None },
-            732 : { "datatype" : 10, "access" : ACCESS_RW, "display" : "PrsSwPt 2",   "designation" : "Pressure switchpoint 2",                    "unit" : "hPa",   "min" : None, "max" : None,    "persistent" : True,  "default" : None, "valueDescriptions" : None },
-            739 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "PrsSn1Name",  "designation" : "Pressure sensor 1 name",                    "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            740 : { "datatype" : 10, "access" : ACCESS_RW, "display" : "Pressure 1",  "designation" : "Pressure value 1",                          "unit" : "hPa",   "min" : None, "max" : None,    "persistent" : True,  "default" : None, "valueDescriptions" : None },
-            742 : { "datatype" : 2,  "access" : ACCESS_RW, "display" : "PrsCorrPi 1", "designation" : "Pressure correction factor 1",              "unit" : None,    "min" : None, "max" : None,    "persistent" : True,  "default" : None, "valueDescriptions" : None },
-            749 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "PrsSn2Name",  "designation" : "Pressure sensor 2 name",                    "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            750 : { "datatype" : 10, "access" : ACCESS_RW, "display" : "Pressure 2",  "designation" : "Pressure value 2",                          "unit" : "hPa",   "min" : None, "max" : None,    "persistent" : True,  "default" : None, "valueDescriptions" : None },
-            752 : { "datatype" : 2,  "access" : ACCESS_RW, "display" : "PrsCorrPi2",  "designation" : "Pressure correction factor 2",              "unit" : None,    "min" : None, "max" : None,    "persistent" : True,  "default" : None, "valueDescriptions" : None },
-            777 : { "datatype" : 1,  "access" : ACCESS_RW, "display" : "NomSpdConf",  "designation" : "Nomial rotation speed confirmation",        "unit" : "Hz",    "min" : 0,    "max" : 1500,    "persistent" : True,  "default" : 0   , "valueDescriptions" : None },
-            797 : { "datatype" : 1,  "access" : ACCESS_RW, "display" : "RS485Adr",    "designation" : "RS-485 device address",                     "unit" : None,    "min" : 1,    "max" : 255,     "persistent" : True,  "default" : 1   , "valueDescriptions" : None },
-
-            # Additional values for DCU
-            340 : { "datatype" : 7,  "access" : ACCESS_R,  "display" : "Pressure",    "designation" : "Actual pressure value (ActiveLine)",        "unit" : "hPa",   "min" : 1e-10, "max" : 1e3,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            350 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "Ctr Name",    "designation" : "Display and control panel type",            "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            351 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "Ctr Software","designation" : "Display and control panel software version","unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            738 : { "datatype" : 4,  "access" : ACCESS_RW, "display" : "Gauge type",  "designation" : "Type of pressure gauge",                    "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            794 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "Param set",   "designation" : "Parameter set",                             "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : False, "default" : 0,    "valueDescriptions" : { 0 : "Basic parameter set", 1 : "Extended parameter set" } },
-            795 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "Servicelin",  "designation" : "Insert service line",                       "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : 795,  "valueDescriptions" : None }
-        },
-        "MVP015" : {
-              2 : { "datatype" : 0,  "access" : ACCESS_RW, "display" : "Standby",     "designation" : "Standby",                                   "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 0   , "valueDescriptions" : { 0 : "off", 1 : "on" } },
-              9 : { "datatype" : 0,  "access" : ACCESS_W,  "display" : "ErrorAckn",   "designation" : "Fault acknowledgement",                     "unit" : None,    "min" : 1,    "max" : 1,       "persistent" : False, "default" : None, "valueDescriptions" : None },
-             10 : { "datatype" : 0,  "access" : ACCESS_RW, "display" : "PumpgStatn",  "designation" : "Pump",                                      "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 0   , "valueDescriptions" : { 0 : "off", 1 : "on" } },
-             19 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "Cfg DO2",     "designation" : "Configuration output DO2",                  "unit" : None,    "min" : 0,    "max" : 20,      "persistent" : True,  "default" : 5   , "valueDescriptions" : { 1 : "no error", 2 : "error", 5 : "target speed is reached", 6: "pump on", 9 : "always 0", 10 : "always 1", 11: "remote priority active" } },
-             24 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "Cfg DO1",     "designation" : "Configuration output DO1",                  "unit" : None,    "min" : 0,    "max" : 20,      "persistent" : True,  "default" : 1   , "valueDescriptions" : { 1 : "no error", 2 : "error", 5 : "target speed is reached", 6: "pump on", 9 : "always 0", 10 : "always 1", 11: "remote priority active" } },
-             26 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "SpdSetMode",  "designation" : "Speed setting mode",                        "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 0   , "valueDescriptions" : { 0 : "off", 1 : "on" } },
-             30 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "ValveMode",   "designation" : "Purge gas configuration",                   "unit" : None,    "min" : 0,    "max" : 2,       "persistent" : True,  "default" : 0   , "valueDescriptions" : { 0 : "auto", 1 : "closed", 2 : "open" } },
-             50 : { "datatype" : 0,  "access" : ACCESS_RW, "display" : "PurgeGas",    "designation" : "Purge gas",                                 "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 0   , "valueDescriptions" : { 0 : "off", 1 : "on" } },
-             60 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "CtrlViaInt",  "designation" : "Control via interface",                     "unit" : None,    "min" : 0,    "max" : 255,     "persistent" : True,  "default" : 1   , "valueDescriptions" : { 1 : "remote", 2 : "RS-485", 4 : "PV.can", 255 : "Unlock the interface selection" } },
-             61 : { "datatype" : 0,  "access" : ACCESS_RW, "display" : "IntSelLckd",  "designation" : "Interface selection locked",                "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 0   , "valueDescriptions" : { 0 : "off", 1 : "on" } },
-
-            303 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "Error code",  "designation" : "Error code",                                "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            309 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "ActualSpd",   "designation" : "Actual speed",                              "unit" : "Hz",    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            310 : { "datatype" : 2,  "access" : ACCESS_R,  "display" : "DrvCurrent",  "designation" : "Drive current",                             "unit" : "A",     "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            311 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "OpHrsPump",   "designation" : "Pump operating hours",                      "unit" : "h",     "min" : None, "max" : None,    "persistent" : True,  "default" : None, "valueDescriptions" : None },
-            312 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "Fw version",  "designation" : "Software version of the interface board",   "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            313 : { "datatype" : 2,  "access" : ACCESS_R,  "display" : "DrvVoltage",  "designation" : "Supply voltage",                            "unit" : "V",     "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            314 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "OpHrsElec",   "designation" : "Electronic drive unit operating hours",     "unit" : "h",     "min" : None, "max" : None,    "persistent" : True,  "default" : None, "valueDescriptions" : None },
-            315 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "Nominal Spd", "designation" : "Nominal speed",                             "unit" : "Hz",    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            316 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "DrvPower",    "designation" : "Drive power",                               "unit" : "W",     "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            330 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "TempPmpBot",  "designation" : "Temperature of pump",                       "unit" : "C",     "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            349 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "ElecName",    "designation" : "Device designation",                        "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            398 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "HW version",  "designation" : "Hardware version of the interface board",   "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            354 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "ActualSpd",   "designation" : "Actual speed",                              "unit" : "rpm",   "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-            399 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "NominalSpd",  "designation" : "Nominal speed",                             "unit" : "rpm",   "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
-
-            707 : { "datatype" : 2,  "access" : ACCESS_RW, "display" : "SpdSVal",     "designation" : "Setpoint in speed setting mode",            "unit" : "%",     "min" : 30, "max" : 170,       "persistent" : True,  "default" : 75  , "valueDescriptions" : None },
-            717 : { "datatype" : 2,  "access" : ACCESS_RW, "display" : "StdbySVal",   "designation" : "Setpoint speed in standby mode",            "unit" : "%",     "min" : 30, "max" : 100,       "persistent" : True,  "default" : 66.7, "valueDescriptions" : None },
-            721 : { "datatype" : 1,  "access" : ACCESS_RW, "display" : "SlgVlvTime",  "designation" : "Setting for purge gas active",              "unit" : "s",     "min" : 5, "max" : 255,        "persistent" : True,  "default" : 60  , "valueDescriptions" : None },
-            797 : { "datatype" : 1,  "access" : ACCESS_RW, "display" : "RS485Adr",    "designation" : "RS485 interface address",                   "unit" : None,    "min" : 1, "max" : 255,        "persistent" : True,  "default" : 2   , "valueDescriptions" : None }
-        }
-    }
+    def encodeFrame(self, targetAddress, action, regParam, payloadRaw):
+        # First just build the whole checksummed area
+        frame = "{:03d}{:1d}0{:03d}{:02d}{}".format(targetAddress, action, regParam, len(payloadRaw), payloadRaw)
+
+        # Calculate the checksum
+        return frame + "{:03d}".format(sum(frame.encode(encoding = "ASCII")) % 256) + "\r"
+
+    def encodeQuery(self, targetAddress, regParam):
+        # Read requests always carry the "=?" payload independent of the datatype
+        return self.encodeFrame(targetAddress, 0, regParam, "=?")
+
+    # Bytes only encoding for the request hot paths (polling, transactions).
+    # No packet dictionary is built and the result can be written onto the
+    # port as is
+
+    def encodeFrameBytes(self, targetAddress, action, regParam, payloadRaw):
+        frame = b"%03d%1d0%03d%02d%s" % (targetAddress, action, regParam, len(payloadRaw), payloadRaw.encode("ASCII"))
+        return frame + b"%03d\r" % (sum(frame) % 256)
+
+    def encodeQueryBytes(self, targetAddress, regParam):
+        # Read requests are identical every time - they are taken from the
+        # cache that is filled when register sets are assigned to addresses
+        # (compileAddressMap) or encoded once on first use
+        if (regParam < 0) or (regParam >= REGISTER_TABLE_SIZE):
+            raise SerialProtocolViolation("Invalid parameter number {}".format(regParam))
+        table = self.queryFrames.get(targetAddress)
+        if table is None:
+            table = [ None ] * REGISTER_TABLE_SIZE
+            self.queryFrames[targetAddress] = table
+        frame = table[regParam]
+        if frame is None:
+            frame = self.encodeFrameBytes(targetAddress, 0, regParam, "=?")
+            table[regParam] = frame
+        return frame
+
+    def encodeWriteBytes(self, targetAddress, register, value, checkWritable = True):
+        # Counterpart of encodePacket for a compiled register (PfeifferRegister
+        # taken from a PfeifferRegisterSet). Validates the value the same way
+        # but only returns the frame
+        if isinstance(value, (int, float)):
+            if (register.min is not None) and (value < register.min):
+                raise SerialProtocolViolation("Parameter {} has minimum value of {} but {} supplied".format(register.param, register.min, value))
+            if (register.max is not None) and (value > register.max):
+                raise SerialProtocolViolation("Parameter {} has maximum value of {} but {} supplied".format(register.param, register.max, value))
+        if checkWritable and (register.access != ACCESS_RW) and (register.access != ACCESS_W):
+            raise SerialProtocolViolation("Parameter {} is not writable".format(register.param))
+        return self.encodeFrameBytes(targetAddress, 1, register.param, self.encodeDataType(value, register.datatype))
+
+    ACCESS_R  = ACCESS_R
+    ACCESS_RW = ACCESS_RW
+    ACCESS_W  = ACCESS_W
+
+    registers = PfeifferRegisterSets({
+        "TC110"  : "pfeifferpumps.registersets.tc110",
+        "MVP015" : "pfeifferpumps.registersets.mvp015"
+    })
@@ -0,0 +1,276 @@
+import json
+import threading
+import time
+
+from collections import deque, OrderedDict
+
+from pfeifferpumps.pfeiffermetrics import PfeifferPublisherMetrics
+
+# Bounded outbound queue for messages that should be published via MQTT.
+#
+# The queue is limited by the number of messages as well as by the number of
+# bytes (topic and payload). In case a limit is exceeded messages are evicted
+# according to the configured policy:
+#
+#   dropoldest  The oldest queued message is dropped
+#   latest      Only the latest message per topic is kept. A new message for a
+#               topic that is already queued replaces the old one (that counts
+#               as dropped). If the limits are still exceeded the oldest topic
+#               is dropped
+#
+# The queue itself is not thread safe and is only used from the thread that
+# reads the serial ports.
+
+class PfeifferPublishQueue:
+    POLICY_DROPOLDEST = "dropoldest"
+    POLICY_LATEST = "latest"
+
+    def __init__(self, maxMessages = 10000, maxBytes = 1048576, policy = "dropoldest"):
+        if not policy in ( self.POLICY_DROPOLDEST, self.POLICY_LATEST ):
+            raise ValueError("Unknown queue policy {}".format(policy))
+        self.maxMessages = maxMessages
+        self.maxBytes = maxBytes
+        self.policy = policy
+
+        if policy == self.POLICY_LATEST:
+            self.messages = OrderedDict()
+        else:
+            self.messages = deque()
+        self.bytes = 0
+
+        self.queued = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    def put(self, topic, payload, qos = 0, retain = False):
+        msgSize = len(topic) + len(payload)
+        self.append(( topic, payload, qos, retain, msgSize ))
+        self.queued = self.queued + 1
+
+    def extend(self, other):
+        # Moves all messages of another queue (in order) into this one while
+        # applying the limits and policy of this queue
+        while len(other) > 0:
+            self.append(other.popOldest())
+
+    def append(self, msg):
+        topic = msg[0]
+        msgSize = msg[4]
+        if self.policy == self.POLICY_LATEST:
+            old = self.messages.pop(topic, None)
+            if old is not None:
+                self.bytes = self.bytes - old[4]
+                self.dropped = self.dropped + 1
+            self.messages[topic] = msg
+        else:
+            self.messages.append(msg)
+
+        self.bytes = self.bytes + msgSize
+
+        while (len(self.messages) > self.maxMessages) or (self.bytes > self.maxBytes):
+            self.popOldest()
+            self.dropped = self.dropped + 1
+
+    def popOldest(self):
+        if self.policy == self.POLICY_LATEST:
+            _, msg = self.messages.popitem(last = False)
+        else:
+            msg = self.messages.popleft()
+        self.bytes = self.bytes - msg[4]
+        return msg
+
+    def pushFront(self, msg):
+        # Returns a message that could not be published to the head of the
+        # queue. In case a newer message for the topic is already queued the
+        # returned one is dropped
+        if self.policy == self.POLICY_LATEST:
+            if msg[0] in self.messages:
+                self.dropped = self.dropped + 1
+                return
+            self.messages[msg[0]] = msg
+            self.messages.move_to_end(msg[0], last = False)
+        else:
+            self.messages.appendleft(msg)
+        self.bytes = self.bytes + msg[4]
+
+        while (len(self.messages) > self.maxMessages) or (self.bytes > self.maxBytes):
+            self.popOldest()
+            self.dropped = self.dropped + 1
+
+# Publishing stage of the MQTT bridge. Decoded packets are converted into
+# per device / per register topics
+#
+#   <prefix>/<portname>/<address>/<register>
+#
+# where register is the display name of the register (or the parameter number
+# if no register set is known) and queued into a PfeifferPublishQueue. The
+# queue is drained by pump() only while the broker connection is up and only
+# up to a maximum number of in flight messages - paho itself would queue
+# messages without bound while disconnected. The network traffic itself is
+# handled by paho's network thread (loop_start)
+
+class PfeifferMqttPublisher:
+    def __init__(self, client, topicPrefix = "pfeiffer", qos = 0, retain = False, maxMessages = 10000, maxBytes = 1048576, policy = "dropoldest", maxInflight = 20, metrics = None):
+        self.client = client
+        self.topicPrefix = topicPrefix
+        self.qos = qos
+        self.retain = retain
+        self.maxInflight = maxInflight
+        self.queue = PfeifferPublishQueue(maxMessages, maxBytes, policy)
+
+        self.lock = threading.RLock()
+        self.inflight = { }
+        self.acknowledgedEarly = set()
+        self.sent = 0
+        self.publishErrors = 0
+        self.connects = 0
+
+        # Optional callback that is invoked from paho's network thread
+        # whenever queued messages can be handed over again (after connect
+        # or when in flight messages have been acknowledged) so an event
+        # driven main loop knows when to call pump()
+        self.wakeup = None
+
+        self.metrics = None
+        if metrics is not None:
+            self.metrics = PfeifferPublisherMetrics(metrics, self)
+
+        client.on_publish = self.onPublish
+        client.on_connect = self.onConnect
+        client.on_disconnect = self.onDisconnect
+
+    def close(self):
+        if self.metrics is not None:
+            self.metrics.close()
+            self.metrics = None
+
+    def takeOver(self, previous):
+        # Takes over the messages a previous publisher (before a configuration
+        # reload) has not handed over to paho yet. In case both publishers
+        # use the same client the in flight messages are taken over too
+        with previous.lock:
+            self.queue.extend(previous.queue)
+            if previous.client is not self.client:
+                return
+            with self.lock:
+                for mid, sentAt in previous.inflight.items():
+                    if mid in self.acknowledgedEarly:
+                        # Acknowledgement already arrived at this publisher
+                        self.acknowledgedEarly.discard(mid)
+                        self.sent = self.sent + 1
+                    else:
+                        self.inflight[mid] = sentAt
+                self.acknowledgedEarly.update(previous.acknowledgedEarly)
+                self.connects = previous.connects
+
+    def stats(self):
+        return {
+            "queued"        : self.queue.queued,
+            "sent"          : self.sent,
+            "dropped"       : self.queue.dropped,
+            "queuelength"   : len(self.queue),
+            "queuebytes"    : self.queue.bytes,
+            "inflight"      : len(self.inflight),
+            "errors"        : self.publishErrors
+        }
+
+    def topicFor(self, portName, packet):
+        if packet.register is not None:
+            regName = packet.register.display
+        else:
+            regName = str(packet.param)
+        return "{}/{}/{}/{}".format(self.topicPrefix, portName, packet.address, regName.replace(" ", "_"))
+
+    def payloadFor(self, packet):
+        msg = {
+            "address"   : packet.address,
+            "param"     : packet.param,
+            "timestamp" : packet.rxTime
+        }
+        if packet.register is not None:
+            msg["value"] = packet.payload
+            msg["unit"] = packet.register.unit
+            msg["designation"] = packet.register.designation
+        else:
+            msg["raw"] = packet.payloadRaw
+        return json.dumps(msg)
+
+    def publishPacket(self, portName, packet):
+        # Only responses carry values - queries are not published
+        if packet.action != 1:
+            return
+        self.queue.put(self.topicFor(portName, packet), self.payloadFor(packet), self.qos, self.retain)
+
+    def publishAggregate(self, portName, aggregate):
+        # Aggregates (see PfeifferAggregator) are published on the topic of
+        # the register itself
+        msg = aggregate.as_dict()
+        msg["timestamp"] = aggregate.end
+        self.queue.put(self.topicFor(portName, aggregate), json.dumps(msg), self.qos, self.retain)
+
+    def publish(self, topic, payload, qos = None, retain = False):
+        self.queue.put(topic, payload, self.qos if qos is None else qos, retain)
+
+    def pump(self):
+        # Hands queued messages over to paho while connected. Never blocks
+        if not self.client.is_connected():
+            return 0
+
+        published = 0
+        while len(self.queue) > 0:
+            with self.lock:
+                if len(self.inflight) >= self.maxInflight:
+                    break
+            msg = self.queue.popOldest()
+            # paho takes its own message lock inside publish() and holds it
+            # while calling onPublish - publishing while holding our lock
+            # would invert the lock order. An acknowledgement that arrives
+            # before the message has been registered ends up in
+            # acknowledgedEarly
+            info = self.client.publish(msg[0], msg[1], qos = msg[2], retain = msg[3])
+            with self.lock:
+                if info.rc != 0:
+                    self.publishErrors = self.publishErrors + 1
+                    self.queue.pushFront(msg)
+                    break
+                if info.mid in self.acknowledgedEarly:
+                    # Already acknowledged before we registered it
+                    self.acknowledgedEarly.discard(info.mid)
+                    self.sent = self.sent + 1
+                else:
+                    self.inflight[info.mid] = time.monotonic()
+            published = published + 1
+        return published
+
+    def onPublish(self, client, userdata, mid, *args):
+        # Called from the paho network thread as soon as a message has been
+        # sent (QoS 0) or acknowledged (QoS 1 and 2)
+        with self.lock:
+            if mid in self.inflight:
+                if self.metrics is not None:
+                    self.metrics.latency.observe(time.monotonic() - self.inflight[mid])
+                del self.inflight[mid]
+                self.sent = self.sent + 1
+            else:
+                self.acknowledgedEarly.add(mid)
+        wakeup = self.wakeup
+        if (wakeup is not None) and (len(self.queue) > 0):
+            wakeup()
+
+    def onConnect(self, client, userdata, *args):
+        # Every connect after the first one is a reconnect
+        self.connects = self.connects + 1
+        if (self.connects > 1) and (self.metrics is not None):
+            self.metrics.reconnects.value += 1
+        wakeup = self.wakeup
+        if wakeup is not None:
+            wakeup()
+
+    def onDisconnect(self, client, userdata, *args):
+        # Messages in flight during a connection loss are handled by paho
+        # (QoS > 0) or lost (QoS 0) - they no longer block our queue
+        with self.lock:
+            self.inflight = { }
+            self.acknowledgedEarly = set()
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import marshal
+import os
+import sys
+
+from pfeifferpumps.pfeifferproto import PfeifferProtocol, SerialProtocolViolation, ACCESS_R, ACCESS_RW, ACCESS_W
+
+# External register set definitions
+#
+# Register sets for additional device types can be supplied as JSON or TOML
+# files instead of being added to the library. A file contains the name of
+# the device type and the registers indexed by parameter number with the
+# same fields as the built in definitions:
+#
+#   {
+#       "name" : "DCU110",
+#       "registers" : {
+#           "340" : { "datatype" : 7, "access" : "rw", "display" : "Pressure", ... }
+#       }
+#   }
+#
+# or in TOML
+#
+#   name = "DCU110"
+#   [registers.340]
+#   datatype = 7
+#   access = "rw"
+#   ...
+#
+# Access can be given as "r", "rw", "w" or as numeric constant. Optional
+# fields (unit, min, max, default, valueDescriptions) may be omitted which is
+# the only way to express None in TOML.
+#
+# A file is validated once. The validated definition is cached on disk
+# (marshal format) keyed by the SHA-256 hash of the file contents so later
+# loads of an unchanged file skip parsing and validation. Changed files
+# simply hash to a different cache entry.
+
+CACHE_VERSION = 1
+
+REGISTERFILE_DATATYPES = range(0, 13)
+REGISTERFILE_ACCESS = { "r" : ACCESS_R, "rw" : ACCESS_RW, "w" : ACCESS_W }
+REGISTERFILE_REQUIRED = ( "datatype", "access", "display", "designation" )
+REGISTERFILE_OPTIONAL = ( "unit", "min", "max", "persistent", "default", "valueDescriptions" )
+
+class PfeifferRegisterFileError(SerialProtocolViolation):
+    pass
+
+def defaultCacheDir():
+    base = os.environ.get("XDG_CACHE_HOME")
+    if not base:
+        base = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "pfeifferpumps")
+
+def parseRegisterFile(filename, data):
+    if filename.lower().endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise PfeifferRegisterFileError("Reading TOML register files requires Python 3.11 or the tomli package ({})".format(filename))
+        try:
+            return tomllib.loads(data.decode("UTF-8"))
+        except (UnicodeDecodeError, tomllib.TOMLDecodeError) as e:
+            raise PfeifferRegisterFileError("Failed to parse register file {}: {}".format(filename, e))
+    try:
+        return json.loads(data.decode("UTF-8"))
+    except (UnicodeDecodeError, ValueError) as e:
+        raise PfeifferRegisterFileError("Failed to parse register file {}: {}".format(filename, e))
+
+def isNumber(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def validateRegister(filename, regParam, regDef):
+    where = "{} parameter {}".format(filename, regParam)
+    if not isinstance(regDef, dict):
+        raise PfeifferRegisterFileError("{}: Register definition has to be a table".format(where))
+
+    for field in REGISTERFILE_REQUIRED:
+        if not field in regDef:
+            raise PfeifferRegisterFileError("{}: Missing field {}".format(where, field))
+    for field in regDef:
+        if (not field in REGISTERFILE_REQUIRED) and (not field in REGISTERFILE_OPTIONAL):
+            raise PfeifferRegisterFileError("{}: Unknown field {}".format(where, field))
+
+    datatype = regDef["datatype"]
+    if (not isinstance(datatype, int)) or isinstance(datatype, bool) or (not datatype in REGISTERFILE_DATATYPES):
+        raise PfeifferRegisterFileError("{}: Invalid datatype {}".format(where, datatype))
+
+    access = regDef["access"]
+    if isinstance(access, str):
+        if not access.lower() in REGISTERFILE_ACCESS:
+            raise PfeifferRegisterFileError("{}: Invalid access {}".format(where, access))
+        access = REGISTERFILE_ACCESS[access.lower()]
+    elif (not isinstance(access, int)) or isinstance(access, bool) or (not access in REGISTERFILE_ACCESS.values()):
+        raise PfeifferRegisterFileError("{}: Invalid access {}".format(where, access))
+
+    for field in ( "display", "designation" ):
+        if not isinstance(regDef[field], str):
+            raise PfeifferRegisterFileError("{}: Field {} has to be a string".format(where, field))
+
+    unit = regDef.get("unit")
+    if (unit is not None) and (not isinstance(unit, str)):
+        raise PfeifferRegisterFileError("{}: Field unit has to be a string".format(where))
+
+    regMin = regDef.get("min")
+    regMax = regDef.get("max")
+    for field, value in ( ( "min", regMin ), ( "max", regMax ) ):
+        if (value is not None) and (not isNumber(value)):
+            raise PfeifferRegisterFileError("{}: Field {} has to be a number".format(where, field))
+    if (regMin is not None) and (regMax is not None) and (regMin > regMax):
+        raise PfeifferRegisterFileError("{}: Minimum {} exceeds maximum {}".format(where, regMin, regMax))
+
+    persistent = regDef.get("persistent", False)
+    if not isinstance(persistent, bool):
+        raise PfeifferRegisterFileError("{}: Field persistent has to be a boolean".format(where))
+
+    default = regDef.get("default")
+    if (default is not None) and (not isNumber(default)) and (not isinstance(default, str)):
+        raise PfeifferRegisterFileError("{}: Field default has to be a number or string".format(where))
+
+    valueDescriptions = regDef.get("valueDescriptions")
+    if valueDescriptions is not None:
+        if not isinstance(valueDescriptions, dict):
+            raise PfeifferRegisterFileError("{}: Field valueDescriptions has to be a table".format(where))
+        descriptions = { }
+        for value, description in valueDescriptions.items():
+            try:
+                value = int(value)
+            except ValueError:
+                raise PfeifferRegisterFileError("{}: Invalid value {} in valueDescriptions".format(where, value))
+            if not isinstance(description, str):
+                raise PfeifferRegisterFileError("{}: Description of value {} has to be a string".format(where, value))
+            descriptions[value] = description
+        valueDescriptions = descriptions
+
+    return {
+        "datatype"          : datatype,
+        "access"            : access,
+        "display"           : regDef["display"],
+        "designation"       : regDef["designation"],
+        "unit"              : unit,
+        "min"               : regMin,
+        "max"               : regMax,
+        "persistent"        : persistent,
+        "default"           : default,
+        "valueDescriptions" : valueDescriptions
+    }
+
+def validateRegisterFile(filename, content):
+    # Checks the parsed content of a register file and returns the name of
+    # the register set and the definition in the format of the built in sets
+    if not isinstance(content, dict):
+        raise PfeifferRegisterFileError("{}: Register file has to contain a table".format(filename))
+    name = content.get("name")
+    if (not isinstance(name, str)) or (len(name) == 0):
+        raise PfeifferRegisterFileError("{}: Missing register set name".format(filename))
+    registers = content.get("registers")
+    if (not isinstance(registers, dict)) or (len(registers) == 0):
+        raise PfeifferRegisterFileError("{}: Missing registers".format(filename))
+
+    definition = { }
+    for strParam, regDef in registers.items():
+        try:
+            regParam = int(strParam)
+        except ValueError:
+            raise PfeifferRegisterFileError("{}: Invalid parameter number {}".format(filename, strParam))
+        if (regParam < 0) or (regParam > 999):
+            raise PfeifferRegisterFileError("{}: Parameter number {} out of range (0-999)".format(filename, regParam))
+        if regParam in definition:
+            raise PfeifferRegisterFileError("{}: Duplicate parameter number {}".format(filename, regParam))
+        definition[regParam] = validateRegister(filename, regParam, regDef)
+    return name, definition
+
+def readRegisterFile(filename, cacheDir = None):
+    # Returns ( name, definition ) of a register file, either from the cache
+    # or by parsing and validating the file. cacheDir False disables caching
+    with open(filename, "rb") as f:
+        data = f.read()
+
+    cacheFile = None
+    if cacheDir is not False:
+        digest = hashlib.sha256(data).hexdigest()
+        cacheFile = os.path.join(cacheDir or defaultCacheDir(), "{}.regset".format(digest))
+        try:
+            with open(cacheFile, "rb") as f:
+                cached = marshal.load(f)
+            if (cached[0] == CACHE_VERSION) and (cached[1] == tuple(sys.version_info[:2])):
+                return cached[2], cached[3]
+        except (OSError, EOFError, ValueError, TypeError, IndexError):
+            pass
+
+    name, definition = validateRegisterFile(filename, parseRegisterFile(filename, data))
+
+    if cacheFile is not None:
+        try:
+            os.makedirs(os.path.dirname(cacheFile), exist_ok = True)
+            tmpFile = "{}.{}.tmp".format(cacheFile, os.getpid())
+            with open(tmpFile, "wb") as f:
+                marshal.dump(( CACHE_VERSION, tuple(sys.version_info[:2]), name, definition ), f)
+            os.replace(tmpFile, cacheFile)
+        except OSError:
+            # Read only location - the file is simply validated again next time
+            pass
+    return name, definition
+
+def loadRegisterFile(filename, registerSets = None, cacheDir = None):
+    # Reads a register file and adds it to the register sets of the protocol
+    # library (PfeifferProtocol.registers by default). Returns the name of
+    # the register set that can then be assigned to device addresses
+    name, definition = readRegisterFile(filename, cacheDir)
+    if registerSets is None:
+        registerSets = PfeifferProtocol.registers
+    registerSets.add(name, definition)
+    return name
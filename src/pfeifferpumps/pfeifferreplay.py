@@ -0,0 +1,324 @@
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import re
+import time
+
+from datetime import datetime
+
+from pfeifferpumps.pfeifferproto import SerialSimulationDone
+from pfeifferpumps.pfeiffercapture import PfeifferCaptureReader, BLOCK_HEADER, FILE_MAGIC, decodeDataBlock, jsonFieldsTimestampNs
+from pfeifferpumps.pfeifferregisterfile import defaultCacheDir
+
+# Replay of captures (binary captures as well as JSON line dumps)
+#
+# The capture file is memory mapped. For binary captures the time index that
+# is stored inside the file is used to locate blocks. JSON dumps carry no
+# index - one is built by sampling the timestamp of one line about every
+# INDEX_STRIDE bytes (timestamps in captures are monotonic) and cached in the
+# same cache directory as validated register files, keyed by the path, size
+# and modification time of the dump - the directory of the dump itself is
+# never written to.
+#
+# seek() positions the replay on the first record at or after a given point
+# in time. Records are either returned as fast as possible (speed None) or
+# paced at a multiple of real time using the original inter frame gaps.
+
+INDEX_STRIDE = 65536
+INDEX_VERSION = 1
+
+reJsonPacketRaw = re.compile(rb'"packetRaw":\s*"((?:[^"\\]|\\.)*)"')
+reJsonTimestamp = re.compile(rb'"timestamp":\s*(\d+)')
+reJsonTime = re.compile(rb'"time":\s*"([^"]*)"')
+
+def parseTimestamp(ts):
+    # Accepts seconds since the epoch, datetime objects or local time strings
+    # (YYYY-MM-DD HH:MM:SS[.ffffff], optionally with a T separator)
+    if isinstance(ts, datetime):
+        return ts.timestamp()
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    try:
+        return float(ts)
+    except ValueError:
+        pass
+    for fmt in ( "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d" ):
+        try:
+            return datetime.strptime(ts, fmt).timestamp()
+        except ValueError:
+            pass
+    raise ValueError("Invalid timestamp {}".format(ts))
+
+def parseJsonRecord(line):
+    # Extracts (timestampNs, portId, frame) from a line of a JSON dump without
+    # decoding the whole JSON object. Returns None for lines without frame
+    m = reJsonPacketRaw.search(line)
+    if m is None:
+        return None
+    frame = m.group(1).decode("ASCII")
+    if "\\" in frame:
+        frame = json.loads('"' + frame + '"')
+    timestampNs = 0
+    m = reJsonTimestamp.search(line)
+    if m is not None:
+        tm = reJsonTime.search(line)
+        timestampNs = jsonFieldsTimestampNs(m.group(1), tm.group(1).decode("ASCII") if tm else "")
+    return ( timestampNs, 0, frame )
+
+class PfeifferReplay:
+    def __init__(self, filename, speed = None, start = None, useIndexCache = True, cacheDir = None):
+        self.filename = filename
+        self.speed = speed
+        self.useIndexCache = useIndexCache
+        self.cacheDir = cacheDir
+
+        self.file = open(filename, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+        if self.size > 0:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        else:
+            self.mm = b''
+
+        self.isCapture = self.mm[:len(FILE_MAGIC)] == FILE_MAGIC
+        self.dataEnd = self.size
+        if self.isCapture:
+            with PfeifferCaptureReader(filename) as reader:
+                self.index = [ ( entry[0], entry[2] ) for entry in reader.blockIndex() ]
+                self.dataEnd = reader.appendOffset()
+        else:
+            self.index = self.loadJsonIndex()
+        self.indexTimestamps = [ entry[0] for entry in self.index ]
+
+        # Read position: either the offset of the next JSON line or the
+        # position inside the list of decoded records of the current block
+        self.position = 0
+        self.blockNumber = 0
+        self.blockRecords = [ ]
+        self.blockPosition = 0
+
+        self.anchorMonotonic = None
+        self.anchorTimestamp = None
+
+        self.records = 0
+        self.rewind()
+        if start is not None:
+            self.seek(start)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.file is None:
+            return
+        if self.size > 0:
+            self.mm.close()
+        self.file.close()
+        self.file = None
+
+    def fileno(self):
+        return self.file.fileno()
+
+    # Index handling
+
+    def indexCacheFilename(self, st):
+        key = "{}\0{}\0{}".format(os.path.abspath(self.filename), st.st_size, st.st_mtime_ns)
+        return os.path.join(self.cacheDir or defaultCacheDir(), "{}.idx".format(hashlib.sha256(key.encode("UTF-8", errors = "surrogateescape")).hexdigest()))
+
+    def loadJsonIndex(self):
+        st = os.stat(self.filename)
+        if self.useIndexCache:
+            try:
+                with open(self.indexCacheFilename(st), "r") as f:
+                    cached = json.load(f)
+                if (cached.get("version") == INDEX_VERSION) and (cached.get("size") == st.st_size) and (cached.get("mtime") == st.st_mtime_ns) and (cached.get("stride") == INDEX_STRIDE):
+                    return [ tuple(entry) for entry in cached["entries"] ]
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+
+        index = self.buildJsonIndex()
+
+        if self.useIndexCache:
+            try:
+                cacheFile = self.indexCacheFilename(st)
+                os.makedirs(os.path.dirname(cacheFile), exist_ok = True)
+                tmpFile = "{}.{}.tmp".format(cacheFile, os.getpid())
+                with open(tmpFile, "w") as f:
+                    json.dump({ "version" : INDEX_VERSION, "size" : st.st_size, "mtime" : st.st_mtime_ns, "stride" : INDEX_STRIDE, "entries" : index }, f)
+                os.replace(tmpFile, cacheFile)
+            except OSError:
+                # Cache not writable - the index is simply rebuilt next time
+                pass
+        return index
+
+    def buildJsonIndex(self):
+        # Samples one line about every INDEX_STRIDE bytes
+        index = [ ]
+        pos = 0
+        while pos < self.size:
+            end = self.mm.find(b'\n', pos)
+            if end < 0:
+                end = self.size
+            record = self.parseJsonLine(pos, end)
+            if record is not None:
+                index.append(( record[0], pos ))
+            pos = end + 1
+            if pos >= self.size:
+                break
+            nextPos = self.mm.find(b'\n', pos + INDEX_STRIDE)
+            if nextPos < 0:
+                break
+            pos = nextPos + 1
+        return index
+
+    def parseJsonLine(self, start, end):
+        return parseJsonRecord(self.mm[start:end])
+
+    # Positioning
+
+    def rewind(self):
+        self.resetPacing()
+        if self.isCapture:
+            self.loadBlock(0)
+        else:
+            self.position = 0
+
+    def resetPacing(self):
+        self.anchorMonotonic = None
+        self.anchorTimestamp = None
+
+    def loadBlock(self, blockNumber):
+        self.blockNumber = blockNumber
+        self.blockPosition = 0
+        if blockNumber >= len(self.index):
+            self.blockRecords = [ ]
+            return False
+        offset = self.index[blockNumber][1]
+        tag, flags, length, records, firstTs, lastTs = BLOCK_HEADER.unpack_from(self.mm, offset)
+        start = offset + BLOCK_HEADER.size
+        self.blockRecords = decodeDataBlock(flags, self.mm[start:start + length], records)
+        return True
+
+    def seek(self, timestamp):
+        # Positions the replay at the first record at or after the given
+        # timestamp (seconds since the epoch, datetime or time string). Float
+        # seconds are only precise to a fraction of a microsecond so the
+        # target is rounded to microseconds
+        targetNs = int(round(parseTimestamp(timestamp) * 1e6)) * 1000
+        self.resetPacing()
+
+        entry = bisect.bisect_right(self.indexTimestamps, targetNs) - 1
+        if entry < 0:
+            entry = 0
+
+        if self.isCapture:
+            self.loadBlock(entry)
+            while True:
+                while self.blockPosition < len(self.blockRecords):
+                    if self.blockRecords[self.blockPosition][0] >= targetNs:
+                        return
+                    self.blockPosition = self.blockPosition + 1
+                if not self.loadBlock(self.blockNumber + 1):
+                    return
+        else:
+            self.position = self.index[entry][1] if len(self.index) > 0 else 0
+            while self.position < self.size:
+                end = self.mm.find(b'\n', self.position)
+                if end < 0:
+                    end = self.size
+                record = self.parseJsonLine(self.position, end)
+                if (record is not None) and (record[0] >= targetNs):
+                    return
+                self.position = end + 1
+
+    # Reading
+
+    def readRecord(self):
+        # Returns the next record without pacing or None at the end
+        if self.isCapture:
+            while self.blockPosition >= len(self.blockRecords):
+                if not self.loadBlock(self.blockNumber + 1):
+                    return None
+            record = self.blockRecords[self.blockPosition]
+            self.blockPosition = self.blockPosition + 1
+            return record
+
+        while self.position < self.size:
+            end = self.mm.find(b'\n', self.position)
+            if end < 0:
+                end = self.size
+            record = self.parseJsonLine(self.position, end)
+            self.position = end + 1
+            if record is not None:
+                return record
+        return None
+
+    def peekRecord(self):
+        if self.isCapture:
+            while self.blockPosition >= len(self.blockRecords):
+                if not self.loadBlock(self.blockNumber + 1):
+                    return None
+            return self.blockRecords[self.blockPosition]
+        position = self.position
+        record = self.readRecord()
+        self.position = position
+        return record
+
+    def nextRecord(self, timeout = None):
+        # Returns the next record (timestampNs, portId, frame). In case a
+        # replay speed is set the call waits until the record is due. With a
+        # timeout None is returned if the record is not due in time. Raises
+        # SerialSimulationDone at the end of the capture
+        if (self.speed is None) or (self.speed <= 0):
+            record = self.readRecord()
+            if record is None:
+                raise SerialSimulationDone('End of simulation')
+            self.records = self.records + 1
+            return record
+
+        record = self.peekRecord()
+        if record is None:
+            raise SerialSimulationDone('End of simulation')
+
+        wait = self.dueIn(record)
+        if wait > 0:
+            if (timeout is not None) and (timeout < wait):
+                if timeout > 0:
+                    time.sleep(timeout)
+                return None
+            time.sleep(wait)
+
+        self.readRecord()
+        self.records = self.records + 1
+        return record
+
+    def dueIn(self, record):
+        # Seconds until the given record is due. The first record after a
+        # rewind or seek anchors the replay clock
+        now = time.monotonic()
+        if self.anchorMonotonic is None:
+            self.anchorMonotonic = now
+            self.anchorTimestamp = record[0]
+        return self.anchorMonotonic + (record[0] - self.anchorTimestamp) / 1e9 / self.speed - now
+
+    def delayUntilNext(self):
+        # Seconds until nextRecord() would return the next record without
+        # waiting. 0 in case the replay is not paced or the end has been
+        # reached (nextRecord() then raises SerialSimulationDone)
+        if (self.speed is None) or (self.speed <= 0):
+            return 0
+        record = self.peekRecord()
+        if record is None:
+            return 0
+        return max(self.dueIn(record), 0)
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.nextRecord()
+            except SerialSimulationDone:
+                return
@@ -1,28 +1,36 @@
-import serial
-import json
+import time
+import select
 
-from pfeifferpumps.pfeifferproto import PfeifferProtocol, SerialProtocolViolation, SerialSimulationDone
-from datetime import datetime
+from pfeifferpumps.pfeifferproto import PfeifferProtocol, PfeifferFramer, SerialProtocolViolation, SerialProtocolUnknownRegister, SerialCommunicationError
+from pfeifferpumps.pfeiffermetrics import PfeifferPortMetrics
+from pfeifferpumps.pfeifferreplay import PfeifferReplay
 
 class PfeifferRS485Serial:
-    def __init__(self, portFile = '/dev/ttyU0', registersets = None, simulationfile = None, rawsimulationdump = True, pollingAsync = False):
+    def __init__(self, portFile = '/dev/ttyU0', registersets = None, simulationfile = None, rawsimulationdump = True, pollingAsync = False, simulationspeed = None, simulationstart = None):
         self.proto = PfeifferProtocol()
         self.registerset = registersets
-        if registersets:
-            if not isinstance(registersets, dict):
-                raise SerialProtocolViolation('Register sets has to be a dictionary from address to register set identifier')
-            for address, regset in registersets.items():
-                if not regset in self.proto.registers:
-                    raise SerialProtocolViolation("Unknown register set {} for address {}".format(regset, address))
+        self.registerSets = self.proto.compileAddressMap(registersets)
 
         self.port = False
         self.simfile = False
-        self.line = ""
+        self.simTimestamp = None
+        self.metrics = None
+        self.analyser = None
+        self.framer = PfeifferFramer()
         self.pollingAsync = pollingAsync
+
+        # Exceptions raised by the underlying port. pyserial is only imported
+        # when a real port is opened so simulations and replays start faster
+        self.portExceptions = ( )
         if simulationfile == None:
+            import serial
+            self.portExceptions = serial.SerialException
             self.port = serial.Serial(portFile, baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, timeout=None)
         else:
-            self.simfile = open(simulationfile, "r")
+            # JSON dumps as well as binary captures are replayed either as
+            # fast as possible or at simulationspeed times real time, starting
+            # at simulationstart
+            self.simfile = PfeifferReplay(simulationfile, speed = simulationspeed, start = simulationstart)
         self.rawsimulationdump = rawsimulationdump
 
 
@@ -45,63 +53,162 @@ class PfeifferRS485Serial:
             self.simfile.close()
             self.simple = False
 
-    def nextMessage(self):
+    def fileno(self):
+        if self.port:
+            return self.port.fileno()
+        if self.simfile:
+            return self.simfile.fileno()
+        raise SerialCommunicationError('Serial port not connected')
+
+    def setRegisterSets(self, registersets):
+        # Replaces the mapping from device address to register set while the
+        # port stays open. Unknown register sets leave the current mapping
+        # untouched (SerialProtocolViolation)
+        self.registerSets = self.proto.compileAddressMap(registersets)
+        self.registerset = registersets
+
+    def pollDelay(self):
+        # Simulated ports have no file descriptor that signals new data. For
+        # them the number of seconds until the next record is due is
+        # returned, None for real ports (wait for fileno() to be readable)
+        if self.simfile:
+            return self.simfile.delayUntilNext()
+        return None
+
+    def setMetrics(self, metrics, portName):
+        # Enables runtime metrics (see PfeifferMetrics) for this port
+        if metrics is None:
+            self.metrics = None
+        else:
+            self.metrics = PfeifferPortMetrics(metrics, portName)
+
+    def setAnalyser(self, analyser):
+        # Passes every received frame (before register decoding, so also
+        # frames of unknown registers or with invalid payload) and every
+        # framing violation to a PfeifferBusAnalyser
+        self.analyser = analyser
+
+    def writeFrame(self, frame):
+        # Writes an already encoded frame (str or bytes) onto the bus
+        if not self.port:
+            raise SerialCommunicationError('Serial port not connected (or running in simulation mode)')
+        if isinstance(frame, str):
+            frame = frame.encode("ASCII")
+        self.port.write(frame)
+        if (self.metrics is not None) and (frame[3:4] == b'0'):
+            # Queries are tracked to measure the response latency
+            try:
+                self.metrics.querySent(int(frame[0:3]), int(frame[5:8]), time.monotonic())
+            except ValueError:
+                pass
+
+    def nextMessage(self, timeout = None):
+        # Returns the next packet from the bus. In case a timeout is supplied
+        # None is returned in case no complete packet has been received in
+        # time. Ports opened in pollingAsync mode return None immediately
+        # when no timeout is supplied
         if (not self.port) and (not self.simfile):
             raise SerialCommunicationError('Serial port not connected')
 
-        line = self.serialReadNextLine()
+        line = self.serialReadNextLine(timeout)
         if line == None:
             return None
-        packetRaw = self.proto.decodePacketRaw(line)
-        if self.registerset:
-            # Check if we have a protocol decoder / registerset for the given
-            # address and if apply the decode routine
-            if packetRaw["address"] in self.registerset:
-                regset = self.registerset[packetRaw["address"]]
-                packetRaw = self.proto.decodePacket(packetRaw, self.proto.registers[regset])
 
-        # For all received packages we append a timestamp ...
-        tmNow = datetime.now()
-        packetRaw["time"] = str(tmNow)
-        packetRaw["timestamp"] = int(tmNow.timestamp())
+        metrics = self.metrics
+        if metrics is not None:
+            decodeStart = time.perf_counter()
+
+        try:
+            if self.simTimestamp is not None:
+                # Simulated packets carry their original receive time
+                packet = self.proto.decodeFrame(line, self.simTimestamp, time.monotonic())
+            else:
+                packet = self.proto.decodeFrame(line, time.time(), time.monotonic())
+        except SerialProtocolViolation:
+            if metrics is not None:
+                metrics.violations.value += 1
+            if self.analyser is not None:
+                self.analyser.violation()
+            raise
+        if self.analyser is not None:
+            self.analyser.update(packet)
+
+        # Check if we have a protocol decoder / registerset for the given
+        # address and if apply the decode routine
+        regset = self.registerSets.get(packet.address)
+        if metrics is None:
+            if regset is not None:
+                regset.decode(packet)
+            return packet
 
-        return packetRaw
+        try:
+            if regset is not None:
+                regset.decode(packet)
+        except SerialProtocolUnknownRegister:
+            metrics.unknownRegister(packet.address)
+            raise
+        except SerialProtocolViolation:
+            metrics.violations.value += 1
+            raise
+        finally:
+            metrics.frameReceived(packet, time.perf_counter() - decodeStart)
+
+        return packet
 
     # Some internal utility functions
     # Do not use from the outside!
 
-    def serialReadNextLine(self):
+    def serialReadNextLine(self, timeout = None):
         if (not self.port) and (not self.simfile):
             raise SerialCommunicationError("Port not ready")
 
         if self.port:
-            eol = "\r"
+            # Read everything that is currently available (or block for at
+            # least one byte) and split frames out of the receive buffer
+            deadline = None
+            if timeout is not None:
+                deadline = time.monotonic() + timeout
+
             while True:
-                if (self.port.in_waiting == 0) and self.pollingAsync:
-                    return None
-                c = self.port.read(1)
-                c = ord(c)
-                if c:
-                    if ((c < 0x20) or (c > 0x7F)) and (c != 0x0D):
-                        raise SerialProtocolViolation('Protocol violation. Encountered illegal byte {}'.format(c))
-                        pass
-                    else:
-                        self.line = self.line + chr(c)
-                        if c == 0x0D:
-                            break
-                else:
-                    raise SerialCommunicationError('Serial communication error')
+                try:
+                    newLine = self.framer.nextFrame()
+                except SerialProtocolViolation:
+                    if self.metrics is not None:
+                        self.metrics.violations.value += 1
+                    if self.analyser is not None:
+                        self.analyser.violation()
+                    raise
+                if newLine != None:
+                    return newLine
 
-            newLine = self.line
-            self.line = ""
-            return newLine
+                waiting = self.port.in_waiting
+                if waiting == 0:
+                    if (deadline is None) and self.pollingAsync:
+                        return None
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return None
+                        readable, _, _ = select.select([ self.port.fileno() ], [], [], remaining)
+                        if not readable:
+                            return None
+                        continue
+                data = self.port.read(waiting if waiting > 0 else 1)
+                if not data:
+                    raise SerialCommunicationError('Serial communication error')
+                if self.metrics is not None:
+                    self.metrics.bytesReceived.value += len(data)
+                self.framer.feed(data)
         else:
-            line = self.simfile.readline()
-            if line:
-                packet = json.loads(line)
-                line = packet['packetRaw']
-                if self.rawsimulationdump:
-                    print("[SIMULATION] Simulating packet: {}".format(line))
-                return line
-            else:
-                raise SerialSimulationDone('End of simulation')
+            if (timeout is None) and self.pollingAsync:
+                timeout = 0
+            record = self.simfile.nextRecord(timeout)
+            if record is None:
+                return None
+            self.simTimestamp = (record[0] / 1e9) if record[0] > 0 else None
+            line = record[2]
+            if self.metrics is not None:
+                self.metrics.bytesReceived.value += len(line)
+            if self.rawsimulationdump:
+                print("[SIMULATION] Simulating packet: {}".format(line))
+            return line
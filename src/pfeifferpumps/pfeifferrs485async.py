@@ -0,0 +1,209 @@
+import asyncio
+import time
+
+from pfeifferpumps.pfeifferproto import PfeifferProtocol, PfeifferFramer, SerialProtocolViolation, SerialProtocolPayloadError, SerialCommunicationError, SerialProtocolUnknownRegister
+from pfeifferpumps.pfeiffertransaction import PfeifferLatencyEstimator
+
+# asyncio based access to an RS485 bus. Instead of polling the serial port
+# the file descriptor is registered with the event loop - received data is
+# framed and decoded as soon as it arrives and delivered to an internal queue
+# that can be consumed using
+#
+#   async with AsyncPfeifferRS485('/dev/ttyU0', { 1 : "TC110" }) as port:
+#       async for packet in port:
+#           print(packet)
+#
+# Any number of ports (and other protocols like MQTT) can be served by a
+# single event loop. Requests can be issued using the awaitable request()
+# method that sends a query (or write request) and resolves with the matching
+# response from the addressed device.
+
+class AsyncPfeifferRS485:
+    def __init__(self, portFile = '/dev/ttyU0', registersets = None, queueSize = 1024, serialPort = None):
+        self.proto = PfeifferProtocol()
+        self.registerSets = self.proto.compileAddressMap(registersets)
+        self.portFile = portFile
+        self.port = serialPort
+        self.loop = None
+        self.framer = PfeifferFramer()
+        self.queueSize = queueSize
+        self.queue = None
+        self.busLock = None
+        self.pending = { }
+        self.estimators = { }
+        self.closed = True
+
+        self.protocolViolations = 0
+        self.unknownRegisters = 0
+        self.droppedPackets = 0
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def open(self):
+        if self.port is None:
+            import serial
+            self.port = serial.Serial(self.portFile, baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, timeout=0)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize = self.queueSize)
+        self.busLock = asyncio.Lock()
+        self.closed = False
+        self.loop.add_reader(self.port.fileno(), self.onReadable)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.port:
+            self.loop.remove_reader(self.port.fileno())
+            self.port.close()
+            self.port = None
+        for fut in self.pending.values():
+            if not fut.done():
+                fut.set_exception(SerialCommunicationError('Serial port closed'))
+        self.pending = { }
+
+        # Wake up any consumer blocked on the queue
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+    def setRegisterSets(self, registersets):
+        self.registerSets = self.proto.compileAddressMap(registersets)
+
+    # Called by the event loop whenever the serial port is readable
+
+    def onReadable(self):
+        try:
+            data = self.port.read(self.port.in_waiting or 1)
+        except Exception:
+            self.close()
+            return
+        if not data:
+            return
+
+        rxTime = time.time()
+        rxMonotonic = time.monotonic()
+        self.framer.feed(data)
+
+        while True:
+            try:
+                line = self.framer.nextFrame()
+            except SerialProtocolViolation:
+                self.protocolViolations = self.protocolViolations + 1
+                continue
+            if line is None:
+                break
+
+            try:
+                packet = self.proto.decodeFrame(line, rxTime, rxMonotonic)
+            except SerialProtocolViolation:
+                self.protocolViolations = self.protocolViolations + 1
+                continue
+
+            regset = self.registerSets.get(packet.address)
+            if regset is not None:
+                try:
+                    regset.decode(packet)
+                except SerialProtocolUnknownRegister:
+                    self.unknownRegisters = self.unknownRegisters + 1
+                except SerialProtocolPayloadError as e:
+                    # Error reply (or undecodable value) to an outstanding
+                    # request is reported to the requester
+                    self.protocolViolations = self.protocolViolations + 1
+                    if packet.action == 1:
+                        fut = self.pending.pop((packet.address, packet.param), None)
+                        if (fut is not None) and (not fut.done()):
+                            fut.set_exception(e)
+                    continue
+                except SerialProtocolViolation:
+                    self.protocolViolations = self.protocolViolations + 1
+                    continue
+
+            self.dispatch(packet)
+
+    def dispatch(self, packet):
+        if packet.action == 1:
+            fut = self.pending.pop((packet.address, packet.param), None)
+            if (fut is not None) and (not fut.done()):
+                fut.set_result(packet)
+
+        if self.queue.full():
+            # Drop the oldest packet so slow consumers never block the reader
+            self.queue.get_nowait()
+            self.droppedPackets = self.droppedPackets + 1
+        self.queue.put_nowait(packet)
+
+    # Consumer interface
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        packet = await self.nextMessage()
+        if packet is None:
+            raise StopAsyncIteration
+        return packet
+
+    async def nextMessage(self):
+        if self.closed and ((self.queue is None) or self.queue.empty()):
+            return None
+        packet = await self.queue.get()
+        if packet is None:
+            return None
+        return packet
+
+    # Request / response interface. Only a single request is outstanding on
+    # the half duplex bus at any time
+
+    def write(self, frame):
+        if self.closed:
+            raise SerialCommunicationError('Serial port not connected')
+        if isinstance(frame, str):
+            frame = frame.encode("ASCII")
+        self.port.write(frame)
+
+    def estimator(self, address):
+        est = self.estimators.get(address)
+        if est is None:
+            est = PfeifferLatencyEstimator()
+            self.estimators[address] = est
+        return est
+
+    async def request(self, address, param, value = None, timeout = None):
+        # In case no timeout is supplied the timeout adapts to the measured
+        # round trip time of the given device
+        if value is None:
+            frame = self.proto.encodeQueryBytes(address, param)
+        else:
+            if not address in self.registerSets:
+                raise SerialProtocolViolation("No register set configured for address {}".format(address))
+            register = self.registerSets[address].get(param)
+            if register is None:
+                raise SerialProtocolViolation("Unknown register {} in dictionary".format(param))
+            frame = self.proto.encodeWriteBytes(address, register, value)
+
+        est = self.estimator(address)
+        if timeout is None:
+            timeout = est.timeout()
+
+        async with self.busLock:
+            fut = self.loop.create_future()
+            self.pending[(address, param)] = fut
+            try:
+                self.write(frame)
+                txTime = time.monotonic()
+                packet = await asyncio.wait_for(fut, timeout)
+                est.update(packet.rxMonotonic - txTime)
+                return packet
+            except asyncio.TimeoutError:
+                est.timeouts = est.timeouts + 1
+                raise SerialCommunicationError("No response from device {} for parameter {} within {} s".format(address, param, timeout))
+            finally:
+                if self.pending.get((address, param)) is fut:
+                    del self.pending[(address, param)]
@@ -1,54 +1,566 @@
-import serial
 import json
 import argparse
 import sys
 import logging
 import time
 
-import signal, lockfile, grp, os
+import signal, grp, os
 from pwd import getpwnam
-from daemonize import Daemonize
 
-import paho.mqtt.client as mqtt
-
-from pfeifferproto import PfeifferProtocol, SerialProtocolViolation, SerialSimulationDone
-from pfeifferrs485 import PfeifferRS485Serial
+from pfeifferpumps.pfeifferproto import PfeifferProtocol, SerialProtocolViolation, SerialProtocolUnknownRegister, SerialSimulationDone
+from pfeifferpumps.pfeifferrs485 import PfeifferRS485Serial
+from pfeifferpumps.pfeifferpublish import PfeifferMqttPublisher, PfeifferPublishQueue
+from pfeifferpumps.pfeifferstate import PfeifferStateStore
+from pfeifferpumps.pfeiffermetrics import PfeifferMetrics
+from pfeifferpumps.pfeifferregisterfile import readRegisterFile
+from pfeifferpumps.pfeiffermux import PfeifferPortMultiplexer
+from pfeifferpumps.pfeifferaggregate import PfeifferAggregator
+from pfeifferpumps.pfeifferrules import PfeifferRuleEngine
 from datetime import datetime
 
 # Simple daemon to provide a bridge between the RS485 bus that Pfeiffer pumps
 # are using and MQTT (or possibly other backends such as logging systems)
 # The daemon basically:
-#   - Can be triggered to re read the configuration file. In this case it
-#     drops any open serial port (!) and any network connection. This of course
-#     means one could miss messages
-#   - In case of a lost serial port stays in a loop that re-reads the configuration
-#     and tries to open re-open the serial port. It does not terminate (!)
-#   - In case of a lost MQTT connection runs as usual but does not cache any
-#     messages.
+#   - Can be triggered to re read the configuration file. Only what changed is
+#     touched: ports are opened or closed, changed device lists are applied to
+#     the open ports and the MQTT connection is only re-established in case the
+#     broker settings changed - all other buses keep running without a gap
+#   - In case of a lost serial port keeps servicing all other ports and tries
+#     to re-open the failed one every 5 seconds. It does not terminate (!)
+#   - In case of a lost MQTT connection runs as usual and keeps messages in
+#     a bounded outbound queue (limited in message count and bytes). In case
+#     the queue overflows the oldest messages (or all but the latest message
+#     per topic) are dropped
 #
 # To trigger these actions from the outside global variables CAN be used (which
 # is done from inside the signal handlers)
 
 class pfeifferRS485MqttBridgeDaemon:
+    PORT_BATCH = 64
+
     def __init__(self, args, logger, debugMode = False):
         self.debugMode = debugMode
         self.args = args
         self.logger = logger
         self.terminate = False
         self.rereadConfig = True
+        self.stateStore = None
+        self.changesConfig = None
+        self.aggregateSettings = None
+        self.nextAggregateBoundary = None
+        self.historian = None
+        self.historianConfig = None
+        self.rules = None
+        self.rulesConfig = None
+
+        # Open ports by name: { "spec" : ( port, simfile ), "devices" : { address : registerset }, "port" : PfeifferRS485Serial, "aggregator" : PfeifferAggregator }
+        # and the configured ports that are opened again after a failure
+        self.ports = { }
+        self.portConfig = { }
+        self.retryAt = None
+        self.mux = PfeifferPortMultiplexer()
+
+        # MQTT client and publisher with the configuration they have been
+        # created with
         self.mqtt = None
+        self.mqttBroker = None
+        self.publisher = None
+        self.publisherConfig = None
+
+        # Metrics are kept over configuration reloads
+        self.metrics = PfeifferMetrics()
+        self.metricsHttp = None
+        self.metricsTopic = None
+        self.metricsInterval = 60
+        self.openedPorts = set()
 
     def signalSigHup(self, *args):
         self.rereadConfig = True
+        self.wakeup()
 
     def signalTerm(self, *args):
         self.terminate = True
+        self.wakeup()
+
+    def wakeup(self):
+        # Interrupts the wait for data in runPorts
+        self.mux.wakeup()
 
     def __enter__(self):
         return self
 
     def __exit__(self, type, value, tb):
-        pass
+        self.close()
+
+    def close(self):
+        self.disconnectMqtt()
+        for portName in list(self.ports):
+            self.closePort(portName)
+        self.applyHistorian(None)
+        self.mux.close()
+        self.metrics.stopServing()
+
+    def runPorts(self):
+        # Main processing loop: Wait until any of the serial ports received
+        # data, read all packets and hand them over to the publishing stage
+        # until either termination or a configuration reload has been
+        # requested. At most PORT_BATCH frames are read from a port before
+        # the other ports are serviced. Failed ports are closed and opened
+        # again after 5 seconds while all other ports keep running
+        lastStats = time.monotonic()
+        lastMetrics = lastStats
+        mux = self.mux
+        publisher = self.publisher
+        historian = self.historian
+        rules = self.rules
+        if historian is not None:
+            import sqlite3
+
+        while (not self.terminate) and (not self.rereadConfig):
+            now = time.monotonic()
+            if (len(self.ports) == 0) and (self.retryAt is None):
+                # All simulations are done - start them again
+                self.retryAt = now + 5
+            if (self.retryAt is not None) and (now >= self.retryAt):
+                self.retryAt = None
+                for portName, portCfg in self.portConfig.items():
+                    if not portName in self.ports:
+                        self.openPort(portName, portCfg)
+
+            deadline = lastStats + 60
+            if self.metricsTopic is not None:
+                deadline = min(deadline, lastMetrics + self.metricsInterval)
+            if self.retryAt is not None:
+                deadline = min(deadline, self.retryAt)
+            if self.nextAggregateBoundary is not None:
+                deadline = min(deadline, now + self.nextAggregateBoundary - time.time())
+            if (historian is not None) and (historian.nextFlush() is not None):
+                deadline = min(deadline, historian.nextFlush())
+
+            for portName, port in mux.wait(deadline - now):
+                aggregator = self.ports[portName]["aggregator"]
+                for i in range(self.PORT_BATCH):
+                    try:
+                        packet = port.nextMessage()
+                    except (SerialProtocolViolation, SerialProtocolUnknownRegister) as e:
+                        self.logger.debug("{}: {}".format(portName, e))
+                        continue
+                    except SerialSimulationDone:
+                        self.logger.info("{}: Simulation done".format(portName))
+                        self.closePort(portName)
+                        break
+                    except Exception as e:
+                        self.logger.error("{}: Serial port failed".format(portName))
+                        self.logger.error(e)
+                        self.closePort(portName)
+                        if self.retryAt is None:
+                            self.retryAt = time.monotonic() + 5
+                        break
+
+                    if packet is None:
+                        break
+                    if historian is not None:
+                        try:
+                            historian.write(packet, portName)
+                        except sqlite3.Error as e:
+                            self.logger.error("Failed to write into historian database: {} ({} samples pending, {} dropped)".format(e, len(historian.pending), historian.dropped))
+                    if rules is not None:
+                        rules.evaluate(packet, portName)
+                    if (aggregator is not None) and aggregator.update(packet):
+                        if self.ports[portName]["simulated"]:
+                            # Replays advance their windows in packet time
+                            aggregator.advance(packet.rxTime)
+                        continue
+                    if (self.stateStore is not None) and (not self.stateStore.update(packet, portName)):
+                        continue
+                    publisher.publishPacket(portName, packet)
+                else:
+                    mux.setPending(portName)
+
+            if (self.nextAggregateBoundary is not None) and (time.time() >= self.nextAggregateBoundary):
+                self.advanceAggregators()
+
+            publisher.pump()
+            if historian is not None:
+                try:
+                    historian.pump()
+                except sqlite3.Error as e:
+                    self.logger.error("Failed to write into historian database: {} ({} samples pending, {} dropped)".format(e, len(historian.pending), historian.dropped))
+
+            now = time.monotonic()
+            if now - lastStats >= 60:
+                self.logger.debug("Publisher statistics: {}".format(publisher.stats()))
+                lastStats = now
+            if (self.metricsTopic is not None) and (now - lastMetrics >= self.metricsInterval):
+                publisher.publish(self.metricsTopic, json.dumps(self.metrics.snapshot()))
+                lastMetrics = now
+
+    # Serial ports
+
+    def parsePorts(self, configData, registerFiles):
+        # Returns the configured ports by name. Register set names are
+        # resolved (against the built in sets and the register files that
+        # are about to be loaded) so unknown sets are reported before
+        # anything is changed
+        ports = { }
+        for portspec in configData['ports']:
+            regsets = { }
+            for strAdress, regsetName in portspec['devices'].items():
+                try:
+                    adr = int(strAdress)
+                except ValueError:
+                    raise ValueError("Invalid device address {}".format(strAdress))
+                if (not regsetName in PfeifferProtocol.registers) and (not regsetName in registerFiles):
+                    raise ValueError("Unknown register set {} for address {}".format(regsetName, adr))
+                regsets[adr] = regsetName
+
+            portName = portspec.get('name', os.path.basename(portspec['port']))
+            if portName in ports:
+                raise ValueError("Duplicate port name {}".format(portName))
+            ports[portName] = { "spec" : ( portspec['port'], portspec.get('simfile') ), "devices" : regsets }
+        return ports
+
+    def openPort(self, portName, portCfg):
+        portFile, simfile = portCfg["spec"]
+        self.logger.debug("Opening port {} with {} devices".format(portFile, len(portCfg["devices"])))
+        try:
+            newPort = PfeifferRS485Serial(portFile, portCfg["devices"], simulationfile = simfile, pollingAsync = True)
+        except Exception as e:
+            self.logger.error("Failed to initialize port {}, retrying".format(portFile))
+            self.logger.error(e)
+            if self.retryAt is None:
+                self.retryAt = time.monotonic() + 5
+            return
+
+        newPort.setMetrics(self.metrics, portName)
+        if portName in self.openedPorts:
+            newPort.metrics.reconnects.value += 1
+        self.openedPorts.add(portName)
+        self.ports[portName] = {
+            "spec"          : portCfg["spec"],
+            "devices"       : portCfg["devices"],
+            "port"          : newPort,
+            "simulated"     : newPort.pollDelay() is not None,
+            "aggregator"    : self.createAggregator(portName)
+        }
+        self.mux.addPort(portName, newPort)
+
+    def closePort(self, portName):
+        entry = self.ports.pop(portName, None)
+        if entry is None:
+            return
+        self.mux.removePort(portName)
+        entry["port"].close()
+        if entry["aggregator"] is not None:
+            entry["aggregator"].flush()
+
+    def applyPorts(self, ports):
+        # Only touches ports whose configuration changed. Ports that are
+        # removed or now refer to a different device (or simulation file)
+        # are closed, changed device lists are applied to the open port
+        for portName, entry in list(self.ports.items()):
+            portCfg = ports.get(portName)
+            if (portCfg is None) or (portCfg["spec"] != entry["spec"]):
+                self.logger.info("Closing port {}".format(portName))
+                self.closePort(portName)
+
+        self.portConfig = ports
+        for portName, portCfg in ports.items():
+            entry = self.ports.get(portName)
+            if entry is None:
+                self.openPort(portName, portCfg)
+            elif portCfg["devices"] != entry["devices"]:
+                self.logger.info("Updating devices of port {}".format(portName))
+                entry["port"].setRegisterSets(portCfg["devices"])
+                entry["devices"] = portCfg["devices"]
+
+    # Aggregation
+
+    def parseAggregation(self, configData):
+        # Optional aggregation of register values. Instead of every response
+        # one aggregate (count, min, max, mean, last) per window is published
+        # for the selected registers (all registers if not given)
+        #
+        #   "aggregate" : { "window" : 10, "slide" : 5, "registers" : [ "1:309" ] }
+        if not "aggregate" in configData:
+            return None
+        aggregateCfg = configData['aggregate']
+        registers = None
+        if "registers" in aggregateCfg:
+            registers = [ ]
+            for regspec in aggregateCfg['registers']:
+                adr, param = regspec.split(':')
+                registers.append(( int(adr), int(param) ))
+        settings = ( float(aggregateCfg['window']), float(aggregateCfg.get('slide', aggregateCfg['window'])), registers )
+        # Validates window and slide interval
+        PfeifferAggregator(settings[0], settings[1], settings[2])
+        return settings
+
+    def createAggregator(self, portName):
+        if self.aggregateSettings is None:
+            return None
+        window, slide, registers = self.aggregateSettings
+        aggregator = PfeifferAggregator(window, slide, registers, onAggregate = lambda aggregate: self.publishAggregate(portName, aggregate))
+        if self.nextAggregateBoundary is None:
+            self.nextAggregateBoundary = aggregator.nextBoundary(time.time())
+        return aggregator
+
+    def publishAggregate(self, portName, aggregate):
+        if self.publisher is not None:
+            self.publisher.publishAggregate(portName, aggregate)
+
+    def advanceAggregators(self):
+        # Emits all windows of live ports that ended by now
+        now = time.time()
+        nextBoundary = None
+        for entry in self.ports.values():
+            aggregator = entry["aggregator"]
+            if (aggregator is None) or entry["simulated"]:
+                continue
+            aggregator.advance(now)
+            nextBoundary = aggregator.nextBoundary(now)
+        self.nextAggregateBoundary = nextBoundary
+
+    def applyAggregation(self, settings):
+        # Running windows are flushed in case the aggregation changed
+        if settings == self.aggregateSettings:
+            return
+        self.aggregateSettings = settings
+        self.nextAggregateBoundary = None
+        for portName, entry in self.ports.items():
+            if entry["aggregator"] is not None:
+                entry["aggregator"].flush()
+            entry["aggregator"] = self.createAggregator(portName)
+
+    # Historian
+
+    def parseHistorian(self, configData):
+        # Optional historian database that stores every response (before
+        # change detection and aggregation)
+        #
+        #   "historian" : { "database" : "/var/db/pfeiffer.sqlite", "batch" : 1000, "interval" : 1, "maxpending" : 100000 }
+        if not "historian" in configData:
+            return None
+        historianCfg = configData['historian']
+        if not "database" in historianCfg:
+            raise ValueError("Missing historian database")
+        return ( historianCfg['database'], int(historianCfg.get('batch', 1000)), float(historianCfg.get('interval', 1)), int(historianCfg.get('maxpending', 100000)) )
+
+    def applyHistorian(self, settings):
+        # The database is only reopened in case its settings changed. The new
+        # database is opened first so a failure keeps the current one
+        if settings == self.historianConfig:
+            return
+        historian = None
+        if settings is not None:
+            from pfeifferpumps.pfeifferhistorian import PfeifferHistorian
+            historian = PfeifferHistorian(settings[0], batchSize = settings[1], flushInterval = settings[2], maxPending = settings[3])
+            self.logger.info("Writing history into {}".format(settings[0]))
+        if self.historian is not None:
+            try:
+                self.historian.close()
+            except Exception as e:
+                self.logger.error("Failed to write into historian database: {}".format(e))
+            self.logger.info("Closed historian database {} ({} samples written)".format(self.historian.filename, self.historian.written))
+        self.historian = historian
+        self.historianConfig = settings
+
+    # Alarm rules
+
+    def parseRules(self, configData):
+        # Optional alarm rules (see pfeifferrules) evaluated on every response
+        # before change detection and aggregation
+        #
+        #   "rules" : [ { "name" : "speed", "register" : "1:309", "below" : 1000, "hold" : 5, "actions" : [ { "type" : "mqtt" } ] } ]
+        if not "rules" in configData:
+            return None
+        # Compiled here so invalid rules are reported before anything changed
+        return PfeifferRuleEngine(configData['rules'], logger = self.logger)
+
+    def applyRules(self, engine, rulesConfig):
+        # Unchanged rules keep their state (raised alarms, hold times) over
+        # reloads. Alarms are published using the current publisher
+        if rulesConfig != self.rulesConfig:
+            if engine is not None:
+                engine.takeOver(self.rules)
+                self.logger.info("Loaded {} alarm rules".format(len(engine.rules)))
+            self.rules = engine
+            self.rulesConfig = rulesConfig
+        if self.rules is not None:
+            self.rules.publisher = self.publisher
+
+    # MQTT
+
+    def parseMqtt(self, configData):
+        # Returns the broker settings (a change requires a reconnect) and the
+        # settings of the publishing stage
+        if not "mqtt" in configData:
+            raise ValueError("Missing MQTT configuration")
+        mqttCfg = configData['mqtt']
+        for field, description in ( ( "host", "MQTT host parameter" ), ( "port", "MQTT port parameter" ), ( "user", "MQTT user name" ), ( "password", "MQTT password" ), ( "clientid", "MQTT client id" ) ):
+            if not field in mqttCfg:
+                raise ValueError("Missing {}".format(description))
+
+        broker = ( mqttCfg['host'], int(mqttCfg['port']), mqttCfg['user'], mqttCfg['password'], mqttCfg['clientid'] )
+
+        queueCfg = mqttCfg.get('queue', { })
+        publisherCfg = {
+            "topicPrefix"   : mqttCfg.get('topic', 'pfeiffer'),
+            "qos"           : int(mqttCfg.get('qos', 0)),
+            "retain"        : bool(mqttCfg.get('retain', False)),
+            "maxMessages"   : int(queueCfg.get('maxmessages', 10000)),
+            "maxBytes"      : int(queueCfg.get('maxbytes', 1048576)),
+            "policy"        : queueCfg.get('policy', 'dropoldest')
+        }
+        PfeifferPublishQueue(publisherCfg["maxMessages"], publisherCfg["maxBytes"], publisherCfg["policy"])
+        return broker, publisherCfg
+
+    def applyMqtt(self, broker, publisherCfg):
+        # Reconnects only in case the broker settings changed. Messages that
+        # are still queued are handed over to the new publisher
+        if (self.mqtt is not None) and (broker == self.mqttBroker) and (publisherCfg == self.publisherConfig):
+            return
+
+        previous = self.publisher
+        reconnect = (self.mqtt is None) or (broker != self.mqttBroker)
+        if reconnect:
+            if self.mqtt is not None:
+                self.logger.info("MQTT broker settings changed, reconnecting")
+                self.mqtt.loop_stop()
+                self.mqtt.disconnect()
+
+            import paho.mqtt.client as mqtt
+            if hasattr(mqtt, "CallbackAPIVersion"):
+                self.mqtt = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id = broker[4], clean_session = True)
+            else:
+                self.mqtt = mqtt.Client(client_id = broker[4], clean_session = True)
+            self.mqtt.username_pw_set(username = broker[2], password = broker[3])
+            # The connection is established (and kept up) by paho's network
+            # thread so a broker that is not reachable never blocks the ports
+            self.mqtt.connect_async(broker[0], port = broker[1])
+            self.mqttBroker = broker
+
+        if previous is not None:
+            # The final counters of the previous publisher are collected
+            # before the new publisher continues from them
+            previous.close()
+        publisher = PfeifferMqttPublisher(self.mqtt, metrics = self.metrics, **publisherCfg)
+        if previous is not None:
+            publisher.takeOver(previous)
+            self.logger.info("Publisher statistics: {}".format(previous.stats()))
+        publisher.wakeup = self.mux.wakeup
+        self.publisher = publisher
+        self.publisherConfig = publisherCfg
+
+        if reconnect:
+            # paho handles the network traffic (and reconnects) in its own
+            # thread so a broker hiccup never blocks reading the serial ports
+            self.mqtt.loop_start()
+
+    def disconnectMqtt(self):
+        if self.mqtt is None:
+            return
+        self.mqtt.loop_stop()
+        self.mqtt.disconnect()
+        if self.publisher is not None:
+            self.logger.info("Publisher statistics: {}".format(self.publisher.stats()))
+            self.publisher.wakeup = None
+            self.publisher.close()
+        self.mqtt = None
+        self.mqttBroker = None
+        self.publisher = None
+        self.publisherConfig = None
+
+    # Configuration
+
+    def configureStateStore(self, configData):
+        # Optional change detection. Only values that changed by more than
+        # the configured deadband are published
+        #
+        #   "changes" : {
+        #       "absolute" : 0, "relative" : 0.001,
+        #       "units" : { "°C" : { "absolute" : 1 } },
+        #       "registers" : { "1:309" : { "absolute" : 5 } }
+        #   }
+        if not "changes" in configData:
+            return None
+
+        changeCfg = configData['changes']
+        store = PfeifferStateStore(changeCfg.get('absolute', 0), changeCfg.get('relative', 0))
+        for unit, deadband in changeCfg.get('units', { }).items():
+            store.setUnitDeadband(unit, deadband.get('absolute', 0), deadband.get('relative', 0))
+        for regspec, deadband in changeCfg.get('registers', { }).items():
+            adr, param = regspec.split(':')
+            store.setDeadband(int(adr), int(param), deadband.get('absolute', 0), deadband.get('relative', 0))
+        return store
+
+    def parseMetrics(self, configData):
+        # Optional metrics endpoint and MQTT stats topic
+        #
+        #   "metrics" : {
+        #       "http" : { "host" : "127.0.0.1", "port" : 9101 },
+        #       "topic" : "pfeiffer/stats",
+        #       "interval" : 60
+        #   }
+        metricsCfg = configData.get('metrics', { })
+        httpCfg = metricsCfg.get('http')
+        httpAddress = None
+        if httpCfg is not None:
+            httpAddress = ( httpCfg.get('host', '127.0.0.1'), int(httpCfg.get('port', 9101)) )
+        return ( httpAddress, metricsCfg.get('topic'), float(metricsCfg.get('interval', 60)) )
+
+    def applyMetrics(self, settings):
+        httpAddress, self.metricsTopic, self.metricsInterval = settings
+        if httpAddress != self.metricsHttp:
+            self.metrics.stopServing()
+            self.metricsHttp = None
+            if httpAddress is not None:
+                self.metrics.serve(httpAddress[0], httpAddress[1])
+                self.metricsHttp = httpAddress
+                self.logger.info("Serving metrics on {}:{}".format(httpAddress[0], httpAddress[1]))
+
+    def parseRegisterFiles(self, configData):
+        # Optional external register set definitions (JSON or TOML) that
+        # can be referenced by name in the device lists of the ports. The
+        # files are read and validated here but only added to the known
+        # register sets by applyRegisterFiles
+        #
+        #   "registerfiles" : [ "/usr/local/etc/pfeiffer/dcu110.toml" ]
+        registerFiles = { }
+        for registerFile in configData.get('registerfiles', [ ]):
+            name, definition = readRegisterFile(registerFile)
+            registerFiles[name] = ( registerFile, definition )
+        return registerFiles
+
+    def applyRegisterFiles(self, registerFiles):
+        for name, ( registerFile, definition ) in registerFiles.items():
+            PfeifferProtocol.registers.add(name, definition)
+            self.logger.debug("Loaded register set {} from {}".format(name, registerFile))
+
+    def applyConfiguration(self, configData):
+        # Everything is validated before anything is changed so an invalid
+        # configuration keeps the current one running. Only the parts that
+        # changed are touched - unaffected ports keep running
+        stateStore = self.stateStore
+        if configData.get('changes') != self.changesConfig:
+            stateStore = self.configureStateStore(configData)
+        registerFiles = self.parseRegisterFiles(configData)
+        ports = self.parsePorts(configData, registerFiles)
+        broker, publisherCfg = self.parseMqtt(configData)
+        aggregateSettings = self.parseAggregation(configData)
+        historianSettings = self.parseHistorian(configData)
+        rules = self.parseRules(configData)
+        metricsSettings = self.parseMetrics(configData)
+
+        self.applyRegisterFiles(registerFiles)
+        self.applyHistorian(historianSettings)
+        self.stateStore = stateStore
+        self.changesConfig = configData.get('changes')
+        self.applyMqtt(broker, publisherCfg)
+        self.applyRules(rules, configData.get('rules'))
+        self.applyAggregation(aggregateSettings)
+        self.applyPorts(ports)
+        self.applyMetrics(metricsSettings)
 
     def run(self):
         if self.debugMode:
@@ -62,128 +574,27 @@ class pfeifferRS485MqttBridgeDaemon:
         signal.signal(signal.SIGTERM, self.signalTerm)
         signal.signal(signal.SIGINT, self.signalTerm)
 
-        while True:
-            # First read all configuration. In this state there is no open
-            # serial port and no open network connection
-
-            # Now open the MQTT connection. Loop until this works and our serial
-            # port stays open
-
-            # Handle messages in both ways - received messages from RS485 get
-            # published to MQTT and the other way round ...
-            if self.terminate:
-                break
-
-            try:
-                with open(self.args.config) as cfgfile:
-                    configData = json.load(cfgfile)
-            except Exception as e:
-                self.logger.error("Failed to read JSON configuration file{}".format(self.args.config))
-                self.logger.error(e)
-                time.sleep(5)
-                continue
-
-            self.logger.debug("Loaded configuration data")
-
-            # Open any configured serial ports ...
-            serialSuccess = True
-            serialPorts = []
-            for portspec in configData['ports']:
-                regsets = {}
-                self.logger.debug("Configuring port {} with {} devices".format(portspec['port'], len(portspec['devices'])))
-                for strAdress in portspec['devices']:
-                    try:
-                        adr = int(strAdress)
-                    except ValueError:
-                        self.logger.error("Invalid device address {}".format(strAdress))
-                        serialSuccess = False
-                        break
-                    regsets[adr] = portspec['devices'][strAdress]
-                if not serialSuccess:
-                    break
-
+        while not self.terminate:
+            if self.rereadConfig:
+                self.rereadConfig = False
                 try:
-                    if "simfile" in portspec:
-                        newPort = PfeifferRS485Serial(portspec['port'], regsets, simulationfile = portspec['simfile'], pollingAsync = True)
-                    else:
-                        newPort = PfeifferRS485Serial(portspec['port'], regsets, pollingAsync = True)
-                    serialPorts.append(newPort)
+                    with open(self.args.config) as cfgfile:
+                        configData = json.load(cfgfile)
+                    self.logger.debug("Loaded configuration data")
+                    self.applyConfiguration(configData)
                 except Exception as e:
-                    self.logger.error("Failed to initialize port {}".format(portspec['port']))
+                    self.logger.error("Failed to apply configuration file {}".format(self.args.config))
                     self.logger.error(e)
-                    serialSuccess = False
-
-            if not serialSuccess:
-                self.logger.error("Failed to configure ports, retrying")
-                time.sleep(5)
-                for port in serialPorts:
-                    port.close()
-                continue
-
-            self.logger.debug("Initialized and configured serial ports")
-
-            # MQTT initialization. Since we can only connect to a single broker
-
-            if not "mqtt" in configData:
-                self.logger.error("Missing MQTT configuration")
-                time.sleep(5)
-                for port in serialPorts:
-                    port.close()
-                continue
-            if not "host" in configData['mqtt']:
-                self.logger.error("Missing MQTT host parameter")
-                time.sleep(5)
-                for port in serialPorts:
-                    port.close()
-                continue
-            if not "port" in configData['mqtt']:
-                self.logger.error("Missing MQTT port parameter")
-                time.sleep(5)
-                for port in serialPorts:
-                    port.close()
-                continue
-            if not "user" in configData['mqtt']:
-                self.logger.error("Missing MQTT user name")
-                time.sleep(5)
-                for port in serialPorts:
-                    port.close()
-                continue
-            if not "password" in configData['mqtt']:
-                self.logger.error("Missing MQTT password")
-                time.sleep(5)
-                for port in serialPorts:
-                    port.close()
-                continue
-            if not "clientid" in configData['mqtt']:
-                self.logger.error("Missing MQTT client id")
-                time.sleep(5)
-                for port in serialPorts:
-                    port.close()
-                continue
-
-            try:
-                self.mqtt = mqtt.Client(client_id=configData['mqtt']['clientid'], clean_session=True)
-                self.mqtt.username_pw_set(username=configData['mqtt']['user'], password=configData['mqtt']['password'])
-                self.mqtt.connect(
-                    configData['mqtt']['host'],
-                    port = configData['mqtt']['port']
-                )
-            except Exception as e:
-                self.logger.error("Failed to connect with MQTT server")
-                self.logger.error(e)
-                for port in serialPorts:
-                    port.close()
-                time.sleep(5)
-
-
-
-
-            # Cleanup: Close serial ports ...
-            for port in serialPorts:
-                port.close()
+                    if self.publisher is None:
+                        # Nothing running yet - retry later
+                        time.sleep(5)
+                        self.rereadConfig = True
+                        continue
+                    self.logger.error("Keeping the current configuration")
 
-            time.sleep(5)
+            self.runPorts()
 
+        self.close()
         self.logger.info("Shutting down due to user request")
 
 
@@ -298,6 +709,7 @@ def pfeifferrs485mqttBridge():
             bridge.run()
     else:
         logger.debug("Daemonizing ...")
+        from daemonize import Daemonize
         daemon = Daemonize(
             app="PfeifferRS485MQTTBridge",
             action=mainDaemon,
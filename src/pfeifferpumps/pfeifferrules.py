@@ -0,0 +1,379 @@
+import json
+import logging
+
+# Streaming rule engine for alarms on register values
+#
+# Rules are declared as dictionaries (for example in the bridge configuration
+# or a JSON file for the sniffer) and compiled into a dispatch table keyed by
+# ( address, param ). Every decoded response only evaluates the rules of its
+# own register - a single dictionary lookup - so the cost per packet does not
+# depend on the total number of rules.
+#
+#   {
+#       "name"          : "turbo1-speed",
+#       "register"      : "1:309",              (ADR:PARAM or a list of them)
+#       "port"          : "bus0",               (optional, all ports otherwise)
+#       "type"          : "threshold",
+#       "below"         : 1000,
+#       "above"         : 1600,
+#       "hysteresis"    : 10,
+#       "hold"          : 5,
+#       "actions"       : [ { "type" : "log", "level" : "warning" }, { "type" : "mqtt" } ]
+#   }
+#
+# Rule types:
+#
+#   - threshold: The alarm is raised when the value is above "above" or below
+#     "below" (at least one of both). It is cleared again once the value is
+#     back inside the limits by at least "hysteresis"
+#   - rate: Like threshold but applied to the rate of change (units per second)
+#     between two successive responses, for example a rising temperature
+#   - change: Raises a "changed" event whenever the value changes, for example
+#     for the error code register. The first value seen is only remembered
+#
+# With "hold" the condition has to be true for the given number of seconds
+# before the alarm is raised (time is taken from the receive time of the
+# packets, so replays behave like live ports). State is kept per port, device
+# address and parameter so one rule can watch several registers on many pumps
+# independently.
+#
+# Actions:
+#
+#   - log: Writes the event to the logger at the given level (default warning)
+#   - mqtt: Publishes the event as JSON to "topic" (default <prefix>/alarms/<name>)
+#     using the publisher assigned to the engine. Without publisher the action
+#     does nothing
+#   - callback: Calls the function registered with registerCallback under
+#     "name" (or the callable passed as "callback") with the event
+#
+# In addition onEvent is called for every event.
+
+RULE_EVENT_RAISED   = "raised"
+RULE_EVENT_CLEARED  = "cleared"
+RULE_EVENT_CHANGED  = "changed"
+
+class PfeifferAlarmEvent:
+    __slots__ = ( "rule", "event", "port", "address", "param", "register", "value", "timestamp" )
+
+    def __init__(self, rule, event, port, packet, value):
+        self.rule = rule
+        self.event = event
+        self.port = port
+        self.address = packet.address
+        self.param = packet.param
+        self.register = packet.register
+        self.value = value
+        self.timestamp = packet.rxTime
+
+    @property
+    def name(self):
+        return self.rule.name
+
+    def as_dict(self):
+        res = {
+            "name"      : self.rule.name,
+            "event"     : self.event,
+            "port"      : self.port,
+            "address"   : self.address,
+            "param"     : self.param,
+            "value"     : self.value,
+            "condition" : self.rule.describe(),
+            "timestamp" : self.timestamp
+        }
+        if self.register is not None:
+            res["designation"] = self.register.designation
+            res["unit"] = self.register.unit
+        return res
+
+    def __str__(self):
+        if self.register is not None:
+            regName = self.register.designation
+            unit = " {}".format(self.register.unit) if self.register.unit else ""
+        else:
+            regName = str(self.param)
+            unit = ""
+        return "{} {}: {} {} {}{} ({})".format(
+            self.rule.name,
+            self.event,
+            self.address,
+            regName,
+            self.value,
+            unit,
+            self.rule.describe()
+        )
+
+    def __repr__(self):
+        return "PfeifferAlarmEvent({})".format(self.as_dict())
+
+class PfeifferRuleState:
+    __slots__ = ( "active", "since", "lastValue", "lastTime" )
+
+    def __init__(self):
+        # active: alarm has been raised, since: time the condition became
+        # true (while waiting for the hold time), lastValue and lastTime of
+        # the previous response
+        self.active = False
+        self.since = None
+        self.lastValue = None
+        self.lastTime = None
+
+def parseRuleRegister(regspec):
+    try:
+        adr, param = regspec.split(':')
+        return ( int(adr), int(param) )
+    except (ValueError, AttributeError):
+        raise ValueError("Invalid rule register {} (ADR:PARAM)".format(regspec))
+
+class PfeifferRule:
+    def __init__(self, spec):
+        if not "name" in spec:
+            raise ValueError("Missing rule name")
+        self.name = str(spec['name'])
+        if not "register" in spec:
+            raise ValueError("Missing register of rule {}".format(self.name))
+        regspecs = spec['register']
+        if isinstance(regspecs, str):
+            regspecs = [ regspecs ]
+        self.registers = [ parseRuleRegister(regspec) for regspec in regspecs ]
+        if len(self.registers) == 0:
+            raise ValueError("Missing register of rule {}".format(self.name))
+        self.port = spec.get('port')
+        self.hold = float(spec.get('hold', 0))
+        if self.hold < 0:
+            raise ValueError("Hold time of rule {} has to be positive".format(self.name))
+        self.actions = spec.get('actions', [ ])
+
+        # Everything but the actions - rules with the same conditions keep
+        # their state over configuration reloads
+        self.condition = { key : value for key, value in spec.items() if key != 'actions' }
+        self.states = { }
+
+    def describe(self):
+        return self.condition.get('type', '')
+
+    def evaluate(self, port, packet):
+        # Returns the event (RULE_EVENT_*) or None
+        key = ( port, packet.address, packet.param )
+        state = self.states.get(key)
+        if state is None:
+            state = PfeifferRuleState()
+            self.states[key] = state
+        return self.check(state, packet)
+
+class PfeifferThresholdRule(PfeifferRule):
+    def __init__(self, spec):
+        super().__init__(spec)
+        self.above = float(spec['above']) if spec.get('above') is not None else None
+        self.below = float(spec['below']) if spec.get('below') is not None else None
+        if (self.above is None) and (self.below is None):
+            raise ValueError("Rule {} requires a limit (above or below)".format(self.name))
+        if (self.above is not None) and (self.below is not None) and (self.below > self.above):
+            raise ValueError("Lower limit of rule {} is above the upper limit".format(self.name))
+        self.hysteresis = float(spec.get('hysteresis', 0))
+        if self.hysteresis < 0:
+            raise ValueError("Hysteresis of rule {} has to be positive".format(self.name))
+
+    def describe(self):
+        limits = [ ]
+        if self.below is not None:
+            limits.append("below {}".format(self.below))
+        if self.above is not None:
+            limits.append("above {}".format(self.above))
+        return " or ".join(limits)
+
+    def measure(self, state, packet):
+        # Value the limits are applied to
+        value = packet.payload
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        return value
+
+    def check(self, state, packet):
+        value = self.measure(state, packet)
+        if value is None:
+            return None
+
+        if state.active:
+            # Cleared only when inside the limits by at least the hysteresis
+            if (self.above is not None) and (value > self.above - self.hysteresis):
+                return None
+            if (self.below is not None) and (value < self.below + self.hysteresis):
+                return None
+            state.active = False
+            state.since = None
+            return RULE_EVENT_CLEARED
+
+        if ((self.above is None) or (value <= self.above)) and ((self.below is None) or (value >= self.below)):
+            state.since = None
+            return None
+        if state.since is None:
+            state.since = packet.rxTime
+        if packet.rxTime - state.since < self.hold:
+            return None
+        state.active = True
+        return RULE_EVENT_RAISED
+
+class PfeifferRateRule(PfeifferThresholdRule):
+    def describe(self):
+        return "rate {}".format(super().describe())
+
+    def measure(self, state, packet):
+        value = super().measure(state, packet)
+        if value is None:
+            return None
+        lastValue = state.lastValue
+        lastTime = state.lastTime
+        state.lastValue = value
+        state.lastTime = packet.rxTime
+        if (lastTime is None) or (packet.rxTime <= lastTime):
+            return None
+        return (value - lastValue) / (packet.rxTime - lastTime)
+
+class PfeifferChangeRule(PfeifferRule):
+    def describe(self):
+        return "changed"
+
+    def check(self, state, packet):
+        value = packet.payload
+        if state.lastTime is None:
+            state.lastValue = value
+            state.lastTime = packet.rxTime
+            return None
+        if value == state.lastValue:
+            return None
+        state.lastValue = value
+        state.lastTime = packet.rxTime
+        return RULE_EVENT_CHANGED
+
+RULE_TYPES = {
+    "threshold"     : PfeifferThresholdRule,
+    "rate"          : PfeifferRateRule,
+    "change"        : PfeifferChangeRule
+}
+
+LOG_LEVELS = {
+    "debug"         : logging.DEBUG,
+    "info"          : logging.INFO,
+    "warning"       : logging.WARNING,
+    "error"         : logging.ERROR,
+    "critical"      : logging.CRITICAL
+}
+
+class PfeifferRuleEngine:
+    def __init__(self, rules = None, onEvent = None, logger = None, publisher = None):
+        # rules is a list of rule specifications. publisher is used for mqtt
+        # actions (see PfeifferMqttPublisher.publish)
+        self.onEvent = onEvent
+        self.logger = logger if logger is not None else logging.getLogger()
+        self.publisher = publisher
+        self.callbacks = { }
+        self.rules = { }
+        # Rules by ( address, param ): [ ( rule, actions ) ]
+        self.dispatch = { }
+
+        if rules is not None:
+            for spec in rules:
+                self.addRule(spec)
+
+    def addRule(self, spec):
+        if not isinstance(spec, dict):
+            raise ValueError("Invalid rule specification {}".format(spec))
+        ruleType = spec.get('type', 'threshold')
+        if not ruleType in RULE_TYPES:
+            raise ValueError("Unknown rule type {} of rule {}".format(ruleType, spec.get('name')))
+        rule = RULE_TYPES[ruleType](spec)
+        if rule.name in self.rules:
+            raise ValueError("Duplicate rule {}".format(rule.name))
+        actions = [ self.compileAction(rule, action) for action in rule.actions ]
+
+        self.rules[rule.name] = rule
+        for key in rule.registers:
+            if not key in self.dispatch:
+                self.dispatch[key] = [ ]
+            self.dispatch[key].append(( rule, actions ))
+        return rule
+
+    def registerCallback(self, name, callback):
+        self.callbacks[name] = callback
+
+    def takeOver(self, previous):
+        # Keeps the state (active alarms, pending hold times, last values) of
+        # all rules whose conditions did not change
+        if previous is None:
+            return
+        for name, rule in self.rules.items():
+            oldRule = previous.rules.get(name)
+            if (oldRule is not None) and (oldRule.condition == rule.condition):
+                rule.states = oldRule.states
+
+    def evaluate(self, packet, port = None):
+        # Evaluates the rules of the packets register. Returns the number of
+        # events that have been fired
+        if packet.action != 1:
+            return 0
+        rules = self.dispatch.get(( packet.address, packet.param ))
+        if rules is None:
+            return 0
+        fired = 0
+        for rule, actions in rules:
+            if (rule.port is not None) and (rule.port != port):
+                continue
+            res = rule.evaluate(port, packet)
+            if res is None:
+                continue
+            event = PfeifferAlarmEvent(rule, res, port, packet, packet.payload)
+            for action in actions:
+                action(event)
+            if self.onEvent is not None:
+                self.onEvent(event)
+            fired = fired + 1
+        return fired
+
+    def compileAction(self, rule, action):
+        actionType = action.get('type') if isinstance(action, dict) else None
+        if actionType == "log":
+            level = action.get('level', 'warning')
+            if not level in LOG_LEVELS:
+                raise ValueError("Unknown log level {} in rule {}".format(level, rule.name))
+            level = LOG_LEVELS[level]
+            return lambda event: self.logger.log(level, "Alarm {}".format(event))
+        if actionType == "mqtt":
+            topic = action.get('topic')
+            qos = int(action['qos']) if 'qos' in action else None
+            retain = bool(action.get('retain', False))
+            return lambda event: self.publishEvent(event, topic, qos, retain)
+        if actionType == "callback":
+            if callable(action.get('callback')):
+                callback = action['callback']
+                return lambda event: self.callEvent(callback, event)
+            if not "name" in action:
+                raise ValueError("Missing callback name in rule {}".format(rule.name))
+            name = action['name']
+            return lambda event: self.callEvent(self.callbacks.get(name), event)
+        raise ValueError("Unknown action {} in rule {}".format(actionType, rule.name))
+
+    def publishEvent(self, event, topic, qos, retain):
+        if self.publisher is None:
+            return
+        if topic is None:
+            topic = "{}/alarms/{}".format(self.publisher.topicPrefix, event.rule.name)
+        self.publisher.publish(topic, json.dumps(event.as_dict()), qos = qos, retain = retain)
+
+    def callEvent(self, callback, event):
+        # A failing callback does not prevent the remaining actions
+        if callback is None:
+            return
+        try:
+            callback(event)
+        except Exception as e:
+            self.logger.error("Alarm callback of rule {} failed: {}".format(event.rule.name, e))
+
+def loadRules(filename):
+    # Reads a JSON file containing a list of rule specifications
+    with open(filename, "r") as f:
+        rules = json.load(f)
+    if isinstance(rules, dict):
+        rules = rules.get('rules', [ ])
+    if not isinstance(rules, list):
+        raise ValueError("Rule file {} does not contain a list of rules".format(filename))
+    return rules
@@ -0,0 +1,218 @@
+import heapq
+import time
+
+from pfeifferpumps.pfeifferproto import SerialProtocolUnknownRegister, SerialCommunicationError
+from pfeifferpumps.pfeiffertransaction import PfeifferTransactionEngine
+
+# Master mode polling scheduler
+#
+# Registers are polled with individual target rates (for example ActualSpd
+# at 5 Hz and temperatures at 0.1 Hz). Every poll is a single request /
+# response transaction on the half duplex bus - the scheduler only sends the
+# next query after the previous one has been answered (or timed out) and the
+# bus has been idle for the inter frame gap, so requests never collide.
+#
+# The time required for a transaction is estimated from the frame lengths at
+# the configured baud rate (10 bit times per character for 8N1) plus the
+# turnaround time of the device. In case the requested rates exceed the
+# available bus time the capacity is distributed using weighted max-min
+# fairness - registers that cannot be served at their requested rate are
+# reported by plan() and served at the highest feasible rate. Polls are
+# executed in earliest deadline first order.
+
+# Payload length of responses per datatype
+DATATYPE_PAYLOADLENGTH = {
+    0 : 6, 1 : 6, 2 : 6, 3 : 6, 4 : 6, 6 : 1, 7 : 3, 9 : 6, 10 : 6, 11 : 16, 12 : 8
+}
+
+FRAME_OVERHEAD = 14
+
+class PfeifferPoll:
+    def __init__(self, address, param, rate, weight, query, transactionTime):
+        self.address = address
+        self.param = param
+        self.rate = rate
+        self.weight = weight
+        self.query = query
+        self.transactionTime = transactionTime
+        self.effectiveRate = rate
+        self.deadline = 0
+        self.polls = 0
+        self.timeouts = 0
+        self.missedDeadlines = 0
+
+class PfeifferPollScheduler:
+    def __init__(self, port, baudrate = 9600, turnaround = 0.01, interFrameGap = 0.004, maxUtilization = 0.9, engine = None):
+        self.port = port
+        self.proto = port.proto
+        self.baudrate = baudrate
+        self.turnaround = turnaround
+        if engine is None:
+            # A missed poll is simply repeated in the next period
+            engine = PfeifferTransactionEngine(port, retries = 0)
+        self.engine = engine
+        self.engine.onPacket = self.forwardPacket
+        self.interFrameGap = interFrameGap
+        self.maxUtilization = maxUtilization
+
+        self.polls = { }
+        self.queue = [ ]
+        self.sequence = 0
+        self.running = False
+
+        self.onPacket = None
+        self.onTimeout = None
+
+    def charTime(self):
+        return 10.0 / self.baudrate
+
+    def estimateTransactionTime(self, address, param):
+        payloadLength = 6
+        regset = self.port.registerSets.get(address)
+        if (regset is not None) and (param in regset):
+            payloadLength = DATATYPE_PAYLOADLENGTH.get(regset[param].datatype, payloadLength)
+
+        chars = (FRAME_OVERHEAD + 2) + (FRAME_OVERHEAD + payloadLength)
+        return chars * self.charTime() + self.turnaround + self.interFrameGap
+
+    def addPoll(self, address, param, rate, weight = 1.0):
+        if rate <= 0:
+            raise ValueError("Poll rate has to be positive")
+        regset = self.port.registerSets.get(address)
+        if (regset is not None) and (not param in regset):
+            raise SerialProtocolUnknownRegister("Unknown register {} for device {}".format(param, address))
+
+        poll = PfeifferPoll(
+            address, param, rate, weight,
+            self.proto.encodeQueryBytes(address, param),
+            self.estimateTransactionTime(address, param)
+        )
+        self.polls[(address, param)] = poll
+        self.plan()
+        return poll
+
+    def removePoll(self, address, param):
+        if (address, param) in self.polls:
+            del self.polls[(address, param)]
+            self.plan()
+
+    def plan(self):
+        # Weighted max-min fair distribution of bus time. Every poll demands
+        # rate * transactionTime of the bus time. Polls whose demand is lower
+        # than their fair share are fully served, the remaining capacity is
+        # distributed between the others according to their weights
+        remaining = self.maxUtilization
+        unsatisfied = list(self.polls.values())
+        for poll in unsatisfied:
+            poll.effectiveRate = poll.rate
+
+        while len(unsatisfied) > 0:
+            totalWeight = sum(poll.weight for poll in unsatisfied)
+            satisfied = [ ]
+            for poll in unsatisfied:
+                share = remaining * poll.weight / totalWeight
+                if poll.rate * poll.transactionTime <= share:
+                    satisfied.append(poll)
+            if len(satisfied) == 0:
+                for poll in unsatisfied:
+                    share = remaining * poll.weight / totalWeight
+                    poll.effectiveRate = share / poll.transactionTime
+                break
+            for poll in satisfied:
+                remaining = remaining - poll.rate * poll.transactionTime
+                unsatisfied.remove(poll)
+
+        # Rebuild the deadline queue
+        now = time.monotonic()
+        self.queue = [ ]
+        for poll in self.polls.values():
+            if poll.deadline == 0:
+                poll.deadline = now
+            self.pushPoll(poll)
+
+        return self.unservable()
+
+    def unservable(self):
+        # List of all registers that cannot be served at their requested rate
+        res = [ ]
+        for poll in self.polls.values():
+            if poll.effectiveRate < poll.rate * 0.999:
+                res.append({
+                    "address"       : poll.address,
+                    "param"         : poll.param,
+                    "requested"     : poll.rate,
+                    "achievable"    : poll.effectiveRate
+                })
+        return res
+
+    def utilization(self):
+        return sum(poll.effectiveRate * poll.transactionTime for poll in self.polls.values())
+
+    def pushPoll(self, poll):
+        self.sequence = self.sequence + 1
+        heapq.heappush(self.queue, (poll.deadline, self.sequence, poll))
+
+    # Bus access
+
+    def forwardPacket(self, packet):
+        if self.onPacket:
+            self.onPacket(packet)
+
+    def transact(self, poll):
+        # Sends the query and waits for the matching response using the per
+        # device adaptive timeout of the transaction engine. Any other packet
+        # received in the meantime is passed to the packet callback
+        try:
+            return self.engine.transact(poll.address, poll.param, frame = poll.query)
+        except SerialCommunicationError:
+            return None
+
+    def step(self):
+        # Executes the poll with the earliest deadline. Returns the response
+        # packet or None in case of a timeout
+        if len(self.queue) == 0:
+            return None
+
+        deadline, _, poll = heapq.heappop(self.queue)
+        now = time.monotonic()
+        if deadline > now:
+            time.sleep(deadline - now)
+
+        packet = self.transact(poll)
+        poll.polls = poll.polls + 1
+
+        # Schedule the next poll. In case we are already more than a whole
+        # period late we do not try to catch up with a burst of requests
+        period = 1.0 / max(poll.effectiveRate, 1e-6)
+        poll.deadline = poll.deadline + period
+        finished = time.monotonic()
+        if poll.deadline < finished - period:
+            poll.missedDeadlines = poll.missedDeadlines + 1
+            poll.deadline = finished
+        self.pushPoll(poll)
+
+        # Keep the bus idle for the inter frame gap
+        if self.interFrameGap > 0:
+            time.sleep(self.interFrameGap)
+
+        if packet is None:
+            poll.timeouts = poll.timeouts + 1
+            if self.onTimeout:
+                self.onTimeout(poll.address, poll.param)
+        elif self.onPacket:
+            self.onPacket(packet)
+
+        return packet
+
+    def run(self, duration = None):
+        self.running = True
+        endTime = None if duration is None else time.monotonic() + duration
+        while self.running:
+            if (endTime is not None) and (time.monotonic() >= endTime):
+                break
+            if len(self.queue) == 0:
+                raise SerialCommunicationError("No registers configured for polling")
+            self.step()
+
+    def stop(self):
+        self.running = False
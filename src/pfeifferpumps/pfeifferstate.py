@@ -0,0 +1,145 @@
+import time
+
+# In memory state table of all registers seen on one or more buses
+#
+# The table is keyed by (port, address, param) and keeps the latest decoded
+# value, the receive timestamp and the number of updates. Every update is
+# compared against the last value that has been reported as changed - in case
+# the difference exceeds the deadband of the register a "changed" event is
+# emitted to all subscribers. Deadbands can be configured
+#
+#   - per register (address, param)
+#   - per unit (for example 0.5 for all "°C" registers)
+#   - as default for all numeric registers
+#
+# An absolute deadband is given in the unit of the register. A relative
+# deadband is a fraction of the registers definition range (max - min) if
+# known or of the last reported value otherwise. Non numeric values (booleans,
+# strings, ...) are reported on every change of their value.
+
+class PfeifferRegisterState:
+    __slots__ = ( "value", "reportedValue", "rxTime", "updates", "changes", "register" )
+
+    def __init__(self):
+        self.value = None
+        self.reportedValue = None
+        self.rxTime = None
+        self.updates = 0
+        self.changes = 0
+        self.register = None
+
+class PfeifferStateStore:
+    def __init__(self, absoluteDeadband = 0, relativeDeadband = 0):
+        self.states = { }
+        self.registerDeadbands = { }
+        self.unitDeadbands = { }
+        self.defaultDeadband = ( absoluteDeadband, relativeDeadband )
+        self.resolvedDeadbands = { }
+        self.subscribers = [ ]
+
+        self.updates = 0
+        self.changes = 0
+
+    def setDeadband(self, address, param, absolute = 0, relative = 0):
+        self.registerDeadbands[(address, param)] = ( absolute, relative )
+        self.resolvedDeadbands = { }
+
+    def setUnitDeadband(self, unit, absolute = 0, relative = 0):
+        self.unitDeadbands[unit] = ( absolute, relative )
+        self.resolvedDeadbands = { }
+
+    def setDefaultDeadband(self, absolute = 0, relative = 0):
+        self.defaultDeadband = ( absolute, relative )
+        self.resolvedDeadbands = { }
+
+    def subscribe(self, callback):
+        # The callback is called as callback(port, packet, previousValue)
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def deadband(self, address, param, register):
+        # Resolves the absolute deadband for a given register. Resolved values
+        # are cached since they only depend on the static configuration
+        cached = self.resolvedDeadbands.get((address, param))
+        if (cached is not None) and (cached[0] is register):
+            return cached[1]
+
+        absolute, relative = self.registerDeadbands.get((address, param), (None, None))
+        if absolute is None:
+            unit = register.unit if register is not None else None
+            absolute, relative = self.unitDeadbands.get(unit, self.defaultDeadband)
+
+        span = None
+        if (register is not None) and (register.min is not None) and (register.max is not None) and (register.max > register.min):
+            span = register.max - register.min
+
+        resolved = ( absolute or 0, relative or 0, span )
+        self.resolvedDeadbands[(address, param)] = ( register, resolved )
+        return resolved
+
+    def get(self, port, address, param):
+        return self.states.get((port, address, param))
+
+    def snapshot(self):
+        return {
+            key : { "value" : state.value, "rxTime" : state.rxTime, "updates" : state.updates, "changes" : state.changes }
+            for key, state in self.states.items()
+        }
+
+    @staticmethod
+    def isNumeric(value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    def exceedsDeadband(self, address, param, register, previous, value):
+        if previous is None:
+            return True
+        if not (self.isNumeric(previous) and self.isNumeric(value)):
+            return previous != value
+
+        absolute, relative, span = self.deadband(address, param, register)
+        threshold = absolute
+        if relative > 0:
+            if span is not None:
+                threshold = max(threshold, relative * span)
+            else:
+                threshold = max(threshold, relative * abs(previous))
+        if threshold <= 0:
+            return previous != value
+        return abs(value - previous) >= threshold
+
+    def update(self, packet, port = None):
+        # Updates the state table from a received packet. Returns True in
+        # case the packet has been reported as change. Queries carry no
+        # values and are ignored
+        if packet.action != 1:
+            return False
+
+        key = (port, packet.address, packet.param)
+        state = self.states.get(key)
+        if state is None:
+            state = PfeifferRegisterState()
+            self.states[key] = state
+
+        if packet.register is not None:
+            value = packet.payload
+        else:
+            value = packet.payloadRaw
+
+        state.value = value
+        state.rxTime = packet.rxTime if packet.rxTime is not None else time.time()
+        state.register = packet.register
+        state.updates = state.updates + 1
+        self.updates = self.updates + 1
+
+        previous = state.reportedValue
+        if (state.changes > 0) and (not self.exceedsDeadband(packet.address, packet.param, packet.register, previous, value)):
+            return False
+
+        state.reportedValue = value
+        state.changes = state.changes + 1
+        self.changes = self.changes + 1
+        for subscriber in self.subscribers:
+            subscriber(port, packet, previous)
+        return True
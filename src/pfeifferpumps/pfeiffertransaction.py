@@ -0,0 +1,282 @@
+import threading
+import queue
+import select
+import time
+import os
+
+from concurrent.futures import Future
+
+from pfeifferpumps.pfeifferproto import SerialProtocolViolation, SerialProtocolPayloadError, SerialProtocolUnknownRegister, SerialCommunicationError
+
+# Per device round trip time estimation. The response timeout is derived from
+# the smoothed round trip time and its variation (the same way TCP determines
+# its retransmission timeout, including a minimum allowance for scheduling
+# jitter) and clamped into a configurable interval. Until the first response
+# has been seen the initial timeout is used
+
+class PfeifferLatencyEstimator:
+    JITTER_ALLOWANCE = 0.005
+
+    def __init__(self, initialTimeout = 0.25, minTimeout = 0.02, maxTimeout = 1.0):
+        self.initialTimeout = initialTimeout
+        self.minTimeout = minTimeout
+        self.maxTimeout = maxTimeout
+
+        self.srtt = None
+        self.rttvar = None
+        self.samples = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.minRtt = None
+        self.maxRtt = None
+        self.lastRtt = None
+
+    def update(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2.0
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.samples = self.samples + 1
+        self.lastRtt = rtt
+        if (self.minRtt is None) or (rtt < self.minRtt):
+            self.minRtt = rtt
+        if (self.maxRtt is None) or (rtt > self.maxRtt):
+            self.maxRtt = rtt
+
+    def timeout(self):
+        if self.srtt is None:
+            return self.initialTimeout
+        return min(max(self.srtt + max(4.0 * self.rttvar, self.JITTER_ALLOWANCE), self.minTimeout), self.maxTimeout)
+
+    def stats(self):
+        return {
+            "samples"   : self.samples,
+            "timeouts"  : self.timeouts,
+            "retries"   : self.retries,
+            "srtt"      : self.srtt,
+            "rttvar"    : self.rttvar,
+            "minrtt"    : self.minRtt,
+            "maxrtt"    : self.maxRtt,
+            "lastrtt"   : self.lastRtt,
+            "timeout"   : self.timeout()
+        }
+
+# Request / response transactions on top of PfeifferRS485Serial
+#
+# transact() sends a query (or write request) and blocks until the matching
+# response (same address and parameter, action 1) has been received. The
+# response timeout adapts to the measured turnaround of every device. In case
+# of a timeout or a corrupted frame (checksum error) while waiting the request
+# is retried with exponential backoff. A valid response carrying an error code
+# (NO_DEF, _RANGE, _LOGIC) or an undecodable payload is not retried but raised
+# to the caller as SerialProtocolDeviceError or SerialProtocolPayloadError.
+#
+# Half duplex transceivers without echo suppression receive every frame they
+# transmit. With echo = True the first frame identical to the request is
+# skipped - devices acknowledge a write with a frame identical to the request,
+# so without skipping the echo every write would resolve on its own echo.
+#
+# request() queues a transaction for a background worker thread that owns
+# the bus and returns a concurrent.futures.Future (use asyncio.wrap_future to
+# await it). While idle the worker keeps reading the bus and passes all
+# unrelated packets to the onPacket callback.
+
+class PfeifferTransactionEngine:
+    def __init__(self, port, retries = 2, backoff = 0.02, initialTimeout = 0.25, minTimeout = 0.02, maxTimeout = 1.0, echo = False):
+        self.port = port
+        self.echo = echo
+        self.proto = port.proto
+        self.retries = retries
+        self.backoff = backoff
+        self.initialTimeout = initialTimeout
+        self.minTimeout = minTimeout
+        self.maxTimeout = maxTimeout
+
+        self.estimators = { }
+        self.requests = queue.Queue()
+        self.worker = None
+        self.running = False
+        self.closed = False
+        # Serializes starting and stopping the worker as well as queueing
+        # requests so no request is queued behind a stopped worker
+        self.workerLock = threading.Lock()
+        self.wakeupRead = None
+        self.wakeupWrite = None
+
+        self.onPacket = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def estimator(self, address):
+        est = self.estimators.get(address)
+        if est is None:
+            est = PfeifferLatencyEstimator(self.initialTimeout, self.minTimeout, self.maxTimeout)
+            self.estimators[address] = est
+        return est
+
+    def latencyStats(self):
+        return { address : est.stats() for address, est in self.estimators.items() }
+
+    def encodeRequest(self, address, param, value):
+        if value is None:
+            return self.proto.encodeQueryBytes(address, param)
+        regset = self.port.registerSets.get(address)
+        if regset is None:
+            raise SerialProtocolViolation("No register set configured for address {}".format(address))
+        register = regset.get(param)
+        if register is None:
+            raise SerialProtocolViolation("Unknown register {} in dictionary".format(param))
+        return self.proto.encodeWriteBytes(address, register, value)
+
+    def forwardPacket(self, packet):
+        if self.onPacket:
+            self.onPacket(packet)
+
+    def transact(self, address, param, value = None, frame = None):
+        # Executes a transaction on the calling thread. Must not be used while
+        # the background worker is running
+        if frame is None:
+            frame = self.encodeRequest(address, param, value)
+        elif isinstance(frame, str):
+            frame = frame.encode("ASCII")
+        est = self.estimator(address)
+
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                est.retries = est.retries + 1
+                time.sleep(self.backoff * (2 ** (attempt - 1)))
+
+            self.port.writeFrame(frame)
+            txTime = time.monotonic()
+            deadline = txTime + est.timeout()
+            echoPending = self.echo
+
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    est.timeouts = est.timeouts + 1
+                    break
+                try:
+                    packet = self.port.nextMessage(timeout = remaining)
+                except SerialProtocolPayloadError as e:
+                    # Valid frame - the device itself reported an error or
+                    # sent a value we cannot decode. Retrying won't help
+                    packet = e.packet
+                    if echoPending and (packet.packetRaw.encode("ASCII") == frame):
+                        echoPending = False
+                        continue
+                    if (packet.action == 1) and (packet.address == address) and (packet.param == param):
+                        est.update(packet.rxMonotonic - txTime)
+                        raise
+                    continue
+                except SerialProtocolViolation:
+                    # Most likely our response got corrupted - retry
+                    break
+                except SerialProtocolUnknownRegister:
+                    continue
+
+                if packet is None:
+                    est.timeouts = est.timeouts + 1
+                    break
+                if echoPending and (packet.packetRaw.encode("ASCII") == frame):
+                    # Our own request looped back by the transceiver
+                    echoPending = False
+                    continue
+                if (packet.action == 1) and (packet.address == address) and (packet.param == param):
+                    est.update(packet.rxMonotonic - txTime)
+                    return packet
+                self.forwardPacket(packet)
+
+        raise SerialCommunicationError("No valid response from device {} for parameter {} after {} attempts".format(address, param, self.retries + 1))
+
+    # Asynchronous interface
+
+    def request(self, address, param, value = None):
+        fut = Future()
+        frame = self.encodeRequest(address, param, value)
+        with self.workerLock:
+            if self.closed:
+                fut.set_exception(SerialCommunicationError("Transaction engine closed"))
+                return fut
+            self.startLocked()
+            self.requests.put((fut, address, param, frame))
+            os.write(self.wakeupWrite, b'\x00')
+        return fut
+
+    def start(self):
+        with self.workerLock:
+            self.closed = False
+            self.startLocked()
+
+    def startLocked(self):
+        # Starts the worker - the caller holds workerLock
+        if self.running:
+            return
+        self.running = True
+        self.wakeupRead, self.wakeupWrite = os.pipe()
+        self.worker = threading.Thread(target = self.workerMain, daemon = True)
+        self.worker.start()
+
+    def close(self):
+        with self.workerLock:
+            self.closed = True
+            if not self.running:
+                return
+            self.running = False
+            self.requests.put(None)
+            os.write(self.wakeupWrite, b'\x00')
+            self.worker.join()
+            self.worker = None
+            os.close(self.wakeupRead)
+            os.close(self.wakeupWrite)
+
+        # Fail everything that has not been processed
+        while True:
+            try:
+                req = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if req is not None:
+                req[0].set_exception(SerialCommunicationError("Transaction engine closed"))
+
+    def workerMain(self):
+        while self.running:
+            try:
+                req = self.requests.get_nowait()
+            except queue.Empty:
+                req = False
+
+            if req is None:
+                break
+            if req is False:
+                # Idle - keep the bus serviced until either data arrives or a
+                # new request wakes us up
+                readable, _, _ = select.select([ self.port.fileno(), self.wakeupRead ], [], [], 1.0)
+                if self.wakeupRead in readable:
+                    os.read(self.wakeupRead, 512)
+                if not self.port.fileno() in readable:
+                    continue
+                try:
+                    packet = self.port.nextMessage(timeout = 0)
+                except (SerialProtocolViolation, SerialProtocolUnknownRegister):
+                    continue
+                except Exception:
+                    time.sleep(0.05)
+                    continue
+                if packet is not None:
+                    self.forwardPacket(packet)
+                continue
+
+            fut, address, param, frame = req
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                fut.set_result(self.transact(address, param, frame = frame))
+            except Exception as e:
+                fut.set_exception(e)
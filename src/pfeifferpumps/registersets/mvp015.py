@@ -0,0 +1,37 @@
+from pfeifferpumps.pfeifferproto import ACCESS_R, ACCESS_RW, ACCESS_W
+
+# Register set of the Pfeiffer MVP015 diaphragm pump. Imported on first use
+# through PfeifferProtocol.registers
+
+registers = {
+      2 : { "datatype" : 0,  "access" : ACCESS_RW, "display" : "Standby",     "designation" : "Standby",                                   "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 0   , "valueDescriptions" : { 0 : "off", 1 : "on" } },
+      9 : { "datatype" : 0,  "access" : ACCESS_W,  "display" : "ErrorAckn",   "designation" : "Fault acknowledgement",                     "unit" : None,    "min" : 1,    "max" : 1,       "persistent" : False, "default" : None, "valueDescriptions" : None },
+     10 : { "datatype" : 0,  "access" : ACCESS_RW, "display" : "PumpgStatn",  "designation" : "Pump",                                      "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 0   , "valueDescriptions" : { 0 : "off", 1 : "on" } },
+     19 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "Cfg DO2",     "designation" : "Configuration output DO2",                  "unit" : None,    "min" : 0,    "max" : 20,      "persistent" : True,  "default" : 5   , "valueDescriptions" : { 1 : "no error", 2 : "error", 5 : "target speed is reached", 6: "pump on", 9 : "always 0", 10 : "always 1", 11: "remote priority active" } },
+     24 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "Cfg DO1",     "designation" : "Configuration output DO1",                  "unit" : None,    "min" : 0,    "max" : 20,      "persistent" : True,  "default" : 1   , "valueDescriptions" : { 1 : "no error", 2 : "error", 5 : "target speed is reached", 6: "pump on", 9 : "always 0", 10 : "always 1", 11: "remote priority active" } },
+     26 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "SpdSetMode",  "designation" : "Speed setting mode",                        "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 0   , "valueDescriptions" : { 0 : "off", 1 : "on" } },
+     30 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "ValveMode",   "designation" : "Purge gas configuration",                   "unit" : None,    "min" : 0,    "max" : 2,       "persistent" : True,  "default" : 0   , "valueDescriptions" : { 0 : "auto", 1 : "closed", 2 : "open" } },
+     50 : { "datatype" : 0,  "access" : ACCESS_RW, "display" : "PurgeGas",    "designation" : "Purge gas",                                 "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 0   , "valueDescriptions" : { 0 : "off", 1 : "on" } },
+     60 : { "datatype" : 7,  "access" : ACCESS_RW, "display" : "CtrlViaInt",  "designation" : "Control via interface",                     "unit" : None,    "min" : 0,    "max" : 255,     "persistent" : True,  "default" : 1   , "valueDescriptions" : { 1 : "remote", 2 : "RS-485", 4 : "PV.can", 255 : "Unlock the interface selection" } },
+     61 : { "datatype" : 0,  "access" : ACCESS_RW, "display" : "IntSelLckd",  "designation" : "Interface selection locked",                "unit" : None,    "min" : 0,    "max" : 1,       "persistent" : True,  "default" : 0   , "valueDescriptions" : { 0 : "off", 1 : "on" } },
+
+    303 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "Error code",  "designation" : "Error code",                                "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
+    309 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "ActualSpd",   "designation" : "Actual speed",                              "unit" : "Hz",    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
+    310 : { "datatype" : 2,  "access" : ACCESS_R,  "display" : "DrvCurrent",  "designation" : "Drive current",                             "unit" : "A",     "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
+    311 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "OpHrsPump",   "designation" : "Pump operating hours",                      "unit" : "h",     "min" : None, "max" : None,    "persistent" : True,  "default" : None, "valueDescriptions" : None },
+    312 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "Fw version",  "designation" : "Software version of the interface board",   "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
+    313 : { "datatype" : 2,  "access" : ACCESS_R,  "display" : "DrvVoltage",  "designation" : "Supply voltage",                            "unit" : "V",     "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
+    314 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "OpHrsElec",   "designation" : "Electronic drive unit operating hours",     "unit" : "h",     "min" : None, "max" : None,    "persistent" : True,  "default" : None, "valueDescriptions" : None },
+    315 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "Nominal Spd", "designation" : "Nominal speed",                             "unit" : "Hz",    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
+    316 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "DrvPower",    "designation" : "Drive power",                               "unit" : "W",     "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
+    330 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "TempPmpBot",  "designation" : "Temperature of pump",                       "unit" : "C",     "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
+    349 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "ElecName",    "designation" : "Device designation",                        "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
+    398 : { "datatype" : 4,  "access" : ACCESS_R,  "display" : "HW version",  "designation" : "Hardware version of the interface board",   "unit" : None,    "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
+    354 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "ActualSpd",   "designation" : "Actual speed",                              "unit" : "rpm",   "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
+    399 : { "datatype" : 1,  "access" : ACCESS_R,  "display" : "NominalSpd",  "designation" : "Nominal speed",                             "unit" : "rpm",   "min" : None, "max" : None,    "persistent" : False, "default" : None, "valueDescriptions" : None },
+
+    707 : { "datatype" : 2,  "access" : ACCESS_RW, "display" : "SpdSVal",     "designation" : "Setpoint in speed setting mode",            "unit" : "%",     "min" : 30, "max" : 170,       "persistent" : True,  "default" : 75  , "valueDescriptions" : None },
+    717 : { "datatype" : 2,  "access" : ACCESS_RW, "display" : "StdbySVal",   "designation" : "Setpoint speed in standby mode",            "unit" : "%",     "min" : 30, "max" : 100,       "persistent" : True,  "default" : 66.7, "valueDescriptions" : None },
+    721 : { "datatype" : 1,  "access" : ACCESS_RW, "display" : "SlgVlvTime",  "designation" : "Setting for purge gas active",              "unit" : "s",     "min" : 5, "max" : 255,        "persistent" : True,  "default" : 60  , "valueDescriptions" : None },
+    797 : { "datatype" : 1,  "access" : ACCESS_RW, "display" : "RS485Adr",    "designation" : "RS485 interface address",                   "unit" : None,    "min" : 1, "max" : 255,        "persistent" : True,  "default" : 2   , "valueDescriptions" : None }
+}